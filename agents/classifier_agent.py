@@ -1,4 +1,7 @@
-from typing import AsyncGenerator
+import json
+import re
+from typing import AsyncGenerator, List
+from langchain.schema import Document
 from langchain_ollama import ChatOllama
 from utils.logger import get_logger
 from .base_agent import BaseAgent
@@ -49,33 +52,72 @@ class ClassifierAgent(BaseAgent):
 
     async def run(self, document) -> dict:
         logger.info(f"[RUN] starting classification for document with metadata: {document.metadata}")
+        prompt = self._prompt(document)
+        try:
+            classification = await self.llm.ainvoke(prompt)
+            logger.info(f"[RUN] classification done")
+            return {"type": "classification", "content": classification.content, "metadata": classification.response_metadata}
+        except Exception as e:
+            logger.error(f"[RUN] classification failed: {e}")
+            return {"type": "classification", "content": "Other", "metadata": {"allowed_labels": self.allowed_labels}}
+
+    async def stream(self, document) -> AsyncGenerator[dict, None]:
+        logger.info(f"[STREAM] starting classification for document with metadata: {document.metadata}")
+        prompt = self._prompt(document)
+        try:
+            async for chunk in self.llm.astream(prompt):
+                yield {"type": "classification", "content": chunk.content, "metadata": {"allowed_labels": self.allowed_labels}}
+            logger.info(f"[STREAM] classification done")
+        except Exception as e:
+            logger.error(f"[STREAM] classification failed: {e}")
+            yield {"type": "classification", "content": "Other", "metadata": {"allowed_labels": self.allowed_labels}}
+
+    async def classify_batch(self, texts: List[str], max_chars: int = 1000) -> List[str]:
+        """
+        Classify several documents with one prompt and return their labels in order.
+        Documents missing from, or unparseable in, the reply are classified one by one.
+        LLM errors propagate, so a bulk job stops (and can resume) instead of recording "Other".
+        """
+        if len(texts) == 1:
+            return [await self._classify_one(texts[0], max_chars)]
+        documents = "\n\n".join(f"[{i}]\n{text[:max_chars]}" for i, text in enumerate(texts, 1))
         prompt = f"""
         You are a research paper classifier.
         Task:
-        - Assign the MOST relevant discipline(s) from the list below.
+        - For EACH numbered document below, assign the MOST relevant discipline from the list.
         - If multiple apply, choose the most specific one.
         - If unsure, use "Other".
-        
+
         Allowed categories:
         {", ".join(self.allowed_labels)}
 
-        Output strictly in JSON format:
-        {{"discipline": "chosen category"}}
+        Output strictly as a JSON array with one object per document:
+        [{{"id": 1, "discipline": "chosen category"}}, ...]
 
-        Document (first 1000 chars shown):
-        {document.page_content[:1000]}
+        Documents (first {max_chars} chars of each shown):
+        {documents}
         """
+        reply = await self.llm.ainvoke(prompt)
+        labels = {}
         try:
-            classification = await self.llm.ainvoke(prompt)
-            logger.info(f"[RUN] classification done")
-            return {"type": "classification", "content": classification.content, "metadata": classification.response_metadata}
-        except Exception as e:
-            logger.error(f"[RUN] classification failed: {e}")
-            return {"type": "classification", "content": "Other", "metadata": {"allowed_labels": self.allowed_labels}}
+            match = re.search(r"\[.*\]", reply.content, re.DOTALL)
+            for item in json.loads(match.group(0)) if match else []:
+                if isinstance(item, dict) and str(item.get("id", "")).isdigit():
+                    labels[int(item["id"])] = self.normalize_label(item.get("discipline"))
+        except ValueError as e:
+            logger.warning(f"[BATCH] unparseable reply for {len(texts)} documents, falling back to one by one: {e}")
+        results = []
+        for i, text in enumerate(texts, 1):
+            results.append(labels[i] if i in labels else await self._classify_one(text, max_chars))
+        logger.info(f"[BATCH] classified {len(texts)} documents, {len(texts) - len(labels)} individually")
+        return results
 
-    async def stream(self, document) -> AsyncGenerator[dict, None]:
-        logger.info(f"[STREAM] starting classification for document with metadata: {document.metadata}")
-        prompt = f"""
+    async def _classify_one(self, text: str, max_chars: int) -> str:
+        reply = await self.llm.ainvoke(self._prompt(Document(page_content=text), max_chars))
+        return self.parse_label(reply.content)
+
+    def _prompt(self, document, max_chars: int = 1000) -> str:
+        return f"""
         You are a research paper classifier.
         Task:
         - Assign the MOST relevant discipline(s) from the list below.
@@ -88,13 +130,20 @@ class ClassifierAgent(BaseAgent):
         Output strictly in JSON format:
         {{"discipline": "chosen category"}}
 
-        Document (first 1000 chars shown):
-        {document.page_content[:1000]}
+        Document (first {max_chars} chars shown):
+        {document.page_content[:max_chars]}
         """
+
+    def parse_label(self, reply: str) -> str:
+        """Discipline from a `{"discipline": ...}` reply; labels outside `allowed_labels` become "Other"."""
+        match = re.search(r"\{.*?\}", reply or "", re.DOTALL)
         try:
-            async for chunk in self.llm.astream(prompt):
-                yield {"type": "classification", "content": chunk.content, "metadata": {"allowed_labels": self.allowed_labels}}
-            logger.info(f"[STREAM] classification done")
-        except Exception as e:
-            logger.error(f"[STREAM] classification failed: {e}")
-            yield {"type": "classification", "content": "Other", "metadata": {"allowed_labels": self.allowed_labels}}
\ No newline at end of file
+            return self.normalize_label(json.loads(match.group(0)).get("discipline") if match else reply)
+        except (ValueError, AttributeError):
+            return self.normalize_label(reply)
+
+    def normalize_label(self, label) -> str:
+        if isinstance(label, list):
+            label = label[0] if label else None
+        wanted = str(label or "").strip().strip('"').lower()
+        return next((allowed for allowed in self.allowed_labels if allowed.lower() == wanted), "Other")
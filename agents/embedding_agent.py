@@ -1,4 +1,6 @@
+import asyncio
 from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 from vector_store import VectorStoreBuilder
 
 from utils.logger import get_logger
@@ -8,26 +10,137 @@ from .base_agent import BaseAgent
 logger = get_logger(name="embedding_agent", log_file="logs/embedding_agent.log")
 
 class EmbeddingAgent(BaseAgent):
-    def __init__(self, persist_dir: str = "db_store", model_name: str = "nomic-embed-text"):
+    def __init__(self, persist_dir: str = "db_store", model_name: str = "nomic-embed-text",
+                 batch_size: int = 64, max_concurrency: int = 4,
+                 cache_path: Optional[str] = ".cache/embeddings.sqlite", cache_size: int = 200_000,
+                 backend: str = "chroma", local_options: Optional[dict] = None, lexical_index: bool = True,
+                 shards: int = 1, shard_by: str = "hash", client_options: Optional[dict] = None):
         super().__init__(
             name="EmbeddingAgent", 
             instructions="Embeds docs into vector database"
         )
-        self.builder = VectorStoreBuilder(persist_dir=Path(persist_dir), model_name=model_name)
+        self.builder = VectorStoreBuilder(
+            persist_dir=Path(persist_dir),
+            model_name=model_name,
+            batch_size=batch_size,
+            max_concurrency=max_concurrency,
+            cache_path=Path(cache_path) if cache_path else None,
+            cache_size=cache_size,
+            backend=backend,
+            local_options=local_options,
+            lexical_index=lexical_index,
+            shards=shards,
+            shard_by=shard_by,
+            client_options=client_options
+        )
     
-    async def run(self, documents: list, collection_name: str = "corpus_db", overwrite: bool = False):
+    async def run(self, documents: list, collection_name: str = "corpus_db", overwrite: bool = False,
+                  file_hashes: Optional[Dict[str, str]] = None):
         logger.info(f"starting embedding process for collection='{collection_name}' "
                     f"with {len(documents)} documents. Overwrite={overwrite}")
         try:
-            vector_store = self.builder.build_vectorstore(documents, collection_name, overwrite)
+            vector_store = self.builder.build_vectorstore(documents, collection_name, overwrite, file_hashes)
             logger.info(f"embedding complete: stored {len(documents)} documents into '{collection_name}'")
             return vector_store
         except Exception as e:
             logger.error(f"embedding failed for collection='{collection_name}': {e}")
             raise
     
+    async def run_stream(self, files: AsyncIterator[Tuple[str, List]], file_hashes: Dict[str, str],
+                         collection_name: str = "corpus_db", overwrite: bool = False,
+                         queue_size: int = 4, checkpoint_chunks: int = 2000) -> Dict[str, int]:
+        """
+        Embed (file name, chunks) pairs as they are parsed instead of collecting the whole corpus first.
+
+        Parsed files wait in a queue of `queue_size` files, so a slow embedder pauses parsing.
+        Chunks are written in groups of `batch_size * max_concurrency` whole files.
+        Every `checkpoint_chunks` chunks the store, lexical index and manifest are saved.
+        After a crash, an incremental build resumes from the last checkpoint.
+        """
+        logger.info(f"starting streaming build for collection='{collection_name}'. Overwrite={overwrite}")
+        builder = self.builder
+        vector_db, manifest, lexical, summary = await asyncio.to_thread(builder.open_stream, collection_name, overwrite, file_hashes)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, queue_size))
+
+        async def produce():
+            async for item in files:
+                await queue.put(item)
+            await queue.put(None)
+
+        producer = asyncio.create_task(produce())
+        group, group_chunks, since_checkpoint = [], 0, 0
+        try:
+            while True:
+                item = await self._next(queue, producer)
+                if item is not None:
+                    group.append(item)
+                    group_chunks += len(item[1])
+                if group and (item is None or group_chunks >= builder.batch_size * builder.max_concurrency):
+                    await asyncio.to_thread(builder.write_files, vector_db, group, file_hashes, manifest, lexical, summary)
+                    since_checkpoint += group_chunks
+                    group, group_chunks = [], 0
+                if since_checkpoint and (item is None or since_checkpoint >= checkpoint_chunks):
+                    await asyncio.to_thread(builder.checkpoint, collection_name, vector_db, manifest, lexical)
+                    summary["checkpoints"] += 1
+                    since_checkpoint = 0
+                if item is None:
+                    break
+        except BaseException:
+            # Keep the files finished so far; the group being written is retried on resume
+            producer.cancel()
+            await asyncio.to_thread(builder.checkpoint, collection_name, vector_db, manifest, lexical)
+            logger.error(f"streaming build for collection='{collection_name}' interrupted, checkpointed {len(manifest.files)} files")
+            raise
+        if not summary["checkpoints"]:
+            # Nothing new was written, but removed files may have been dropped
+            await asyncio.to_thread(builder.checkpoint, collection_name, vector_db, manifest, lexical)
+        logger.info(f"streaming build complete for '{collection_name}': {summary}")
+        return summary
+
+    @staticmethod
+    async def _next(queue: asyncio.Queue, producer: asyncio.Task):
+        """Next queued file, or the producer's exception if parsing failed while the queue was empty."""
+        getter = asyncio.ensure_future(queue.get())
+        await asyncio.wait({getter, producer}, return_when=asyncio.FIRST_COMPLETED)
+        if getter.done():
+            return getter.result()
+        getter.cancel()
+        producer.result()  # raises the producer's exception
+        return await queue.get()  # producer finished normally: its sentinel is queued
+
+    async def update(self, documents: list, file_hashes: Dict[str, str], collection_name: str = "corpus_db"):
+        """Embed only new or changed chunks and drop chunks of removed files."""
+        logger.info(f"starting incremental update for collection='{collection_name}' "
+                    f"with {len(documents)} documents from changed files")
+        try:
+            vector_store, summary = self.builder.sync_vectorstore(documents, file_hashes, collection_name)
+            logger.info(f"incremental update complete for '{collection_name}'")
+            return vector_store, summary
+        except Exception as e:
+            logger.error(f"incremental update failed for collection='{collection_name}': {e}")
+            raise
+
+    async def rebuild_shard(self, documents: list, shard: int, collection_name: str = "corpus_db",
+                            file_hashes: Optional[Dict[str, str]] = None):
+        """Re-embed a single shard of a sharded collection from the given chunks."""
+        logger.info(f"rebuilding shard {shard} of '{collection_name}' from {len(documents)} documents")
+        try:
+            return self.builder.rebuild_shard(documents, shard, collection_name, file_hashes)
+        except Exception as e:
+            logger.error(f"rebuilding shard {shard} of '{collection_name}' failed: {e}")
+            raise
+
+    async def stale_sources(self, file_hashes: Dict[str, str], collection_name: str = "corpus_db") -> list:
+        return self.builder.stale_sources(file_hashes, collection_name)
+
+    def collection_version(self, collection_name: str = "corpus_db") -> str:
+        return self.builder.collection_version(collection_name)
+
     async def load(self, collection_name: str = "corpus_db"):
         return self.builder.load_vectorstore(collection_name)
     
+    async def load_lexical_index(self, collection_name: str = "corpus_db"):
+        return self.builder.load_lexical_index(collection_name)
+
     async def list_collections(self):
         return self.builder.list_collections()
\ No newline at end of file
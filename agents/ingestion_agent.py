@@ -1,17 +1,63 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
 from pathlib import Path
-from typing import List
+from typing import AsyncGenerator, List, Optional, Tuple
 from langchain.schema import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import PyPDFLoader
 
+from utils.filters import parse_date
 from utils.logger import get_logger
 from .base_agent import BaseAgent
 
 
 logger = get_logger(name="ingestion_agent", log_file="logs/ingestion_agent.log")
 
+# Splitter owned by each pool worker, created once by the pool initializer
+_worker_splitter: Optional[RecursiveCharacterTextSplitter] = None
+
+def _make_splitter(chunk_size: int, chunk_overlap: int) -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=["\n\n", "\n", ".", " "]
+    )
+
+def _init_worker(chunk_size: int, chunk_overlap: int):
+    global _worker_splitter
+    _worker_splitter = _make_splitter(chunk_size, chunk_overlap)
+
+def _load_and_split(pdf_file: Path, splitter: Optional[RecursiveCharacterTextSplitter] = None) -> Tuple[str, List[Document], Optional[str]]:
+    """
+    Parse and chunk a single PDF.
+    Runs inside a pool worker, so errors are returned instead of raised.
+
+    :return: (file name, chunks, error message or None)
+    """
+    try:
+        loader = PyPDFLoader(str(pdf_file))
+        pages = loader.load()
+        docs = (splitter or _worker_splitter).split_documents(pages)
+        date = _document_date(pdf_file, pages)
+        for d in docs:
+            d.metadata["source"] = pdf_file.name
+            d.metadata["date"] = date
+        return pdf_file.name, docs, None
+    except Exception as e:
+        return pdf_file.name, [], str(e)
+
+def _document_date(pdf_file: Path, pages: List[Document]) -> int:
+    """YYYYMMDD from the PDF creation date, falling back to the file's modification time."""
+    raw = pages[0].metadata.get("creationdate") if pages else None
+    try:
+        parsed = parse_date(raw)
+    except ValueError:
+        parsed = None
+    return parsed or parse_date(datetime.fromtimestamp(pdf_file.stat().st_mtime))
+
 class IngestionAgent(BaseAgent):
-    def __init__(self, pdf_dir: Path, chunk_size: int = 1000, chunk_overlap: int = 200):
+    def __init__(self, pdf_dir: Path, chunk_size: int = 1000, chunk_overlap: int = 200, workers: int = 1):
         super().__init__(
             name="IngestionAgent",
             instructions="Load and preprocess PDF documents into chunks"
@@ -19,27 +65,65 @@ class IngestionAgent(BaseAgent):
         self.pdf_dir = pdf_dir
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
-        self.splitter = RecursiveCharacterTextSplitter(
-            chunk_size=self.chunk_size,
-            chunk_overlap=self.chunk_overlap,
-            separators=["\n\n", "\n", ".", " "]
-        )
+        self.workers = max(1, workers)
+        self.splitter = _make_splitter(self.chunk_size, self.chunk_overlap)
 
-    async def run(self) -> List[Document]:
+    async def run(self, files: Optional[List[Path]] = None) -> List[Document]:
         documents: List[Document] = []
-        logger.info(f"starting ingestion from {self.pdf_dir}")
-        
-        for pdf_file in self.pdf_dir.glob("*.pdf"):
-            try:
-                loader = PyPDFLoader(str(pdf_file))
-                pages = loader.load()
-                docs = self.splitter.split_documents(pages)
-                for d in docs:
-                    d.metadata["source"] = pdf_file.name
-                documents.extend(docs)
-                logger.info(f"loaded {len(docs)} chunks from {pdf_file.name}")
-            except Exception as e:
-                logger.error(f"failed to load {pdf_file.name}: {e}")
-        
+        logger.info(f"starting ingestion from {self.pdf_dir} with {self.workers} worker(s)")
+
+        async for _, docs in self.stream(files):
+            documents.extend(docs)
+
         logger.info(f"ingestion complete: {len(documents)} total chunks")
-        return documents
\ No newline at end of file
+        return documents
+
+    async def stream(self, files: Optional[List[Path]] = None) -> AsyncGenerator[Tuple[str, List[Document]], None]:
+        """
+        Yield (file name, chunks) as each PDF finishes.
+        With workers > 1 files are parsed in a process pool and yielded in completion order.
+        """
+        pdf_files = list(files) if files is not None else sorted(self.pdf_dir.glob("*.pdf"))
+        if self.workers == 1:
+            for pdf_file in pdf_files:
+                # In a thread, so consumers of the stream keep running while a file is parsed
+                name, docs, error = await asyncio.to_thread(_load_and_split, pdf_file, self.splitter)
+                if self._log_result(name, docs, error):
+                    yield name, docs
+            return
+
+        loop = asyncio.get_running_loop()
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(self.chunk_size, self.chunk_overlap)
+        ) as pool:
+            # Keep at most 2 files per worker in flight so finished chunks never pile up unconsumed
+            pending = {}
+            remaining = iter(pdf_files)
+            max_inflight = self.workers * 2
+            while True:
+                for pdf_file in remaining:
+                    future = loop.run_in_executor(pool, _load_and_split, pdf_file)
+                    pending[future] = pdf_file
+                    if len(pending) >= max_inflight:
+                        break
+                if not pending:
+                    break
+
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    pdf_file = pending.pop(future)
+                    try:
+                        name, docs, error = future.result()
+                    except Exception as e:
+                        name, docs, error = pdf_file.name, [], str(e)
+                    if self._log_result(name, docs, error):
+                        yield name, docs
+
+    def _log_result(self, name: str, docs: List[Document], error: Optional[str]) -> bool:
+        if error is not None:
+            logger.error(f"failed to load {name}: {error}")
+            return False
+        logger.info(f"loaded {len(docs)} chunks from {name}")
+        return True
@@ -1,67 +1,150 @@
-from typing import AsyncGenerator, Union, Dict, List, Any
+import time
+from typing import AsyncGenerator, Optional, Tuple, Union, Dict, List, Any
 
 from .base_agent import BaseAgent
-from .retriever_agent import RetrieverAgent
+from .retriever_agent import RetrieverAgent, RetrieverRunnable
 from .response_agent import ResponseAgent
 from .summarizer_agent import SummarizerAgent
 from .classifier_agent import ClassifierAgent
+from utils.filters import filter_key
+from utils.semantic_cache import SemanticAnswerCache
 from utils.logger import get_logger
 
 
 logger = get_logger(name="orchestrator_agent", log_file="logs/orchestrator_agent.log")
 
 class OrchetratorAgent(BaseAgent):
-    def __init__(self, vector_db, llm):
+    def __init__(self, vector_db, llm, retriever=None, retrieval_cache=None, answer_cache: SemanticAnswerCache = None,
+                 reranker=None, rerank_candidates: int = 20, context_packer=None, summary_concurrency: int = 4):
         super().__init__(
             name="OrchestratorAgent", 
             instructions="Directs queries to the right agents"
         )
-        self.retriever_agent = RetrieverAgent(vector_db, llm)
-        self.rag_agent = ResponseAgent(llm, self.retriever_agent.retriever)
-        self.summarizer_agent = SummarizerAgent(llm)
+        self.retriever_agent = RetrieverAgent(
+            vector_db, llm, retriever=retriever, cache=retrieval_cache,
+            reranker=reranker, candidate_k=rerank_candidates
+        )
+        # Context goes through RetrieverAgent.run so RAG answers share its top-k cut and cache
+        self.rag_agent = ResponseAgent(llm, RetrieverRunnable(self.retriever_agent, context_packer))
+        self.summarizer_agent = SummarizerAgent(llm, vector_db=vector_db, max_concurrency=summary_concurrency)
         self.classifier_agent = ClassifierAgent(llm)
+        self.answer_cache = answer_cache
         
         logger.info("OrchestratorAgent initialized with Retriever, RAG, Summarizer, and Classifier agents.")
 
-    async def run(self, query: str):
+    async def cached_answer(self, query: str, use_cache: bool = True, filter: Optional[dict] = None,
+                            history: str = "") -> Tuple[Optional[dict], Any]:
+        """
+        Answer cache lookup alone, so callers can skip admission control on a hit.
+        Returns the cached answer (or None) and the query's cache vector, to pass on to `run`/`stream`.
+        """
+        if not use_cache or history:
+            return None, None
+        agent, _ = self._route(query=query)
+        cache_vector = await self._cache_vector(query)
+        if cache_vector is None:
+            return None, None
+        cached = self.answer_cache.lookup(cache_vector, self._cache_route(agent, filter))
+        if cached is None:
+            return None, cache_vector
+        return {**cached, "metadata": {**cached.get("metadata", {}), "cached": True}}, cache_vector
+
+    async def run(self, query: str, use_cache: bool = True, filter: Optional[dict] = None, history: str = "",
+                  cache_vector=None):
+        """
+        `filter` is a Chroma-style `where` clause restricting retrieval to matching chunks.
+        `history` is the session's rendered ConversationMemory; answers that depend on it are not cached.
+        `cache_vector` comes from an earlier `cached_answer` miss, which is then not looked up again.
+        """
         logger.info(f"[RUN] received query: '{query}'")
+        use_cache = use_cache and not history
         try:
             agent, doc_needed = self._route(query=query)
+            route = self._cache_route(agent, filter)
+            if cache_vector is None:
+                cached, cache_vector = await self.cached_answer(query, use_cache, filter)
+                if cached is not None:
+                    return cached
+
+            # Retrieved once here; the RAG chain gets the documents instead of retrieving again
+            docs = await self.retriever_agent.run(query=query, filter=filter)
             if doc_needed:
-                docs = await self.retriever_agent.run(query=query)
                 if not docs:
                     logger.warning(f"[RUN] no documents retrieved for {agent.__class__.__name__}")
                     return f"no documents available to {agent.name.lower()}"
                 result = await agent.run(docs[0])
             else:
-                result = await agent.run(query)
+                result = await agent.run(query, docs=docs, history=history)
                 
             logger.info(f"[RUN] {agent.name} completed successfully")
+            if cache_vector is not None and self._cacheable(result):
+                self.answer_cache.store(cache_vector, query, route, result)
             return result
         except Exception as e:
             logger.error(f"[RUN] error while processing query '{query}': {e}", exc_info=True)
             return f"an error occurred while handling the query: {e}"
     
-    async def stream(self, query: str) -> AsyncGenerator[Union[str, Dict[str, str], List[Any]], None]:
+    async def stream(self, query: str, use_cache: bool = True, filter: Optional[dict] = None,
+                     history: str = "", cache_vector=None) -> AsyncGenerator[Union[str, Dict[str, str], List[Any]], None]:
         logger.info(f"[STREAM] received query: '{query}'")
+        start = time.perf_counter()
+        use_cache = use_cache and not history
         try:
             agent, doc_needed = self._route(query=query)
+            route = self._cache_route(agent, filter)
+            if cache_vector is None:
+                cached, cache_vector = await self.cached_answer(query, use_cache, filter)
+                if cached is not None:
+                    # Replay the whole cached answer as a single chunk
+                    yield cached
+                    return
+
+            chunks = []
+            docs = await self.retriever_agent.run(query=query, filter=filter)
             if doc_needed:
-                docs = await self.retriever_agent.run(query=query)
                 if not docs:
                     logger.warning(f"[STREAM] no documents retrieved for {agent.__class__.__name__}")
                     yield f"no documents available to {agent.name.lower()}"
                     return
-                async for chunk in agent.stream(docs[0]):
-                    yield chunk
+                stream = agent.stream(docs[0])
             else:
-                async for chunk in agent.stream(query):
+                stream = agent.stream(query, docs=docs, history=history)
+            async for chunk in stream:
+                if isinstance(chunk, dict) and chunk.get("type") == "progress":
                     yield chunk
+                    continue
+                if not chunks:
+                    self.retriever_agent.timings.record("first_token", time.perf_counter() - start)
+                chunks.append(chunk)
+                yield chunk
             logger.info(f"[STREAM] {agent.name} completed successfully")
+
+            if cache_vector is not None and chunks and all(self._cacheable(c) for c in chunks):
+                result = {"type": chunks[0].get("type"), "content": "".join(c.get("content") or "" for c in chunks), "metadata": {}}
+                self.answer_cache.store(cache_vector, query, route, result)
         except Exception as e:
             logger.error(f"[STREAM]] error processing query '{query}': {e}", exc_info=True)
             yield f"an error occurred handling the query: {e}"
 
+    async def _cache_vector(self, query: str):
+        """Query embedding for the answer cache, or None when caching is off or embedding fails."""
+        if self.answer_cache is None:
+            return None
+        try:
+            return await self.answer_cache.embed(query)
+        except Exception as e:
+            logger.warning(f"answer cache disabled for this query, embedding failed: {e}")
+            return None
+
+    @staticmethod
+    def _cache_route(agent, filter: Optional[dict]) -> str:
+        # Answers computed under different filters must never be served for one another
+        return f"{agent.name}{filter_key(filter)}"
+
+    @staticmethod
+    def _cacheable(result) -> bool:
+        return isinstance(result, dict) and not str(result.get("content", "")).startswith("error:")
+
     def _route(self, query: str):
         """
         Determines which agent to use based on the query.
@@ -1,4 +1,4 @@
-from typing import AsyncGenerator
+from typing import AsyncGenerator, List, Optional
 from langchain.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
@@ -23,24 +23,28 @@ class ResponseAgent(BaseAgent):
             Context:
             {context}
 
+            {history}
             Question:
             {question}
 
             Answer clearly and concisely."""
         )
 
-        self.chain = (
-            {"context": self.retriever, "question": RunnablePassthrough()}
-            | prompt
-            | self.llm
-            | StrOutputParser()
-        )
+        self.answer_chain = prompt | self.llm | StrOutputParser()
+        self.chain = {"context": self.retriever, "question": RunnablePassthrough(), "history": lambda _: ""} | self.answer_chain
         logger.info("ResponseAgent initialized with provided LLM and retriever")
 
-    async def run(self, query: str):
+    async def run(self, query: str, filter: Optional[dict] = None, docs: Optional[List] = None, history: str = ""):
+        """
+        With `docs` (already retrieved by the caller) the chain's own retrieval step is skipped.
+        `history` is the rendered conversation memory of the session, used only together with `docs`.
+        """
         logger.info(f"[RUN] received query: '{query}'")
         try:
-            result = await self.chain.ainvoke(query)
+            if docs is not None:
+                result = await self.answer_chain.ainvoke(self._inputs(query, docs, history))
+            else:
+                result = await self.chain.ainvoke(query, config=self._config(filter))
             logger.info(f"[RUN] successfully generated a response")
             return {
                 "type": "response",
@@ -51,12 +55,23 @@ class ResponseAgent(BaseAgent):
             logger.error(f"[RUN] failed on query '{query}': {e}", exc_info=True)
             return {"type": "response", "content": "error: failed to respond", "metadata": {}}
     
-    async def stream(self, query: str) -> AsyncGenerator[dict, None]:
+    async def stream(self, query: str, filter: Optional[dict] = None, docs: Optional[List] = None,
+                     history: str = "") -> AsyncGenerator[dict, None]:
         logger.info(f"[STREAM] received query: '{query}'")
         try:
-            async for chunk in self.chain.astream(query):
+            chunks = self.answer_chain.astream(self._inputs(query, docs, history)) if docs is not None \
+                else self.chain.astream(query, config=self._config(filter))
+            async for chunk in chunks:
                 yield {"type": "response", "content": chunk, "metadata": {}}
             logger.info(f"[STREAM] successfully generated a response")
         except Exception as e:
             logger.error(f"[STREAM] failed on query '{query}': {e}", exc_info=True)
             yield {"type": "response", "content": "error: failed to respond", "metadata": {}}
+
+    def _inputs(self, query: str, docs: List, history: str = "") -> dict:
+        return {"context": self.retriever.pack(docs), "question": query, "history": history}
+
+    @staticmethod
+    def _config(filter: Optional[dict]) -> Optional[dict]:
+        # The retriever step reads the metadata filter from the run config
+        return {"configurable": {"filter": filter}} if filter else None
@@ -1,8 +1,12 @@
 import asyncio
-from typing import Any
+from typing import Any, Optional
 from langchain_core.runnables import Runnable
 
+from utils.cache import RetrievalCache
+from utils.context_packer import ContextPacker
+from utils.reranker import Reranker
 from utils.retriever_factory import make_retriever
+from utils.timing import StageTimings
 from utils.logger import get_logger
 from .base_agent import BaseAgent
 
@@ -10,41 +14,85 @@ from .base_agent import BaseAgent
 logger = get_logger(name="retriever_agent", log_file="logs/retriever_agent.log")
 
 class RetrieverAgent(BaseAgent):
-    def __init__(self, vector_db, llm):
+    def __init__(self, vector_db, llm, retriever=None, cache: Optional[RetrievalCache] = None,
+                 reranker: Optional[Reranker] = None, candidate_k: int = 20):
         super().__init__(
             name="RetrieverAgent", 
             instructions="Retrieve relevant docs"
         )
-        self.retriever = make_retriever(vector_db=vector_db, llm=llm)
+        self.retriever = retriever or make_retriever(vector_db=vector_db, llm=llm)
+        self.cache = cache
+        self.reranker = reranker
+        self.candidate_k = candidate_k
+        self.timings = StageTimings()
+        if getattr(self.retriever, "timings", False) is None:
+            # Retrievers with internal stages (expansion, per-query searches) report them alongside "retrieve"
+            self.retriever.timings = self.timings
         logger.info("RetrieverAgent initialized with provided vector db and language model")
     
-    async def run(self, query: str, k: int = 5) -> list[Any]:
+    async def run(self, query: str, k: int = 5, timings: Optional[dict] = None, filter: Optional[dict] = None) -> list[Any]:
+        """
+        Retrieve, optionally rerank, and return the top-k documents.
+        `filter` is a Chroma-style `where` clause restricting the search to matching chunks.
+        Per-stage durations in ms are written to `timings` when given and aggregated in `self.timings`.
+        """
         logger.info(f"RetrieverAgent received query: '{query}' with top_k={k}")
+        timings = {} if timings is None else timings
+        cache_key = self.cache.key(query, k, filter) if self.cache is not None else None
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"retrieval cache hit for query '{query}'")
+                return list(cached)
         try:
-            docs = self.retriever.get_relevant_documents(query)
+            # Async path: query expansion and vector search never block the event loop.
+            # Retrievers without a native async implementation are run in the default thread pool.
+            with self.timings.time("retrieve", timings):
+                # Only pass `filter` when set, so custom retrievers without the kwarg keep working
+                docs = await (self.retriever.ainvoke(query, filter=filter) if filter else self.retriever.ainvoke(query))
             logger.info(f"retrieved {len(docs)} documents for query '{query}'")
 
-            top_docs = docs[:k]
+            if self.reranker is not None:
+                # Scoring is CPU-bound, keep it off the event loop
+                with self.timings.time("rerank", timings):
+                    top_docs = await asyncio.to_thread(self.reranker.rerank, query, docs[:max(k, self.candidate_k)], k)
+            else:
+                top_docs = docs[:k]
+            logger.info(f"retrieval timings for query '{query}': {timings}")
             for i, doc in enumerate(top_docs, 1):
                 snippet = doc.page_content[:100].replace("\n", " ") + "..."
                 logger.debug(f"doc {i}: {snippet} | metadata: {doc.metadata}")
             
+            if cache_key is not None and top_docs:
+                self.cache.set(cache_key, list(top_docs))
             return top_docs
         except Exception as e:
             logger.error(f"failed to retrieve documents for query '{query}': {e}")
             return []
 
 class RetrieverRunnable(Runnable):
-    def __init__(self, retriever_agent: RetrieverAgent):
+    def __init__(self, retriever_agent: RetrieverAgent, packer: Optional[ContextPacker] = None):
         self.retriever_agent = retriever_agent
+        self.packer = packer or ContextPacker()
 
     def invoke(self, input, config=None):
         # Call the retriever's run method (synchronously)
-        docs = asyncio.run(self.retriever_agent.run(input))
-        # Convert to string context
-        return "\n\n".join([d.page_content for d in docs])
+        docs = asyncio.run(self.retriever_agent.run(input, filter=self._filter(config)))
+        return self.pack(docs)
     
     async def ainvoke(self, input, config=None):
         """Optional async version if needed by chain"""
-        docs = await self.retriever_agent.run(input)
-        return "\n\n".join([d.page_content for d in docs])
+        docs = await self.retriever_agent.run(input, filter=self._filter(config))
+        return self.pack(docs)
+
+    @staticmethod
+    def _filter(config) -> Optional[dict]:
+        # Metadata filter passed by the caller as config={"configurable": {"filter": ...}}
+        return ((config or {}).get("configurable") or {}).get("filter")
+
+    def pack(self, docs: list) -> str:
+        # Convert to a deduplicated, token-budgeted context string
+        context, stats = self.packer.pack(docs)
+        logger.info(f"prefill context: {stats['packed_tokens']} tokens from {stats['chunks']} chunks "
+                    f"(unpacked {stats['naive_tokens']}), {stats['passages']} passages")
+        return context
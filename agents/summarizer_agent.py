@@ -1,51 +1,192 @@
+import asyncio
+import hashlib
+from typing import AsyncGenerator, List, Optional
+from langchain.schema import Document
 from langchain_ollama import ChatOllama
 
+from utils.cache import TTLCache
 from utils.logger import get_logger
 from .base_agent import BaseAgent
 
 
 logger = get_logger(name="summarizer_agent", log_file="logs/summarizer_agent.log")
 
+MAP_PROMPT = """
+        You are a research assistant. Summarize the following section of a longer document,
+        keeping its key claims, methods and results:
+
+        Section:
+        {text}
+
+        Provide the summary in clear, concise language.
+        """
+
+REDUCE_PROMPT = """
+        You are a research assistant. The following are summaries of consecutive sections of one document.
+        Combine them into a single concise summary, highlighting key insights:
+
+        Section summaries:
+        {text}
+
+        Provide the summary in clear, concise language.
+        """
+
 class SummarizerAgent(BaseAgent):
-    def __init__(self, llm: ChatOllama):
+    """
+    Summarizes a single chunk, or, given a vector store, the whole source file the chunk belongs to.
+
+    Whole-document mode is map-reduce: chunks are grouped into sections of about `section_chars`,
+    sections are summarized concurrently (at most `max_concurrency` LLM calls in flight),
+    and the section summaries are merged `fan_in` at a time until one summary is left.
+    Section and merge summaries are cached by input text, so re-summarizing a source only pays for the final pass.
+    """
+    def __init__(self, llm: ChatOllama, vector_db=None, max_concurrency: int = 4, section_chars: int = 4000,
+                 fan_in: int = 4, cache: Optional[TTLCache] = None):
         super().__init__(
             name="SummarizerAgent",
             instructions="Summarizes research papers concisely"
         )
         self.llm = llm
+        self.vector_db = vector_db
+        self.section_chars = section_chars
+        self.fan_in = max(2, fan_in)
+        self.cache = cache if cache is not None else TTLCache(max_size=4096, ttl=None)
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency))
 
     async def run(self, document, max_chars: int = 2000):
         logger.info(f"[RUN] starting summarization for document")
-        prompt = f"""
-        You are a research assistant. Summarize the following paper concisely, highlighting key insights:
-
-        Document (up to {max_chars} characters):
-        {document.page_content[:max_chars]}
-
-        Provide the summary in clear, concise language.
-        """
         try:
-            summary = await self.llm.ainvoke(prompt)
+            chunks = await self._source_chunks(document)
+            if len(chunks) > 1:
+                summaries = await self._reduce_to_final(chunks)
+                content = await self._summarize(REDUCE_PROMPT, "\n\n".join(summaries)) if len(summaries) > 1 else summaries[0]
+                logger.info(f"[RUN] summarized {len(chunks)} chunks of '{document.metadata.get('source')}'")
+                return {"type": "summary", "content": content, "metadata": {"chunks": len(chunks)}}
+
+            summary = await self.llm.ainvoke(self._single_prompt(document, max_chars))
             logger.info("[RUN] summarization completed successfully")
             return {"type": "summary", "content": summary.content, "metadata": summary.response_metadata}
         except Exception as e:
             logger.error(f"[RUN] summarization failed: {e}")
             return {"type": "summary", "content": "error: summarization failed", "metadata": {}}
 
-    async def stream(self, document, max_chars: int = 2000):
+    async def stream(self, document, max_chars: int = 2000) -> AsyncGenerator[dict, None]:
+        """Yields `progress` frames while sections are summarized, then the final summary token by token."""
         logger.info(f"[STREAM] starting summarization for document")
-        prompt = f"""
-        You are a research assistant. Summarize the following paper concisely, highlighting key insights:
-
-        Document (up to {max_chars} characters):
-        {document.page_content[:max_chars]}
-
-        Provide the summary in clear, concise language.
-        """
         try:
+            chunks = await self._source_chunks(document)
+            if len(chunks) > 1:
+                progress: asyncio.Queue = asyncio.Queue()
+                task = asyncio.create_task(self._reduce_to_final(chunks, progress))
+                getter = None
+                try:
+                    while not (task.done() and progress.empty()):
+                        getter = asyncio.ensure_future(progress.get())
+                        await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+                        if getter.done():
+                            yield {"type": "progress", "content": "", "metadata": getter.result()}
+                        else:
+                            getter.cancel()
+                    summaries = task.result()
+                finally:
+                    # The consumer may stop early (client disconnected): stop the LLM calls still in flight
+                    task.cancel()
+                    if getter is not None:
+                        getter.cancel()
+                if len(summaries) == 1:
+                    yield {"type": "summary", "content": summaries[0], "metadata": {"chunks": len(chunks)}}
+                    return
+                prompt = REDUCE_PROMPT.format(text="\n\n".join(summaries))
+            else:
+                prompt = self._single_prompt(document, max_chars)
+
+            parts = []
             async for chunk in self.llm.astream(prompt):
+                parts.append(chunk.content)
                 yield {"type": "summary", "content": chunk.content, "metadata": chunk.response_metadata}
+            if len(chunks) > 1:
+                self.cache.set(self._cache_key(prompt), "".join(parts))
             logger.info("[STREAM] summarization completed successfully")
         except Exception as e:
             logger.error(f"[STREAM] summarization failed: {e}")
             yield {"type": "summary", "content": "error: summarization failed", "metadata": {}}
+
+    async def _reduce_to_final(self, chunks: List[Document], progress: Optional[asyncio.Queue] = None) -> List[str]:
+        """
+        Map the sections and merge their summaries until at most `fan_in` remain for the final pass.
+        Returns a single summary when the final pass is already cached.
+        """
+        level, texts = "map", self._sections(chunks)
+        prompt = MAP_PROMPT
+        while True:
+            summaries = await self._summarize_all(prompt, texts, level, progress)
+            if len(summaries) <= self.fan_in:
+                cached = self.cache.get(self._cache_key(REDUCE_PROMPT.format(text="\n\n".join(summaries))))
+                return [cached] if cached is not None else summaries
+            level, prompt = "reduce", REDUCE_PROMPT
+            texts = ["\n\n".join(summaries[i:i + self.fan_in]) for i in range(0, len(summaries), self.fan_in)]
+
+    async def _summarize_all(self, prompt: str, texts: List[str], level: str, progress: Optional[asyncio.Queue]) -> List[str]:
+        done = 0
+
+        async def summarize(text: str) -> str:
+            nonlocal done
+            summary = await self._summarize(prompt, text)
+            done += 1
+            if progress is not None:
+                progress.put_nowait({"stage": level, "done": done, "total": len(texts)})
+            return summary
+
+        # gather keeps input order, so summaries stay in document order
+        return list(await asyncio.gather(*(summarize(text) for text in texts)))
+
+    async def _summarize(self, prompt: str, text: str) -> str:
+        filled = prompt.format(text=text)
+        key = self._cache_key(filled)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        async with self._semaphore:
+            summary = (await self.llm.ainvoke(filled)).content
+        self.cache.set(key, summary)
+        return summary
+
+    async def _source_chunks(self, document) -> List[Document]:
+        """All chunks of the document's source file in reading order, or [] without a vector store."""
+        source = document.metadata.get("source") if document is not None else None
+        if self.vector_db is None or not source:
+            return []
+        result = await asyncio.to_thread(self.vector_db.get, where={"source": source}, include=["documents", "metadatas"])
+        chunks = [Document(page_content=text, metadata=meta or {}) for text, meta in zip(result["documents"], result["metadatas"])]
+        # The store's row order is not reading order (concurrent batch writes, shards), so sort by position;
+        # corpus chunks carry their index as `chunk`, PDF chunks their `page`
+        chunks.sort(key=lambda doc: (doc.metadata.get("page", 0), doc.metadata.get("chunk", 0)))
+        logger.info(f"gathered {len(chunks)} chunks of '{source}'")
+        return chunks
+
+    def _sections(self, chunks: List[Document]) -> List[str]:
+        sections, current, size = [], [], 0
+        for chunk in chunks:
+            if current and size + len(chunk.page_content) > self.section_chars:
+                sections.append("\n".join(current))
+                current, size = [], 0
+            current.append(chunk.page_content)
+            size += len(chunk.page_content)
+        if current:
+            sections.append("\n".join(current))
+        return sections
+
+    @staticmethod
+    def _single_prompt(document, max_chars: int) -> str:
+        return f"""
+        You are a research assistant. Summarize the following paper concisely, highlighting key insights:
+
+        Document (up to {max_chars} characters):
+        {document.page_content[:max_chars]}
+
+        Provide the summary in clear, concise language.
+        """
+
+    def _cache_key(self, prompt: str) -> tuple:
+        model = getattr(self.llm, "model", None) or type(self.llm).__name__
+        return (model, hashlib.sha256(prompt.encode("utf-8")).hexdigest())
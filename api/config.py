@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -5,6 +6,41 @@ class Settings(BaseSettings):
     PERSIST_DIR: str = "db_store"
     EMBEDDING_MODEL_NAME: str = "nomic-embed-text"
     COLLECTION_NAME: str = "corpus_db"
+    VECTOR_BACKEND: str = "chroma"
+    LOCAL_IVF_THRESHOLD: int = 50_000
+    LOCAL_NPROBE: int = 8
+    LOCAL_DTYPE: str = "float32"
+    LOCAL_RESCORE: bool = True
+    EMBEDDING_CACHE_PATH: str = ".cache/embeddings.sqlite"
+    EMBEDDING_CACHE_SIZE: int = 200_000
+    RETRIEVAL_MODE: str = "multi_query"  # multi_query | hybrid
+    RETRIEVAL_SEARCH_K: int = 10
+    HYBRID_ALPHA: float = 0.5
+    HYBRID_PREFILTER: Optional[int] = None
+    RETRIEVAL_LATENCY_BUDGET: Optional[float] = None
+    RERANKER: str = "none"  # none | lexical | cross-encoder
+    RERANK_MODEL: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    RERANK_CANDIDATES: int = 20
+    RERANK_TOKEN_BUDGET: Optional[int] = None
+    RERANK_LATENCY_BUDGET: Optional[float] = None
+    CONTEXT_TOKEN_BUDGET: Optional[int] = 2000
+    SUMMARY_MAX_CONCURRENCY: int = 4
+    CLASSIFY_MAX_CONCURRENCY: int = 4
+    RETRIEVAL_CACHE_SIZE: int = 1024
+    RETRIEVAL_CACHE_TTL: Optional[float] = 300
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_THRESHOLD: float = 0.92
+    ANSWER_CACHE_SIZE: int = 512
+    ANSWER_CACHE_TTL: Optional[float] = 3600
+    OLLAMA_POOL_SIZE: int = 32
+    OLLAMA_TIMEOUT: Optional[float] = 120
+    LLM_SINGLE_FLIGHT: bool = True
+    LLM_MAX_CONCURRENCY: int = 2
+    LLM_MAX_QUEUE: int = 32
+    LLM_QUEUE_TIMEOUT: Optional[float] = 10
+    SESSION_TOKEN_BUDGET: int = 800
+    SESSION_MAX: int = 5000
+    SESSION_TTL: Optional[float] = 1800
     HOST: str = "0.0.0.0"
     PORT: int = 8080
     ALLOWED_ORIGINS: list = [
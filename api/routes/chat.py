@@ -1,18 +1,27 @@
+from contextlib import nullcontext
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 import json, uuid
 
 from agents.orchestrator_agent import OrchetratorAgent
+from api.scheduler import Overloaded, RequestScheduler
+from utils.conversation_memory import SessionStore
+from utils.filters import where_from_payload
 from utils.logger import get_logger
 
 logger = get_logger(name="ws_server", log_file="logs/ws_server.log")
 
 router = APIRouter()
 orchestrator: OrchetratorAgent = None
+scheduler: RequestScheduler = None
+sessions: SessionStore = None
 
 @router.websocket("/ws")
 async def ws_endpoint(ws: WebSocket):
     await ws.accept()
-    session_id = str(uuid.uuid4())
+    # Session ids are issued here; /ws?session_id=... continues one issued earlier (e.g. after a reconnect)
+    requested = ws.query_params.get("session_id")
+    session_id = sessions.open(requested) if sessions is not None else str(uuid.uuid4())
+    await ws.send_text(json.dumps({"type": "session", "session_id": session_id, "resumed": session_id == requested}))
     logger.info(f"[WS SERVER] New WebSocket session {session_id} connected")
 
     try:
@@ -20,21 +29,44 @@ async def ws_endpoint(ws: WebSocket):
             msg = await ws.receive_text()
             data = json.loads(msg)
             query = data.get("content", "")
+            use_cache = data.get("cache", True)
         
             logger.info(f"[WS SERVER] [{session_id}] received query '{query}'")
 
             try:
                 assert orchestrator is not None
-                async for chunk in orchestrator.stream(query):
-                    content = chunk.get("content") if isinstance(chunk, dict) else str(chunk)
-                    await ws.send_text(json.dumps({
-                        "type": "chunk", 
-                        "content": content
-                    }))
-                await ws.send_text(json.dumps({"type": "done"}))
+                # Optional {"filter": {"source": ..., "page": ..., "discipline": ..., "date_from": ..., "date_to": ...}}
+                where = where_from_payload(data.get("filter"))
+                memory = sessions.get(session_id) if sessions is not None else None
+                answer = []
+                history = memory.render() if memory is not None else ""
+                # Cache hits are answered without waiting for an LLM slot
+                cached, cache_vector = await orchestrator.cached_answer(query, use_cache=use_cache, filter=where, history=history)
+                async with scheduler.slot("interactive") if scheduler is not None and cached is None else nullcontext():
+                    stream = _replay(cached) if cached is not None else orchestrator.stream(
+                        query, use_cache=use_cache, filter=where, history=history, cache_vector=cache_vector
+                    )
+                    async for chunk in stream:
+                        if isinstance(chunk, dict) and chunk.get("type") == "progress":
+                            await ws.send_text(json.dumps({"type": "progress", "metadata": chunk.get("metadata", {})}))
+                            continue
+                        content = chunk.get("content") if isinstance(chunk, dict) else str(chunk)
+                        answer.append(content or "")
+                        await ws.send_text(json.dumps({
+                            "type": "chunk", 
+                            "content": content
+                        }))
+                    await ws.send_text(json.dumps({"type": "done"}))
+                    if memory is not None:
+                        await memory.add_turn(query, "".join(answer))
+            except Overloaded as e:
+                await ws.send_text(json.dumps({"type": "error", "error": str(e), "status": 429, "retry_after": e.retry_after}))
             except Exception as e:
                 await ws.send_text(json.dumps({"type": "error", "error": str(e)}))
     except Exception as e:
         logger.error(f"[WS SERVER] Unexpected error in session {session_id}: {e}")
     finally:
         logger.info(f"[WS SERVER] [{session_id}] connection closed")
+
+async def _replay(answer: dict):
+    yield answer
@@ -0,0 +1,42 @@
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, HTTPException
+
+from utils.classification_job import ClassificationJob
+from utils.logger import get_logger
+
+logger = get_logger(name="ws_server", log_file="logs/ws_server.log")
+
+router = APIRouter()
+job: ClassificationJob = None
+vector_db = None
+task: Optional[asyncio.Task] = None
+
+@router.post("/classify")
+async def start_classification(per_source: bool = True, batch_size: int = 8, restart: bool = False):
+    """Start labelling the collection in the background; poll GET /classify for progress."""
+    global task
+    if job is None or vector_db is None:
+        raise HTTPException(status_code=500, detail="Classification job not initialized")
+    # The lock file is shared by every server worker, so only one of them runs the job
+    if not job.try_lock():
+        raise HTTPException(status_code=409, detail="Classification job already running")
+
+    job.per_source = per_source
+    job.batch_size = max(1, batch_size)
+    task = asyncio.create_task(_run(restart))
+    return {"status": "started", "checkpoint": str(job.checkpoint_path)}
+
+@router.get("/classify")
+async def classification_status():
+    if job is None:
+        raise HTTPException(status_code=500, detail="Classification job not initialized")
+    return job.status()
+
+async def _run(restart: bool):
+    try:
+        await job.run(vector_db, restart=restart)
+    except Exception as e:
+        logger.error(f"[CLASSIFY] classification job failed: {e}", exc_info=True)
+    finally:
+        job.unlock()
@@ -0,0 +1,33 @@
+from fastapi import APIRouter
+
+from api.scheduler import RequestScheduler
+from utils.cache import RetrievalCache
+from utils.context_packer import ContextPacker
+from utils.conversation_memory import SessionStore
+from utils.embedding_cache import EmbeddingCache
+from utils.semantic_cache import SemanticAnswerCache
+from utils.timing import StageTimings
+
+router = APIRouter()
+retrieval_cache: RetrievalCache = None
+embedding_cache: EmbeddingCache = None
+answer_cache: SemanticAnswerCache = None
+stage_timings: StageTimings = None
+context_packer: ContextPacker = None
+# Shared LLM / embedding clients that report single-flight stats, by name
+single_flight: dict = None
+scheduler: RequestScheduler = None
+sessions: SessionStore = None
+
+@router.get("/metrics")
+async def metrics():
+    return {
+        "retrieval_cache": retrieval_cache.stats() if retrieval_cache is not None else None,
+        "embedding_cache": embedding_cache.stats() if embedding_cache is not None else None,
+        "answer_cache": answer_cache.stats() if answer_cache is not None else None,
+        "stage_timings": stage_timings.stats() if stage_timings is not None else None,
+        "context": context_packer.stats() if context_packer is not None else None,
+        "scheduler": scheduler.stats() if scheduler is not None else None,
+        "sessions": sessions.stats() if sessions is not None else None,
+        "single_flight": {name: client.stats() for name, client in single_flight.items()} if single_flight else None,
+    }
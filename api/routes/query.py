@@ -1,20 +1,38 @@
-from fastapi import APIRouter, HTTPException
+from contextlib import nullcontext
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Query
 
 from agents.orchestrator_agent import OrchetratorAgent
+from api.scheduler import Overloaded, RequestScheduler
+from utils.filters import build_where
 from utils.logger import get_logger
 
 logger = get_logger(name="ws_server", log_file="logs/ws_server.log")
 
 router = APIRouter()
 orchestrator: OrchetratorAgent = None
+scheduler: RequestScheduler = None
 
 @router.get("/query")
-async def single_query(q: str):
+async def single_query(q: str, cache: bool = True, source: Optional[List[str]] = Query(None),
+                       page: Optional[List[int]] = Query(None), discipline: Optional[List[str]] = Query(None),
+                       date_from: Optional[str] = None, date_to: Optional[str] = None):
     if orchestrator is None:
         raise HTTPException(status_code=500, detail="Orchestrator not initialized")
+    try:
+        where = build_where(source=source, page=page, discipline=discipline, date_from=date_from, date_to=date_to)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     try:
-        response = await orchestrator.run(q)
+        # Cache hits are answered without waiting for an LLM slot
+        response, cache_vector = await orchestrator.cached_answer(q, use_cache=cache, filter=where)
+        if response is None:
+            # /query is bulk traffic: interactive /ws sessions are admitted first
+            async with scheduler.slot("bulk") if scheduler is not None else nullcontext():
+                response = await orchestrator.run(q, use_cache=cache, filter=where, cache_vector=cache_vector)
         return {"query": q, "response": response}
+    except Overloaded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -0,0 +1,110 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional
+
+from utils.timing import StageTimings
+from utils.logger import get_logger
+
+
+logger = get_logger(name="scheduler", log_file="logs/scheduler.log")
+
+class Overloaded(Exception):
+    """Raised when a request is not admitted: the queue is full or the wait exceeded the queue timeout."""
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+class RequestScheduler:
+    """
+    Admission control in front of the orchestrator for one model: at most `max_concurrency` requests run,
+    up to `max_queue` more wait, and a request that waited `queue_timeout` seconds is turned away.
+    Waiting interactive requests (/ws chat) are always admitted before bulk ones (/query).
+    """
+    PRIORITIES = {"interactive": 0, "bulk": 1}
+
+    def __init__(self, model: str, max_concurrency: int = 2, max_queue: int = 32, queue_timeout: Optional[float] = 10.0):
+        self.model = model
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.timings = StageTimings()
+        self.active = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._waiters: List[list] = []
+        self._order = itertools.count()
+
+    @asynccontextmanager
+    async def slot(self, priority: str = "interactive") -> AsyncIterator[None]:
+        """Hold one of the model's slots for the duration of the block; raises Overloaded when not admitted."""
+        await self.acquire(priority)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings.record("service", time.perf_counter() - start)
+            self.release()
+
+    async def acquire(self, priority: str = "interactive"):
+        rank = self.PRIORITIES[priority]
+        start = time.perf_counter()
+        if self.active < self.max_concurrency and not self.queued:
+            self.active += 1
+        else:
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                logger.warning(f"rejected {priority} request for '{self.model}': queue full ({self.queued})")
+                raise Overloaded(f"server busy: {self.queued} requests already queued", self.retry_after())
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, [rank, next(self._order), future])
+            self.queued += 1
+            try:
+                # Granted slots are handed over by release(), so `active` already counts this request
+                await asyncio.wait_for(future, self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.queued -= 1
+                self.timed_out += 1
+                logger.warning(f"{priority} request for '{self.model}' timed out after {self.queue_timeout}s in queue")
+                raise Overloaded(f"server busy: no slot within {self.queue_timeout}s", self.retry_after())
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    self.release()
+                else:
+                    self.queued -= 1
+                raise
+        self.admitted += 1
+        self.timings.record(f"wait_{priority}", time.perf_counter() - start)
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.queued -= 1
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def retry_after(self) -> int:
+        """Seconds a turned-away client should wait, from the mean service time and the current backlog."""
+        service = self.timings.stats().get("service")
+        mean = service["mean_ms"] / 1000 if service else 1.0
+        return max(1, math.ceil(mean * (self.queued + 1) / self.max_concurrency))
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model,
+            "max_concurrency": self.max_concurrency,
+            "active": self.active,
+            "queue_depth": self.queued,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "timings": self.timings.stats(),
+        }
@@ -5,11 +5,20 @@ from typing import Optional
 from langchain_chroma import Chroma
 from langchain_ollama import ChatOllama
 
+from agents.classifier_agent import ClassifierAgent
 from agents.embedding_agent import EmbeddingAgent
 from agents.orchestrator_agent import OrchetratorAgent
-from utils.llm_factory import make_llm
+from utils.cache import RetrievalCache
+from utils.classification_job import ClassificationJob
+from utils.context_packer import ContextPacker
+from utils.conversation_memory import ConversationMemory, SessionStore
+from utils.llm_factory import make_embeddings, make_llm
+from utils.reranker import make_reranker
+from utils.retriever_factory import make_retriever
+from utils.semantic_cache import SemanticAnswerCache
 from utils.logger import get_logger
-from .routes import chat, query
+from .scheduler import RequestScheduler
+from .routes import chat, classify, metrics, query
 from .config import settings
 
 
@@ -23,16 +32,107 @@ llm: Optional[ChatOllama] = None
 async def lifespan(app: FastAPI):
     global vector_db, orchestrator, llm
     try:
-        llm = make_llm(settings.MODEL_NAME, temperature=0.7)
+        client_options = {
+            "pool_size": settings.OLLAMA_POOL_SIZE,
+            "timeout": settings.OLLAMA_TIMEOUT,
+            "single_flight": settings.LLM_SINGLE_FLIGHT
+        }
+        llm = make_llm(settings.MODEL_NAME, temperature=0.7, **client_options)
         embedding = EmbeddingAgent(
             persist_dir=settings.PERSIST_DIR, 
-            model_name=settings.EMBEDDING_MODEL_NAME
+            model_name=settings.EMBEDDING_MODEL_NAME,
+            cache_path=settings.EMBEDDING_CACHE_PATH or None,
+            cache_size=settings.EMBEDDING_CACHE_SIZE,
+            backend=settings.VECTOR_BACKEND,
+            local_options={
+                "ivf_threshold": settings.LOCAL_IVF_THRESHOLD,
+                "nprobe": settings.LOCAL_NPROBE,
+                "dtype": settings.LOCAL_DTYPE,
+                "rescore": settings.LOCAL_RESCORE
+            },
+            client_options=client_options
         )
         vector_db = await embedding.load(collection_name=settings.COLLECTION_NAME)
-        orchestrator = OrchetratorAgent(vector_db=vector_db, llm=llm)
+        retriever = make_retriever(
+            vector_db=vector_db,
+            llm=llm,
+            latency_budget=settings.RETRIEVAL_LATENCY_BUDGET,
+            search_k=settings.RETRIEVAL_SEARCH_K,
+            mode=settings.RETRIEVAL_MODE,
+            lexical_index=await embedding.load_lexical_index(settings.COLLECTION_NAME) if settings.RETRIEVAL_MODE == "hybrid" else None,
+            alpha=settings.HYBRID_ALPHA,
+            prefilter=settings.HYBRID_PREFILTER
+        )
+        retrieval_cache = RetrievalCache(
+            collection_name=settings.COLLECTION_NAME,
+            version_fn=lambda: embedding.collection_version(settings.COLLECTION_NAME),
+            max_size=settings.RETRIEVAL_CACHE_SIZE,
+            ttl=settings.RETRIEVAL_CACHE_TTL
+        )
+        answer_cache = SemanticAnswerCache(
+            embeddings=embedding.builder.embeddings,
+            collection_name=settings.COLLECTION_NAME,
+            version_fn=lambda: embedding.collection_version(settings.COLLECTION_NAME),
+            threshold=settings.ANSWER_CACHE_THRESHOLD,
+            max_size=settings.ANSWER_CACHE_SIZE,
+            ttl=settings.ANSWER_CACHE_TTL
+        ) if settings.ANSWER_CACHE_ENABLED else None
+        context_packer = ContextPacker(token_budget=settings.CONTEXT_TOKEN_BUDGET)
+        orchestrator = OrchetratorAgent(
+            vector_db=vector_db,
+            llm=llm,
+            retriever=retriever,
+            retrieval_cache=retrieval_cache,
+            answer_cache=answer_cache,
+            reranker=make_reranker(
+                settings.RERANKER,
+                model_name=settings.RERANK_MODEL,
+                token_budget=settings.RERANK_TOKEN_BUDGET,
+                latency_budget=settings.RERANK_LATENCY_BUDGET
+            ),
+            rerank_candidates=settings.RERANK_CANDIDATES,
+            context_packer=context_packer,
+            summary_concurrency=settings.SUMMARY_MAX_CONCURRENCY
+        )
+
+        scheduler = RequestScheduler(
+            model=settings.MODEL_NAME,
+            max_concurrency=settings.LLM_MAX_CONCURRENCY,
+            max_queue=settings.LLM_MAX_QUEUE,
+            queue_timeout=settings.LLM_QUEUE_TIMEOUT
+        )
+
+        sessions = SessionStore(
+            lambda: ConversationMemory(llm, token_budget=settings.SESSION_TOKEN_BUDGET),
+            max_sessions=settings.SESSION_MAX,
+            ttl=settings.SESSION_TTL
+        )
 
         query.orchestrator = orchestrator
+        query.scheduler = scheduler
         chat.orchestrator = orchestrator
+        chat.scheduler = scheduler
+        chat.sessions = sessions
+        metrics.retrieval_cache = retrieval_cache
+        metrics.embedding_cache = embedding.builder.embedding_cache
+        metrics.answer_cache = answer_cache
+        metrics.stage_timings = orchestrator.retriever_agent.timings
+        metrics.context_packer = context_packer
+        metrics.scheduler = scheduler
+        metrics.sessions = sessions
+        if settings.LLM_SINGLE_FLIGHT:
+            metrics.single_flight = {
+                "llm": llm,
+                "embeddings": make_embeddings(settings.EMBEDDING_MODEL_NAME, **client_options)
+            }
+        classify.vector_db = vector_db
+        classify.job = ClassificationJob(
+            ClassifierAgent(llm),
+            embedding.builder,
+            collection_name=settings.COLLECTION_NAME,
+            max_concurrency=settings.CLASSIFY_MAX_CONCURRENCY,
+            scheduler=scheduler
+        )
 
         yield
     except Exception as e:
@@ -50,6 +150,8 @@ app.add_middleware(
 
 app.include_router(query.router)
 app.include_router(chat.router)
+app.include_router(metrics.router)
+app.include_router(classify.router)
 
 # @app.websocket("/ws")
 # async def ws_endpoint(ws: WebSocket):
@@ -0,0 +1,84 @@
+"""
+Memory and recall of the local backend's storage formats.
+
+Each configuration is loaded in a fresh process (as a uvicorn worker would) with the matrix memory-mapped:
+    python -m benchmarks.bench_quantization --size 200000 --dim 768
+
+"anon MB" is private memory the worker allocated; "file MB" is page cache mapped by the worker,
+shared by every worker that maps the same collection and reclaimable under memory pressure.
+"""
+import argparse
+import multiprocessing
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+from langchain_core.embeddings import FakeEmbeddings
+
+from benchmarks.bench_vector_backend import exact_top_k, make_corpus
+from local_vector_store import LocalVectorStore
+
+
+def resident_kb() -> dict:
+    with open("/proc/self/status") as f:
+        fields = dict(line.split(":", 1) for line in f)
+    return {key: int(fields[key].split()[0]) for key in ("RssAnon", "RssFile")}
+
+def run_config(path: str, dim: int, queries: np.ndarray, truth: list, k: int, options: dict, results):
+    before = resident_kb()
+    store = LocalVectorStore.load(Path(path), FakeEmbeddings(size=dim), ivf_threshold=10**12, **options)
+    latencies, recall = [], 0.0
+    for q, expected in zip(queries, truth):
+        start = time.perf_counter()
+        found = store.similarity_search_by_vector(q.tolist(), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        recall += len(expected & {int(doc.id) for doc in found}) / k
+    after = resident_kb()
+    scanned = store._codes if store._codes is not None else store._vectors
+    results.put({
+        "recall": recall / len(queries),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "matrix_mb": scanned.nbytes / 2**20,
+        "anon_mb": (after["RssAnon"] - before["RssAnon"]) / 1024,
+        "file_mb": (after["RssFile"] - before["RssFile"]) / 1024,
+    })
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare local backend storage formats")
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    vectors, queries = make_corpus(args.size, args.dim, args.queries)
+    truth = exact_top_k(vectors, queries, args.k)
+    ids = [str(i) for i in range(args.size)]
+    texts = [""] * args.size
+    context = multiprocessing.get_context("spawn")
+
+    configs = [
+        ("float32", {"dtype": "float32"}),
+        ("float16", {"dtype": "float16", "rescore": False}),
+        ("float16 + rescore", {"dtype": "float16"}),
+        ("int8", {"dtype": "int8", "rescore": False}),
+        ("int8 + rescore", {"dtype": "int8"}),
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        for dtype in ("float16", "int8"):
+            store = LocalVectorStore(FakeEmbeddings(size=args.dim), dtype=dtype)
+            store.add_embeddings(texts, vectors, ids=ids)
+            store.save(Path(tmp))
+
+        print(f"{args.size} vectors, dim={args.dim}, {args.queries} queries, recall@{args.k}, exact scan")
+        print(f"{'format':<20}{'recall':>8}{'p50 ms':>10}{'matrix MB':>12}{'anon MB':>10}{'file MB':>10}")
+        for name, options in configs:
+            results = context.Queue()
+            proc = context.Process(target=run_config, args=(tmp, args.dim, queries, truth, args.k, options, results))
+            proc.start()
+            r = results.get()
+            proc.join()
+            print(f"{name:<20}{r['recall']:>8.3f}{r['p50_ms']:>10.2f}{r['matrix_mb']:>12.1f}{r['anon_mb']:>10.1f}{r['file_mb']:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Build throughput and scatter-gather query latency as the number of shards grows.
+
+Uses the synthetic clustered vectors of bench_vector_backend, so no embedding model is needed:
+    python -m benchmarks.bench_sharding --size 200000 --dim 384 --shards 1 2 4 8 --backend chroma
+"""
+import argparse
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import numpy as np
+from langchain_chroma import Chroma
+from langchain_core.embeddings import FakeEmbeddings
+
+from benchmarks.bench_vector_backend import exact_top_k, make_corpus, measure
+from local_vector_store import LocalVectorStore
+from sharded_vector_store import ShardedVectorStore, shard_of
+
+
+def open_shard(backend: str, path: Path, name: str, embedding, size: int):
+    if backend == "local":
+        # Exact scans, so latency differences come from sharding alone
+        return LocalVectorStore(embedding, persist_path=path / f"{name}.local", ivf_threshold=size + 1)
+    return Chroma(
+        collection_name=name,
+        embedding_function=embedding,
+        persist_directory=str(path / "chroma"),
+        collection_metadata={"hnsw:space": "cosine"}
+    )
+
+def fill_shard(store, ids: list, texts: list, vectors: np.ndarray, batch: int = 5000) -> int:
+    for i in range(0, len(ids), batch):
+        if isinstance(store, LocalVectorStore):
+            store.add_embeddings(texts[i:i + batch], vectors[i:i + batch], ids=ids[i:i + batch])
+        else:
+            store._collection.add(ids=ids[i:i + batch], embeddings=vectors[i:i + batch].tolist(), documents=texts[i:i + batch])
+    if isinstance(store, LocalVectorStore):
+        store.save()
+    return len(ids)
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure sharded build and search")
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--backend", choices=["chroma", "local"], default="chroma")
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    vectors, queries = make_corpus(args.size, args.dim, args.queries)
+    truth = exact_top_k(vectors, queries, args.k)
+    ids = [str(i) for i in range(args.size)]
+    texts = [f"chunk {i}" for i in range(args.size)]
+    embedding = FakeEmbeddings(size=args.dim)
+    results = {}
+
+    for count in args.shards:
+        with tempfile.TemporaryDirectory() as tmp:
+            stores = [open_shard(args.backend, Path(tmp), f"bench-shard{i}", embedding, args.size) for i in range(count)]
+            groups = [[] for _ in range(count)]
+            for row, doc_id in enumerate(ids):
+                groups[shard_of(doc_id, count)].append(row)
+
+            # Shards are independent collections, so they are built in parallel
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=count) as pool:
+                list(pool.map(
+                    lambda item: fill_shard(item[0], [ids[r] for r in item[1]], [texts[r] for r in item[1]], vectors[item[1]]),
+                    zip(stores, groups)
+                ))
+            build = time.perf_counter() - start
+
+            if args.backend == "local":
+                start = time.perf_counter()
+                stores = [LocalVectorStore.load(store.persist_path, embedding, ivf_threshold=args.size + 1) for store in stores]
+                load = time.perf_counter() - start
+            else:
+                load = float("nan")
+            store = stores[0] if count == 1 else ShardedVectorStore(stores)
+            results[count] = {
+                **measure(store.similarity_search_by_vector, queries, truth, args.k),
+                "build_s": build,
+                "load_s": load,
+                "throughput": args.size / build,
+            }
+
+    print(f"{args.backend}: {args.size} vectors, dim={args.dim}, {args.queries} queries, recall@{args.k}")
+    print(f"{'shards':<8}{'recall':>8}{'p50 ms':>10}{'p95 ms':>10}{'build s':>10}{'vec/s':>10}{'load s':>10}")
+    for count, r in results.items():
+        print(f"{count:<8}{r['recall']:>8.3f}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['build_s']:>10.1f}"
+              f"{r['throughput']:>10.0f}{r['load_s']:>10.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Recall and latency of the local NumPy backend (exact and IVF) against Chroma.
+
+Uses synthetic clustered unit vectors, so no embedding model is needed:
+    python -m benchmarks.bench_vector_backend --size 100000 --dim 768
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+from langchain_chroma import Chroma
+from langchain_core.embeddings import FakeEmbeddings
+
+from local_vector_store import LocalVectorStore
+
+
+def make_corpus(size: int, dim: int, queries: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, size // 500), dim))
+    vectors = centers[rng.integers(0, len(centers), size)] + 0.5 * rng.normal(size=(size, dim))
+    vectors = (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+    picks = vectors[rng.integers(0, size, queries)] + 0.2 * rng.normal(size=(queries, dim))
+    return vectors, (picks / np.linalg.norm(picks, axis=1, keepdims=True)).astype(np.float32)
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> list:
+    return [set(np.argsort(-(vectors @ q))[:k].tolist()) for q in queries]
+
+def measure(search, queries: np.ndarray, truth: list, k: int) -> dict:
+    latencies, recall = [], 0.0
+    for q, expected in zip(queries, truth):
+        start = time.perf_counter()
+        found = search(q.tolist(), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        recall += len(expected & {int(doc.id) for doc in found}) / k
+    return {
+        "recall": recall / len(queries),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare vector backends")
+    parser.add_argument("--size", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    vectors, queries = make_corpus(args.size, args.dim, args.queries)
+    truth = exact_top_k(vectors, queries, args.k)
+    ids = [str(i) for i in range(args.size)]
+    texts = [f"chunk {i}" for i in range(args.size)]
+    embedding = FakeEmbeddings(size=args.dim)
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        chroma = Chroma(
+            collection_name="bench",
+            embedding_function=embedding,
+            persist_directory=str(Path(tmp) / "chroma"),
+            collection_metadata={"hnsw:space": "cosine"}
+        )
+        start = time.perf_counter()
+        for i in range(0, args.size, 5000):
+            chroma._collection.add(ids=ids[i:i + 5000], embeddings=vectors[i:i + 5000].tolist(), documents=texts[i:i + 5000])
+        build = time.perf_counter() - start
+        results["chroma (hnsw)"] = {**measure(chroma.similarity_search_by_vector, queries, truth, args.k), "build_s": build}
+
+        for name, options in [
+            ("local exact", {"ivf_threshold": args.size + 1}),
+            ("local ivf nprobe=4", {"ivf_threshold": 0, "nprobe": 4}),
+            ("local ivf nprobe=16", {"ivf_threshold": 0, "nprobe": 16}),
+        ]:
+            path = Path(tmp) / name.replace(" ", "_")
+            start = time.perf_counter()
+            store = LocalVectorStore(embedding, persist_path=path, **options)
+            store.add_embeddings(texts, vectors, ids=ids)
+            store.save()
+            build = time.perf_counter() - start
+
+            start = time.perf_counter()
+            store = LocalVectorStore.load(path, embedding, **options)
+            load = time.perf_counter() - start
+            results[name] = {**measure(store.similarity_search_by_vector, queries, truth, args.k), "build_s": build, "load_s": load}
+
+    print(f"{args.size} vectors, dim={args.dim}, {args.queries} queries, recall@{args.k}")
+    print(f"{'backend':<22}{'recall':>8}{'p50 ms':>10}{'p95 ms':>10}{'build s':>10}{'load s':>10}")
+    for name, r in results.items():
+        print(f"{name:<22}{r['recall']:>8.3f}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['build_s']:>10.1f}{r.get('load_s', float('nan')):>10.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import json
+import math
+import os
+import re
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+from utils.logger import get_logger
+
+logger = get_logger(name="bm25_index", log_file="logs/bm25_index.log")
+
+# Keeps identifiers such as "2301.12345", "gpt-4" or "eq_3" together as one token
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[._\-][a-z0-9]+)*")
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens; compound tokens are also indexed by their parts."""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in re.split(r"[._\-]", token) if part)
+    return tokens
+
+class BM25Index:
+    """
+    Okapi BM25 over an array-backed inverted index.
+
+    Saved postings are stored CSR-style (one offsets array, one doc array, one term-frequency array)
+    and memory-mapped on load. Additions since the last save live in small per-term `array` deltas,
+    deletions are tombstones; both are folded into the CSR arrays by `save()`.
+    """
+    def __init__(self, path: Optional[Path] = None, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._lengths = array("I")
+        self._live = bytearray()
+        self._live_count = 0
+        self._total_length = 0
+        # Saved postings
+        self._terms: Dict[str, int] = {}
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._docs = np.empty(0, dtype=np.uint32)
+        self._tfs = np.empty(0, dtype=np.uint32)
+        # Unsaved postings: term -> (rows, term frequencies)
+        self._delta: Dict[str, Tuple[array, array]] = {}
+
+    def __len__(self) -> int:
+        return self._live_count
+
+    # === Writes ===
+    def add(self, ids: Sequence[str], texts: Sequence[str]):
+        self.delete([doc_id for doc_id in ids if doc_id in self._rows])
+        for doc_id, text in zip(ids, texts):
+            row = len(self._ids)
+            counts = Counter(tokenize(text))
+            length = sum(counts.values())
+            self._ids.append(doc_id)
+            self._rows[doc_id] = row
+            self._lengths.append(length)
+            self._live.append(1)
+            self._live_count += 1
+            self._total_length += length
+            for term, tf in counts.items():
+                docs, tfs = self._delta.setdefault(term, (array("I"), array("I")))
+                docs.append(row)
+                tfs.append(tf)
+
+    def delete(self, ids: Sequence[str]):
+        for doc_id in ids:
+            row = self._rows.pop(doc_id, None)
+            if row is None or not self._live[row]:
+                continue
+            self._live[row] = 0
+            self._live_count -= 1
+            self._total_length -= self._lengths[row]
+
+    # === Reads ===
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Top-k (id, score) pairs for the query, best first."""
+        if not self._live_count:
+            return []
+        avgdl = self._total_length / self._live_count or 1.0
+        lengths = np.frombuffer(self._lengths, dtype=np.uint32) if len(self._lengths) else np.empty(0, dtype=np.uint32)
+        live = np.frombuffer(self._live, dtype=np.uint8)
+
+        rows_parts, score_parts = [], []
+        for term in set(tokenize(query)):
+            rows, tfs = self._postings(term)
+            if not len(rows):
+                continue
+            df = len(rows)
+            idf = math.log(1 + (self._live_count - df + 0.5) / (df + 0.5))
+            tfs = tfs.astype(np.float32)
+            norm = self.k1 * (1 - self.b + self.b * lengths[rows] / avgdl)
+            rows_parts.append(rows)
+            score_parts.append(idf * tfs * (self.k1 + 1) / (tfs + norm))
+        if not rows_parts:
+            return []
+
+        rows, inverse = np.unique(np.concatenate(rows_parts), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(score_parts))
+        scores[live[rows] == 0] = -np.inf
+        k = min(k, int(np.count_nonzero(np.isfinite(scores))))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self._ids[rows[i]], float(scores[i])) for i in top]
+
+    def candidate_ids(self, query: str, limit: int = 100) -> List[str]:
+        """Ids of the best lexical matches, for restricting a vector search to a small subset."""
+        return [doc_id for doc_id, _ in self.search(query, limit)]
+
+    def _postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        parts_rows, parts_tfs = [], []
+        index = self._terms.get(term)
+        if index is not None:
+            start, end = self._offsets[index], self._offsets[index + 1]
+            parts_rows.append(self._docs[start:end])
+            parts_tfs.append(self._tfs[start:end])
+        delta = self._delta.get(term)
+        if delta is not None:
+            parts_rows.append(np.frombuffer(delta[0], dtype=np.uint32))
+            parts_tfs.append(np.frombuffer(delta[1], dtype=np.uint32))
+        if not parts_rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint32)
+        if len(parts_rows) == 1:
+            return parts_rows[0].astype(np.int64), parts_tfs[0]
+        return np.concatenate(parts_rows).astype(np.int64), np.concatenate(parts_tfs)
+
+    # === Persistence ===
+    def save(self, path: Optional[Path] = None):
+        """Fold deltas and tombstones into fresh CSR arrays and write them out."""
+        path = Path(path or self.path)
+        path.mkdir(parents=True, exist_ok=True)
+
+        live = np.frombuffer(self._live, dtype=np.uint8).astype(bool) if len(self._live) else np.empty(0, dtype=bool)
+        new_row = np.cumsum(live, dtype=np.int64) - 1
+        terms, offsets, doc_parts, tf_parts = [], [0], [], []
+        for term in sorted(self._terms.keys() | self._delta.keys()):
+            rows, tfs = self._postings(term)
+            keep = live[rows]
+            if not keep.any():
+                continue
+            terms.append(term)
+            doc_parts.append(new_row[rows[keep]].astype(np.uint32))
+            tf_parts.append(tfs[keep].astype(np.uint32))
+            offsets.append(offsets[-1] + int(keep.sum()))
+
+        ids = [doc_id for doc_id, alive in zip(self._ids, live) if alive]
+        lengths = np.frombuffer(self._lengths, dtype=np.uint32)[live] if len(self._lengths) else np.empty(0, dtype=np.uint32)
+        self._write(path / "offsets.npy", np.asarray(offsets, dtype=np.int64))
+        self._write(path / "docs.npy", np.concatenate(doc_parts) if doc_parts else np.empty(0, dtype=np.uint32))
+        self._write(path / "tfs.npy", np.concatenate(tf_parts) if tf_parts else np.empty(0, dtype=np.uint32))
+        self._write(path / "lengths.npy", lengths.astype(np.uint32))
+        tmp_path = path / "meta.json.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"ids": ids, "terms": terms, "k1": self.k1, "b": self.b}, f, ensure_ascii=False)
+        os.replace(tmp_path, path / "meta.json")
+        logger.info(f"saved BM25 index with {len(ids)} documents and {len(terms)} terms to {path}")
+
+        # Continue from the compacted on-disk state
+        loaded = self.load(path)
+        self.__dict__.update(loaded.__dict__)
+
+    @classmethod
+    def load(cls, path: Path) -> "BM25Index":
+        if not (path / "meta.json").exists():
+            return cls(path)
+        with open(path / "meta.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        index = cls(path, k1=meta["k1"], b=meta["b"])
+        index._ids = meta["ids"]
+        index._rows = {doc_id: row for row, doc_id in enumerate(index._ids)}
+        index._terms = {term: i for i, term in enumerate(meta["terms"])}
+        index._offsets = np.load(path / "offsets.npy")
+        index._docs = np.load(path / "docs.npy", mmap_mode="r")
+        index._tfs = np.load(path / "tfs.npy", mmap_mode="r")
+        index._lengths = array("I", np.load(path / "lengths.npy").tobytes())
+        index._live = bytearray(b"\x01" * len(index._ids))
+        index._live_count = len(index._ids)
+        index._total_length = int(sum(index._lengths))
+        return index
+
+    @staticmethod
+    def _write(path: Path, values: np.ndarray):
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, values)
+        os.replace(tmp_path, path)
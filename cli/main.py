@@ -1,23 +1,86 @@
 import argparse
 import asyncio
 from pathlib import Path
+from agents.classifier_agent import ClassifierAgent
 from agents.ingestion_agent import IngestionAgent
 from agents.embedding_agent import EmbeddingAgent
 from agents.orchestrator_agent import OrchetratorAgent
+from sharded_vector_store import shard_of
+from utils.classification_job import ClassificationJob
+from utils.conversation_memory import ConversationMemory
+from utils.filters import build_where
 from utils.llm_factory import make_llm
+from utils.manifest import IndexManifest
+from utils.reranker import make_reranker
+from utils.retriever_factory import make_retriever
 
 
-async def build_index(path: str):
+async def build_index(path: str, workers: int = 1, incremental: bool = False, batch_size: int = 64, concurrency: int = 4,
+                      backend: str = "chroma", local_dtype: str = "float32", shards: int = 1, shard_by: str = "hash",
+                      shard: int = None, stream: bool = False):
     pdf_dir = Path(path)
-    ingestion = IngestionAgent(pdf_dir=pdf_dir)
-    embedding = EmbeddingAgent(persist_dir="db_store", model_name="nomic-embed-text")
+    ingestion = IngestionAgent(pdf_dir=pdf_dir, workers=workers)
+    embedding = EmbeddingAgent(
+        persist_dir="db_store",
+        model_name="nomic-embed-text",
+        batch_size=batch_size,
+        max_concurrency=concurrency,
+        backend=backend,
+        local_options={"dtype": local_dtype},
+        shards=shards,
+        shard_by=shard_by
+    )
 
-    documents = await ingestion.run()
-    vector_db = await embedding.run(documents=documents, collection_name="corpus_db", overwrite=True)
+    pdf_files = sorted(pdf_dir.glob("*.pdf"))
+    if shard is not None:
+        layout = embedding.builder.load_layout("corpus_db")
+        if layout is None:
+            raise SystemExit("collection 'corpus_db' is not sharded, run a full build with --shards first")
+        if layout["shard_by"] == "source":
+            # Only files routed to this shard need to be parsed
+            pdf_files = [pdf_file for pdf_file in pdf_files if shard_of(pdf_file.name, layout["shards"]) == shard]
+        documents = await ingestion.run(files=pdf_files)
+        file_hashes = {pdf_file.name: IndexManifest.hash_file(pdf_file) for pdf_file in pdf_files}
+        return await embedding.rebuild_shard(documents=documents, shard=shard, collection_name="corpus_db",
+                                             file_hashes=file_hashes)
+
+    file_hashes = {pdf_file.name: IndexManifest.hash_file(pdf_file) for pdf_file in pdf_files}
+
+    if stream:
+        # Chunks flow from the parser into the index; an interrupted build resumes with --stream --incremental
+        if incremental:
+            stale = set(await embedding.stale_sources(file_hashes, collection_name="corpus_db"))
+            pdf_files = [pdf_file for pdf_file in pdf_files if pdf_file.name in stale]
+        summary = await embedding.run_stream(
+            ingestion.stream(files=pdf_files), file_hashes, collection_name="corpus_db", overwrite=not incremental
+        )
+        print(
+            f"files: {summary['files_added']} added, {summary['files_updated']} updated, {summary['files_removed']} removed\n"
+            f"chunks: {summary['chunks_added']} added, {summary['chunks_removed']} removed, "
+            f"{summary['chunks_unchanged']} unchanged ({summary['checkpoints']} checkpoints)"
+        )
+        return await embedding.load(collection_name="corpus_db")
+
+    if not incremental:
+        documents = await ingestion.run(files=pdf_files)
+        vector_db = await embedding.run(documents=documents, collection_name="corpus_db", overwrite=True, file_hashes=file_hashes)
+        return vector_db
+
+    # Only parse files that are new or changed since the last build
+    stale = set(await embedding.stale_sources(file_hashes, collection_name="corpus_db"))
+    documents = await ingestion.run(files=[pdf_file for pdf_file in pdf_files if pdf_file.name in stale])
+    vector_db, summary = await embedding.update(documents=documents, file_hashes=file_hashes, collection_name="corpus_db")
+    print(
+        f"files: {summary['files_added']} added, {summary['files_updated']} updated, "
+        f"{summary['files_removed']} removed, {summary['files_unchanged']} unchanged\n"
+        f"chunks: {summary['chunks_added']} added, {summary['chunks_removed']} removed, "
+        f"{summary['chunks_unchanged']} unchanged"
+    )
     return vector_db
 
-async def query_pipeline(query: str):
-    embedding = EmbeddingAgent(persist_dir="db_store", model_name="nomic-embed-text")
+async def query_pipeline(query: str, backend: str = "chroma", retrieval: str = "multi_query",
+                         reranker: str = "none", where: dict = None):
+    embedding = EmbeddingAgent(persist_dir="db_store", model_name="nomic-embed-text", backend=backend)
     
     # Check available collections
     await embedding.list_collections()
@@ -25,13 +88,16 @@ async def query_pipeline(query: str):
     # Load the vector database
     vector_db = await embedding.load(collection_name="corpus_db")
     llm = make_llm("gemma3", temperature=0.7)
+    lexical_index = await embedding.load_lexical_index(collection_name="corpus_db") if retrieval == "hybrid" else None
+    retriever = make_retriever(vector_db, llm, mode=retrieval, lexical_index=lexical_index)
 
-    orchestrator = OrchetratorAgent(vector_db=vector_db, llm=llm)
-    answer = await orchestrator.run(query=query)
+    orchestrator = OrchetratorAgent(vector_db=vector_db, llm=llm, retriever=retriever, reranker=make_reranker(reranker))
+    answer = await orchestrator.run(query=query, filter=where)
     print("Response:\n" + answer["content"].strip())
 
-async def chat():
-    embedding = EmbeddingAgent(persist_dir="db_store", model_name="nomic-embed-text")
+async def chat(backend: str = "chroma", retrieval: str = "multi_query",
+               reranker: str = "none"):
+    embedding = EmbeddingAgent(persist_dir="db_store", model_name="nomic-embed-text", backend=backend)
     
     # Check available collections
     await embedding.list_collections()
@@ -39,34 +105,91 @@ async def chat():
     # Load the vector database
     vector_db = await embedding.load(collection_name="corpus_db")
     llm = make_llm("gemma3", temperature=0.7)
+    lexical_index = await embedding.load_lexical_index(collection_name="corpus_db") if retrieval == "hybrid" else None
+    retriever = make_retriever(vector_db, llm, mode=retrieval, lexical_index=lexical_index)
 
-    orchestrator = OrchetratorAgent(vector_db=vector_db, llm=llm)
+    orchestrator = OrchetratorAgent(vector_db=vector_db, llm=llm, retriever=retriever, reranker=make_reranker(reranker))
     
-    history = []
+    # Older turns are folded into a rolling summary, so the prompt stays bounded however long the chat runs
+    memory = ConversationMemory(llm)
     print("\n=== Multi-turn chart started (type 'exit' to quit) ===\n")
     while True:
         user_input = input("❯❯ ").strip()
         if user_input.lower() in {"exit", "quit"}:
             print("Ending chat. Bye bye")
             break
-        history.append({"role": "user", "content": user_input})
         query = user_input
 
         # [STREAM]
-        async for chunk in orchestrator.stream(query):
-            print(chunk["content"], end="", flush=True)
+        answer = []
+        async for chunk in orchestrator.stream(query, history=memory.render()):
+            content = chunk["content"] if isinstance(chunk, dict) else str(chunk)
+            answer.append(content or "")
+            print(content, end="", flush=True)
+        print()
+        await memory.add_turn(query, "".join(answer))
+
+async def classify_collection(backend: str = "chroma", batch_size: int = 8, concurrency: int = 4,
+                              per_chunk: bool = False, restart: bool = False):
+    embedding = EmbeddingAgent(persist_dir="db_store", model_name="nomic-embed-text", backend=backend)
+    vector_db = await embedding.load(collection_name="corpus_db")
+    llm = make_llm("gemma3", temperature=0)
+
+    job = ClassificationJob(
+        ClassifierAgent(llm),
+        embedding.builder,
+        collection_name="corpus_db",
+        batch_size=batch_size,
+        max_concurrency=concurrency,
+        per_source=not per_chunk
+    )
+    summary = await job.run(vector_db, restart=restart)
+    print(
+        f"units: {summary['classified']} classified, {summary['skipped']} already done (checkpoint {job.checkpoint_path})\n"
+        f"chunks updated: {summary['chunks_updated']}\n"
+        f"labels: {summary['labels']}"
+    )
 
 def init_parser() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="AI Corpus Agent CLI - Manage vector DB, run queries, and chat")
+    parser.add_argument('--backend', choices=["chroma", "local"], default="chroma", help="Vector store backend")
+    parser.add_argument('--local-dtype', choices=["float32", "float16", "int8"], default="float32",
+                        help="Storage precision of the local backend's search matrix")
+    parser.add_argument('--retrieval', choices=["multi_query", "hybrid"], default="multi_query",
+                        help="Multi-query vector retrieval, or BM25 + vector hybrid retrieval")
+    parser.add_argument('--reranker', choices=["none", "lexical", "cross-encoder"], default="none",
+                        help="Rerank retrieved chunks before generation")
     subparsers = parser.add_subparsers(dest="command", required=True)
 
     # === Build command ===
     build_parser = subparsers.add_parser('build', help="Build the vector database")
     build_parser.add_argument('-p', '--path', required=True, help="Directory path of books/papers etc")
+    build_parser.add_argument('-w', '--workers', type=int, default=1, help="Number of processes used to parse and chunk PDFs")
+    build_parser.add_argument('-i', '--incremental', action="store_true", help="Only embed new or changed files and drop removed ones")
+    build_parser.add_argument('-b', '--batch-size', type=int, default=64, help="Number of chunks embedded per request")
+    build_parser.add_argument('-c', '--concurrency', type=int, default=4, help="Maximum number of embedding requests in flight")
+    build_parser.add_argument('-s', '--stream', action="store_true",
+                              help="Embed chunks while files are parsed, with periodic checkpoints, instead of parsing everything first")
+    build_parser.add_argument('--shards', type=int, default=1, help="Number of collections a full build partitions the chunks across")
+    build_parser.add_argument('--shard-by', choices=["hash", "source"], default="hash",
+                              help="Route chunks to shards by a hash of the chunk id, or keep each file on one shard")
+    build_parser.add_argument('--shard', type=int, help="Only rebuild this shard of an existing sharded collection")
     
     # === Query command ===
     query_parser = subparsers.add_parser("query", help="Run a single query")
     query_parser.add_argument("-q", "--query", required=True, help="Query string to run")
+    query_parser.add_argument("--source", action="append", help="Only search this file (repeatable)")
+    query_parser.add_argument("--page", type=int, action="append", help="Only search this page number (repeatable)")
+    query_parser.add_argument("--discipline", action="append", help="Only search documents with this discipline (repeatable)")
+    query_parser.add_argument("--date-from", help="Only search documents dated on or after YYYY[-MM[-DD]]")
+    query_parser.add_argument("--date-to", help="Only search documents dated on or before YYYY[-MM[-DD]]")
+
+    # === Classify command ===
+    classify_parser = subparsers.add_parser("classify", help="Label every document of the collection with a discipline")
+    classify_parser.add_argument('-b', '--batch-size', type=int, default=8, help="Number of documents per classification prompt")
+    classify_parser.add_argument('-c', '--concurrency', type=int, default=4, help="Maximum number of prompts in flight")
+    classify_parser.add_argument('--per-chunk', action="store_true", help="Classify every chunk instead of one sample per file")
+    classify_parser.add_argument('--restart', action="store_true", help="Ignore the checkpoint and classify everything again")
 
     # === Chat command ===
     subparsers.add_parser("chat", help="Start interactive chat")
@@ -78,11 +201,33 @@ def main():
     
     # === Dispatch ===
     if args.command == "build":
-        asyncio.run(build_index(args.path))
+        asyncio.run(build_index(
+            args.path,
+            workers=args.workers,
+            incremental=args.incremental,
+            batch_size=args.batch_size,
+            concurrency=args.concurrency,
+            backend=args.backend,
+            local_dtype=args.local_dtype,
+            shards=args.shards,
+            shard_by=args.shard_by,
+            shard=args.shard,
+            stream=args.stream
+        ))
     elif args.command == "query":
-        asyncio.run(query_pipeline(args.query))
+        where = build_where(source=args.source, page=args.page, discipline=args.discipline, date_from=args.date_from, date_to=args.date_to)
+        asyncio.run(query_pipeline(args.query, backend=args.backend, retrieval=args.retrieval, reranker=args.reranker,
+                                   where=where))
+    elif args.command == "classify":
+        asyncio.run(classify_collection(
+            backend=args.backend,
+            batch_size=args.batch_size,
+            concurrency=args.concurrency,
+            per_chunk=args.per_chunk,
+            restart=args.restart
+        ))
     elif args.command == "chat":
-        asyncio.run(chat())
+        asyncio.run(chat(backend=args.backend, retrieval=args.retrieval, reranker=args.reranker))
     else:
         args.print_help()
 
@@ -0,0 +1,224 @@
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from langchain.schema import Document
+
+from utils.logger import get_logger
+
+
+logger = get_logger(name="corpus_loader", log_file="logs/corpus_loader.log")
+
+PAPERS_FILE = "papers.jsonl"
+
+class CorpusWriter:
+    """
+    Appends papers to a corpus directory:
+
+    - `papers.jsonl`: one record per paper with its metadata (stored once) and where its chunks are,
+      {"paper_id", "hash", "meta", "shard", "first", "count"}; a later record for the same paper replaces it,
+      and {"paper_id", "deleted": true} removes it.
+    - `chunks-NNNNN.jsonl`: chunk records {"paper_id", "chunk", "text"}, one per line, a paper's chunks contiguous.
+    - `chunks-NNNNN.idx`: little-endian uint64 byte offset of every line of the shard, for random access.
+
+    Every writer starts a new shard, and a paper's record is only appended after its chunks are flushed,
+    so an interrupted write leaves unreferenced chunks behind but never a broken corpus.
+    """
+    def __init__(self, corpus_dir: Path, shard_bytes: int = 64 << 20):
+        self.corpus_dir = Path(corpus_dir)
+        self.corpus_dir.mkdir(parents=True, exist_ok=True)
+        self.shard_bytes = shard_bytes
+        self._papers = None
+        self._shard = None
+        self._index = None
+        self._shard_no = max((int(path.stem.split("-")[1]) for path in self.corpus_dir.glob("chunks-*.jsonl")), default=-1)
+        self._lines = 0
+
+    def add_paper(self, paper_id: str, meta: dict, chunks: List[str], file_hash: Optional[str] = None):
+        if self._shard is None or self._shard.tell() >= self.shard_bytes:
+            self._roll()
+        first = self._lines
+        offsets = np.empty(len(chunks), dtype="<u8")
+        for i, text in enumerate(chunks):
+            offsets[i] = self._shard.tell()
+            self._shard.write((json.dumps({"paper_id": paper_id, "chunk": i, "text": text}, ensure_ascii=False) + "\n").encode("utf-8"))
+        self._index.write(offsets.tobytes())
+        self._lines += len(chunks)
+        self._shard.flush()
+        self._index.flush()
+        record = {"paper_id": paper_id, "hash": file_hash, "meta": meta, "shard": Path(self._shard.name).name, "first": first, "count": len(chunks)}
+        self._append_paper(record)
+
+    def delete_paper(self, paper_id: str):
+        self._append_paper({"paper_id": paper_id, "deleted": True})
+
+    def close(self):
+        for f in (self._shard, self._index, self._papers):
+            if f is not None:
+                f.close()
+        self._shard = self._index = self._papers = None
+
+    def __enter__(self) -> "CorpusWriter":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _append_paper(self, record: dict):
+        if self._papers is None:
+            path = self.corpus_dir / PAPERS_FILE
+            torn = False
+            if path.exists() and path.stat().st_size:
+                with open(path, "rb") as f:
+                    f.seek(-1, os.SEEK_END)
+                    torn = f.read(1) != b"\n"
+            self._papers = open(path, "a", encoding="utf-8")
+            if torn:
+                # End a line torn by an interrupted append, or the next record would be glued onto it
+                self._papers.write("\n")
+        self._papers.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._papers.flush()
+
+    def _roll(self):
+        if self._shard is not None:
+            self._shard.close()
+            self._index.close()
+        self._shard_no += 1
+        self._shard = open(self.corpus_dir / f"chunks-{self._shard_no:05d}.jsonl", "wb")
+        self._index = open(self.corpus_dir / f"chunks-{self._shard_no:05d}.idx", "wb")
+        self._lines = 0
+
+    @classmethod
+    def compact(cls, corpus_dir: Path, shard_bytes: int = 64 << 20) -> Dict[str, int]:
+        """
+        Rewrite the live papers into new shards and drop superseded chunks.
+        The new papers.jsonl replaces the old one atomically before old shards are deleted.
+        """
+        corpus_dir = Path(corpus_dir)
+        loader = CorpusLoader(corpus_dir)
+        old_shards = sorted(corpus_dir.glob("chunks-*"))
+        tmp_papers = corpus_dir / (PAPERS_FILE + ".compact")
+        with cls(corpus_dir, shard_bytes) as writer:
+            writer._papers = open(tmp_papers, "w", encoding="utf-8")
+            for record in loader.paper_records():
+                writer.add_paper(record["paper_id"], record["meta"], [text for _, text in loader._read_chunks(record)], record.get("hash"))
+        os.replace(tmp_papers, corpus_dir / PAPERS_FILE)
+        for path in old_shards:
+            path.unlink()
+        stats = {"papers": len(loader), "chunks": loader.chunk_count(), "shards_removed": len(old_shards) // 2}
+        logger.info(f"compacted corpus in {corpus_dir}: {stats}")
+        return stats
+
+class CorpusLoader:
+    """
+    Reads a corpus directory lazily: only the paper records are held in memory, chunk text is streamed from the
+    shards or looked up by offset. Directories written by the old CorpusBuilder (one `<paper>.json` list of
+    {"text", "meta"} per paper) are still read, one file at a time.
+    """
+    def __init__(self, corpus_dir: Path):
+        self.corpus_dir = Path(corpus_dir)
+        self._records: Dict[str, dict] = {}
+        self._offsets: Dict[str, np.ndarray] = {}
+        self.legacy = not (self.corpus_dir / PAPERS_FILE).exists()
+        if not self.legacy:
+            self._read_papers()
+
+    def __len__(self) -> int:
+        return len(self._records) if not self.legacy else len(self._legacy_files())
+
+    def paper_records(self) -> List[dict]:
+        return list(self._records.values())
+
+    def chunk_count(self) -> int:
+        return sum(record["count"] for record in self._records.values())
+
+    def dead_chunks(self) -> int:
+        """Chunks still on disk but superseded or deleted, reclaimed by CorpusWriter.compact."""
+        total = sum(path.stat().st_size // 8 for path in self.corpus_dir.glob("chunks-*.idx"))
+        return total - self.chunk_count()
+
+    def file_hashes(self) -> Dict[str, str]:
+        return {record["meta"].get("filename", paper_id): record.get("hash") for paper_id, record in self._records.items()}
+
+    def iter_papers(self) -> Iterator[Tuple[str, List[Document]]]:
+        """(source file name, chunks) per paper, in the order papers were written."""
+        if self.legacy:
+            yield from self._iter_legacy()
+            return
+        for record in self._records.values():
+            yield self._source(record["meta"], record["paper_id"]), [
+                self._document(record["meta"], record["paper_id"], i, text) for i, text in self._read_chunks(record)
+            ]
+
+    def iter_documents(self) -> Iterator[Document]:
+        for _, docs in self.iter_papers():
+            yield from docs
+
+    def load_documents(self) -> List[Document]:
+        """Every chunk as a list; prefer `iter_documents` or `iter_papers` for large corpora."""
+        return list(self.iter_documents())
+
+    def get_chunk(self, paper_id: str, chunk: int) -> Document:
+        """Random access to one chunk through the shard's offset index."""
+        record = self._records[paper_id]
+        if not 0 <= chunk < record["count"]:
+            raise IndexError(f"paper '{paper_id}' has {record['count']} chunks, no chunk {chunk}")
+        offset = int(self._shard_offsets(record["shard"])[record["first"] + chunk])
+        with open(self.corpus_dir / record["shard"], "rb") as f:
+            f.seek(offset)
+            line = json.loads(f.readline())
+        return self._document(record["meta"], paper_id, chunk, line["text"])
+
+    def _read_papers(self):
+        with open(self.corpus_dir / PAPERS_FILE, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn last line from an interrupted write
+                if record.get("deleted"):
+                    self._records.pop(record["paper_id"], None)
+                else:
+                    # Re-insert so the order follows the latest version of each paper
+                    self._records.pop(record["paper_id"], None)
+                    self._records[record["paper_id"]] = record
+
+    def _read_chunks(self, record: dict) -> Iterator[Tuple[int, str]]:
+        if not record["count"]:
+            return
+        offset = int(self._shard_offsets(record["shard"])[record["first"]])
+        with open(self.corpus_dir / record["shard"], "rb") as f:
+            f.seek(offset)
+            for i in range(record["count"]):
+                line = json.loads(f.readline())
+                yield i, line["text"]
+
+    def _shard_offsets(self, shard: str) -> np.ndarray:
+        offsets = self._offsets.get(shard)
+        if offsets is None:
+            offsets = self._offsets[shard] = np.memmap(self.corpus_dir / Path(shard).with_suffix(".idx"), dtype="<u8", mode="r")
+        return offsets
+
+    def _legacy_files(self) -> List[Path]:
+        return sorted(path for path in self.corpus_dir.glob("*.json") if path.name != "manifest.json")
+
+    def _iter_legacy(self) -> Iterator[Tuple[str, List[Document]]]:
+        for path in self._legacy_files():
+            with open(path, "r", encoding="utf-8") as f:
+                records = json.load(f)
+            if not records:
+                continue
+            meta = records[0].get("meta", {})
+            paper_id = meta.get("paper_id", path.stem)
+            yield self._source(meta, paper_id), [
+                self._document(record.get("meta", meta), paper_id, i, record["text"]) for i, record in enumerate(records)
+            ]
+
+    @staticmethod
+    def _source(meta: dict, paper_id: str) -> str:
+        return meta.get("filename", f"{paper_id}.pdf")
+
+    @classmethod
+    def _document(cls, meta: dict, paper_id: str, chunk: int, text: str) -> Document:
+        return Document(page_content=text, metadata={**meta, "source": cls._source(meta, paper_id), "chunk": chunk})
@@ -1,68 +1,55 @@
 import requests
+import threading
 import time
 import arxiv
 import fitz
+import os
 import pdfplumber
-from requests.exceptions import ChunkedEncodingError, ConnectionError
+from concurrent.futures.process import BrokenProcessPool
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ChunkedEncodingError, ConnectionError, Timeout
 from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
 import json
 
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+from corpus_loader import PAPERS_FILE, CorpusLoader, CorpusWriter
 from utils.logger import get_logger
+from utils.manifest import IndexManifest
+from utils.timing import StageTimings
 
 # ===== Setup logger =====
 logger = get_logger(name="corpus_builder", log_file="logs/corpus_builder.log")
 
-# ===== PDF validator =====
-class PDFValidator:
-    def __init__(self, directory: Path):
-        self.directory = directory
-        fitz.TOOLS.mupdf_display_errors(False)
-    
-    def clean_corrupted_pdfs(self):
-        valid_files = []
-        for pdf in self.directory.glob("*.pdf"):
-            try:
-                with fitz.open(pdf) as doc:
-                    for page_no in range(len(doc)):
-                        _ = doc.load_page(page_no).get_text("text")
-                logger.info(f"valid: {pdf.name}")
-                valid_files.append(pdf)
-            except Exception as e:
-                logger.error(f"corrupted: {pdf.name} ({e})")
-                try:
-                    pdf.unlink()
-                    logger.warning(f"deleted: {pdf.name}")
-                except Exception as remove_err:
-                    logger.error(f"failed not delete {pdf.name}: {remove_err}")
-        return valid_files
-
 # ===== PDF extractor =====
 class PDFExtractor:
-    def __init__(self):
-        pass
-
+    """
+    Validates and extracts a PDF in a single PyMuPDF pass: a file whose pages cannot all be read is corrupted.
+    pdfplumber is only tried when PyMuPDF finds no text at all.
+    """
     @staticmethod
-    def extract_pdf(pdf_path: Path) -> str:
+    def extract_pdf(pdf_path: Path, timings: Optional[Dict[str, float]] = None) -> str:
+        """Text of the whole document; raises when the file is corrupted. Stage durations in ms go to `timings`."""
+        timings = {} if timings is None else timings
+        start = time.perf_counter()
+        with fitz.open(pdf_path) as doc:
+            timings["open"] = round((time.perf_counter() - start) * 1000, 2)
+            start = time.perf_counter()
+            text = "\n".join(doc.load_page(page_no).get_text("text") for page_no in range(len(doc))).strip()
+        timings["extract"] = round((time.perf_counter() - start) * 1000, 2)
+        if text:
+            return text
+
+        start = time.perf_counter()
         try:
             with pdfplumber.open(pdf_path) as pdf:
-                texts = [page.extract_text() or "" for page in pdf.pages]
-            full_text = "\n".join(texts).strip()
-            if full_text:
-                return full_text
+                text = "\n".join(page.extract_text() or "" for page in pdf.pages).strip()
         except Exception:
-            logger.warning(f"pdfplumber failed for {pdf_path.name}, falling back to PyMuPDF.")
-        
-        # fallback to PyMuPDF
-        try:
-            text = ""
-            with fitz.open(pdf_path) as doc:
-                for page in doc:
-                    text += page.get_text("text") + "\n"
-            return text.strip()
-        except Exception as e:
-            logger.error(f"PyMuPDF failed for {pdf_path.name}: {e}")
-            return ""
+            logger.warning(f"pdfplumber failed for {pdf_path.name}")
+        timings["fallback"] = round((time.perf_counter() - start) * 1000, 2)
+        return text
 
 # ===== Text chunker =====
 class TextChunker:
@@ -76,65 +63,278 @@ class TextChunker:
     def chunk_text(self, text:str):
         return self.splitter.split_text(text)
 
+# Chunker owned by each pool worker, created once by the pool initializer
+_worker_chunker: Optional[TextChunker] = None
+
+def _init_worker(chunk_size: int, chunk_overlap: int):
+    global _worker_chunker
+    fitz.TOOLS.mupdf_display_errors(False)
+    _worker_chunker = TextChunker(chunk_size, chunk_overlap)
+
+def _process_pdf(pdf: Path, chunker: Optional[TextChunker] = None) -> Tuple[str, Optional[List[str]], Optional[str], Dict[str, float]]:
+    """
+    Validate, extract and chunk one PDF. Runs inside a pool worker, so errors are returned instead of raised.
+
+    :return: (file name, chunks or None when no text was found, error message or None, stage durations in ms)
+    """
+    timings: Dict[str, float] = {}
+    try:
+        text = PDFExtractor.extract_pdf(pdf, timings)
+    except Exception as e:
+        return pdf.name, None, str(e), timings
+    if not text:
+        return pdf.name, None, None, timings
+
+    start = time.perf_counter()
+    chunks = (chunker or _worker_chunker).chunk_text(text)
+    timings["chunk"] = round((time.perf_counter() - start) * 1000, 2)
+    return pdf.name, chunks, None, timings
+
 # ===== Corpus builder =====
 class CorpusBuilder:
-    def __init__(self, pdf_dir: Path, output_dir: Path):
+    """
+    Turns a directory of PDFs into a chunked corpus (see corpus_loader.CorpusWriter), opening each PDF once.
+
+    Files are parsed by `workers` processes and appended to the corpus by this process. Content hashes are kept
+    in `<output_dir>/manifest.json`, so files unchanged since the last run are skipped. PDFs that PyMuPDF cannot
+    open or read are deleted, as before. A PDF whose worker process dies is kept and retried on the next run.
+    Per-stage timings (hash, open, extract, chunk, write) are logged per file and summarized in `timings`.
+    """
+    def __init__(self, pdf_dir: Path, output_dir: Path, workers: int = 1, chunk_size: int = 1000, chunk_overlap: int = 300):
         self.pdf_dir = pdf_dir
         self.output_dir = output_dir
         self.output_dir.mkdir(exist_ok=True)
-        self.validator = PDFValidator(pdf_dir)
-        self.extractor = PDFExtractor()
-        self.chunker = TextChunker()
+        self.workers = max(1, workers)
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.chunker = TextChunker(chunk_size, chunk_overlap)
+        self.timings = StageTimings()
+        fitz.TOOLS.mupdf_display_errors(False)
     
-    def build_corpus(self):
-        valid_pdfs = self.validator.clean_corrupted_pdfs()
-        
-        for pdf in valid_pdfs:
-            text = self.extractor.extract_pdf(pdf)
-            if not text:
-                logger.warning(f"no text extracted: {pdf.name}")
+    def build_corpus(self) -> Dict[str, int]:
+        # A directory in the old one-JSON-per-paper format is converted by processing everything once
+        converting = not (self.output_dir / PAPERS_FILE).exists()
+        manifest = IndexManifest(self.output_dir / "manifest.json") if converting else IndexManifest.load(self.output_dir / "manifest.json")
+        pdfs = sorted(self.pdf_dir.glob("*.pdf"))
+        file_hashes = {}
+        for pdf in pdfs:
+            with self.timings.time("hash"):
+                file_hashes[pdf.name] = IndexManifest.hash_file(pdf)
+        summary = {"processed": 0, "skipped": 0, "empty": 0, "corrupted": 0, "failed": 0, "removed": 0}
+        stale = set(manifest.stale_sources(file_hashes))
+        todo = [pdf for pdf in pdfs if pdf.name in stale]
+        summary["skipped"] = len(pdfs) - len(todo)
+        logger.info(f"{len(todo)} of {len(pdfs)} PDFs new or changed, processing with {self.workers} worker(s)")
+
+        try:
+            with CorpusWriter(self.output_dir) as writer:
+                for source in manifest.removed_sources(file_hashes):
+                    manifest.files.pop(source)
+                    writer.delete_paper(Path(source).stem)
+                    summary["removed"] += 1
+                for name, chunks, error, timings in self._process(todo):
+                    pdf = self.pdf_dir / name
+                    if isinstance(error, Exception):
+                        # Not processed (its worker died): keep the file and leave it out of the manifest
+                        logger.error(f"failed: {name} ({error!r})")
+                        summary["failed"] += 1
+                        continue
+                    if error is not None:
+                        logger.error(f"corrupted: {name} ({error})")
+                        summary["corrupted"] += 1
+                        self._delete(pdf)
+                        continue
+                    if not chunks:
+                        logger.warning(f"no text extracted: {name}")
+                        summary["empty"] += 1
+                    else:
+                        metadata = {
+                            "paper_id": pdf.stem,
+                            "filename": pdf.name,
+                            "path": str(pdf.resolve())
+                        }
+                        start = time.perf_counter()
+                        writer.add_paper(pdf.stem, metadata, chunks, file_hashes[name])
+                        timings["write"] = round((time.perf_counter() - start) * 1000, 2)
+                        (self.output_dir / f"{pdf.stem}.json").unlink(missing_ok=True)  # old format
+                        logger.info(f"corpus saved: {pdf.stem} ({len(chunks)} chunks) {timings}")
+                        summary["processed"] += 1
+                    for stage, ms in timings.items():
+                        self.timings.record(stage, ms / 1000)
+                    # Empty files are recorded too, so they are not parsed again until they change
+                    manifest.files[name] = {"hash": file_hashes[name], "chunk_count": len(chunks or [])}
+        finally:
+            manifest.save()
+
+        loader = CorpusLoader(self.output_dir)
+        if loader.dead_chunks() > loader.chunk_count():
+            # Mostly superseded versions of changed or removed papers on disk
+            CorpusWriter.compact(self.output_dir)
+        logger.info(f"corpus build finished: {summary}, stage timings: {self.timings.stats()}")
+        return summary
+
+    def _process(self, pdfs: list) -> Iterator[Tuple[str, Optional[List[str]], Optional[object], Dict[str, float]]]:
+        """
+        Results of `_process_pdf`. A file that could not be processed at all, because its worker died
+        (e.g. a crash inside MuPDF), comes back with the exception as `error` instead of a message.
+        """
+        if self.workers == 1:
+            for pdf in pdfs:
+                yield _process_pdf(pdf, self.chunker)
+            return
+        # A dead worker breaks the whole pool: files still pending are resubmitted to a new one
+        pending = list(pdfs)
+        while pending:
+            broken = yield from self._run_pool(pending, self.workers)
+            if not broken:
+                return
+            logger.warning(f"worker pool broke, resubmitting {len(broken)} PDF(s)")
+            if len(broken) < len(pending):
+                pending = [pdf for pdf, _ in broken]
                 continue
+            # No progress: give every remaining file a pool of its own to find the one that crashes
+            for pdf, _ in broken:
+                for crashed, error in (yield from self._run_pool([pdf], 1)):
+                    yield crashed.name, None, error, {}
+            return
 
-            chunks = self.chunker.chunk_text(text)
-            
-            metadata = {
-                "paper_id": pdf.stem,
-                "filename": pdf.name,
-                "path": str(pdf.resolve())
-            }
-
-            corpus_data = [{"text": chunk, "meta": metadata} for chunk in chunks]
-
-            # Save as json
-            out_file = self.output_dir/f"{pdf.stem}.json"
-            with open(out_file, "w", encoding="utf-8") as f:
-                json.dump(corpus_data, f, ensure_ascii=False, indent=2)
-            
-            logger.info(f"corpus saved: {out_file.name}")
+    def _run_pool(self, pdfs: list, workers: int):
+        """Yields results as files finish; returns the (pdf, exception) pairs left unprocessed by a broken pool."""
+        broken = []
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(self.chunk_size, self.chunk_overlap)
+        ) as pool:
+            futures = {pool.submit(_process_pdf, pdf): pdf for pdf in pdfs}
+            for future in as_completed(futures):
+                try:
+                    yield future.result()
+                except BrokenProcessPool as e:
+                    broken.append((futures[future], e))
+                except Exception as e:
+                    yield futures[future].name, None, e, {}
+        return broken
+
+    @staticmethod
+    def _delete(pdf: Path):
+        try:
+            pdf.unlink()
+            logger.warning(f"deleted: {pdf.name}")
+        except Exception as remove_err:
+            logger.error(f"failed not delete {pdf.name}: {remove_err}")
+
+# ===== HTTP session =====
+def make_session(pool_size: int = 8) -> requests.Session:
+    """Session whose connection pool is shared by all download threads (keep-alive per host)."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+# ===== Rate limiter =====
+class HostRateLimiter:
+    """Spaces requests to the same host at least `1 / rate` seconds apart, across threads."""
+    def __init__(self, rate: float = 1.0):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url: str):
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next.get(host, 0.0))
+            self._next[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+# ===== Download manifest =====
+class DownloadManifest:
+    """
+    JSON record of completed downloads, written atomically:
+    {"completed": {"<paper id>": {"file": "...", "bytes": n, "title": "..."}}}
+    """
+    def __init__(self, path: Path, flush_every: int = 50):
+        self.path = path
+        self.flush_every = flush_every
+        self.completed: Dict[str, dict] = {}
+        self._unsaved = 0
+        self._lock = threading.Lock()
+        if path.exists():
+            with open(path, "r", encoding="utf-8") as f:
+                self.completed = json.load(f).get("completed", {})
+
+    def __contains__(self, paper_id: str) -> bool:
+        return paper_id in self.completed
+
+    def add(self, paper_id: str, dest: Path, title: str = ""):
+        with self._lock:
+            self.completed[paper_id] = {"file": dest.name, "bytes": dest.stat().st_size, "title": title}
+            self._unsaved += 1
+            if self._unsaved >= self.flush_every:
+                self._save()
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"completed": self.completed}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self._unsaved = 0
 
 # ===== PDF downloader =====
 class PDFDownloader:
-    def __init__(self, retries: int = 3, sleep: int = 5, timeout: int = 60):
+    """
+    Downloads into `<dest>.part` and renames it to `dest` only once complete, so a file under its
+    final name is never truncated. An existing `.part` file is resumed with an HTTP Range request.
+    """
+    def __init__(self, retries: int = 3, sleep: int = 5, timeout: int = 60,
+                 session: Optional[requests.Session] = None, rate_limiter: Optional[HostRateLimiter] = None):
         self.retries = retries
         self.sleep = sleep
         self.timeout = timeout
+        self.session = session or requests.Session()
+        self.rate_limiter = rate_limiter
     
     def download(self, url: str, dest: Path) -> bool:
-        """Download a single PDF with retries and error handling"""
+        """Download a single PDF with retries, resuming partial downloads"""
+        part = dest.with_name(dest.name + ".part")
         for attempt in range(1, self.retries + 1):
+            offset = part.stat().st_size if part.exists() else 0
+            headers = {"Range": f"bytes={offset}-"} if offset else {}
+            if self.rate_limiter is not None:
+                self.rate_limiter.wait(url)
             try:
-                with requests.get(url, stream=True, timeout=self.timeout) as r:
-                    if r.status_code == 200 and "application/pdf" in r.headers.get("Content-Type", ""):
-                        with open(dest, "wb") as f:
+                with self.session.get(url, stream=True, timeout=self.timeout, headers=headers) as r:
+                    if r.status_code == 416 or (r.status_code == 206 and not r.headers.get("Content-Range", "").startswith(f"bytes {offset}-")):
+                        # Range not satisfiable or not honoured as asked: the partial file is unusable, start over
+                        logger.warning(f"cannot resume {dest.name}, restarting download")
+                        part.unlink(missing_ok=True)
+                        continue
+                    if r.status_code in (429, 500, 502, 503, 504):
+                        logger.error(f"server busy {r.status_code} {url} (attempt {attempt}/{self.retries})")
+                        retry_after = r.headers.get("Retry-After", "")
+                        if retry_after.isdigit() and attempt < self.retries:
+                            time.sleep(int(retry_after))
+                            continue
+                    elif r.status_code in (200, 206) and "application/pdf" in r.headers.get("Content-Type", ""):
+                        # 200 means the server ignored the Range header and sends the whole file again
+                        with open(part, "ab" if r.status_code == 206 else "wb") as f:
                             for chunk in r.iter_content(chunk_size=8192):
                                 if chunk:
                                     f.write(chunk)
+                        os.replace(part, dest)
                         return True
                     else:
                         logger.error(f"invalid response {r.status_code} {url}")
                         return False
-            except (ChunkedEncodingError, ConnectionError) as e:
-                logger.error(f"download error: {e} (attempt {attempt}/{self.retries})")
+            except (ChunkedEncodingError, ConnectionError, Timeout) as e:
+                logger.error(f"download error: {e} (attempt {attempt}/{self.retries}), {part.stat().st_size if part.exists() else 0} bytes kept")
             
             # Backoff before retry
             if attempt < self.retries:
@@ -145,44 +345,79 @@ class PDFDownloader:
 
 # ===== Arxiv downloader =====
 class ArxivDownloader:
-    def __init__(self, output_dir: Path = Path("papers_arxiv"), downloader: PDFDownloader = None):
+    """
+    Downloads arXiv search results into `output_dir`, `workers` files at a time, through one pooled
+    session and a per-host rate limit. Completed ids are recorded in `<output_dir>/manifest.json`,
+    so an interrupted run picks up where it stopped.
+    """
+    def __init__(self, output_dir: Path = Path("papers_arxiv"), downloader: PDFDownloader = None,
+                 workers: int = 1, rate: float = 1.0):
         self.output_dir = output_dir
         self.output_dir.mkdir(parents=True, exist_ok=True)
-        self.downloader = downloader or PDFDownloader()
+        self.workers = max(1, workers)
+        self.downloader = downloader or PDFDownloader(
+            session=make_session(pool_size=self.workers),
+            rate_limiter=HostRateLimiter(rate)
+        )
+        self.manifest = DownloadManifest(self.output_dir / "manifest.json")
         self.client = arxiv.Client()
 
-    def download_papers(self, query: str = "geoai", max_results: int =200):
+    def download_papers(self, query: str = "geoai", max_results: int =200) -> Dict[str, int]:
         search = arxiv.Search(
             query=query, 
             max_results=max_results, 
             sort_by=arxiv.SortCriterion.Relevance
         )
+        papers = ((result.get_short_id(), result.pdf_url, result.title) for result in self.client.results(search=search))
+        return self.download_all(papers)
 
-        for result in self.client.results(search=search):
-            paper_id = result.get_short_id()
-            pdf_url = result.pdf_url
-            title = result.title
-            dest = self.output_dir / f"{paper_id}.pdf"
-            
-            if dest.exists():
-                logger.warning(f"already downloaded: {paper_id}")
-                continue
-                
-            logger.info(f'downloading: {paper_id} {title}')
-            success = self.downloader.download(pdf_url, dest)
-            if not success:
-                logger.warning(f"skipped {paper_id}")
-                time.sleep(2)
+    def download_all(self, papers: Iterable[Tuple[str, str, str]]) -> Dict[str, int]:
+        """Download (paper id, pdf url, title) items; search results are consumed lazily as workers free up."""
+        summary = {"downloaded": 0, "skipped": 0, "failed": 0}
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                pending = set()
+                for paper_id, pdf_url, title in papers:
+                    dest = self.output_dir / f"{paper_id}.pdf"
+                    if paper_id in self.manifest or dest.exists():
+                        # Files only get their final name once complete, so an existing one can be trusted
+                        if paper_id not in self.manifest:
+                            self.manifest.add(paper_id, dest, title)
+                        logger.warning(f"already downloaded: {paper_id}")
+                        summary["skipped"] += 1
+                        continue
+                    if len(pending) >= self.workers * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        self._collect(done, summary)
+                    pending.add(pool.submit(self._download_one, paper_id, pdf_url, title, dest))
+                self._collect(wait(pending).done, summary)
+        finally:
+            self.manifest.save()
+        logger.info(f"download finished: {summary}")
+        return summary
+
+    def _download_one(self, paper_id: str, pdf_url: str, title: str, dest: Path) -> bool:
+        logger.info(f'downloading: {paper_id} {title}')
+        if not self.downloader.download(pdf_url, dest):
+            logger.warning(f"skipped {paper_id}")
+            return False
+        self.manifest.add(paper_id, dest, title)
+        return True
+
+    @staticmethod
+    def _collect(done, summary: Dict[str, int]):
+        for future in done:
+            summary["downloaded" if future.result() else "failed"] += 1
 
 def main():
     INPUT_DIR = Path("papers_arxiv")
     OUTPUT_DIR = Path("papers_text")
 
     # Download papers from arxiv
-    arxiv_downloader = ArxivDownloader(INPUT_DIR)
+    arxiv_downloader = ArxivDownloader(INPUT_DIR, workers=4)
     arxiv_downloader.download_papers(query="computer vision", max_results=50)
 
-    builder = CorpusBuilder(pdf_dir=INPUT_DIR, output_dir=OUTPUT_DIR)
+    builder = CorpusBuilder(pdf_dir=INPUT_DIR, output_dir=OUTPUT_DIR, workers=4)
     builder.build_corpus()
 
 if __name__ == "__main__":
@@ -0,0 +1,464 @@
+import json
+import math
+import os
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from utils.logger import get_logger
+
+logger = get_logger(name="local_vector_store", log_file="logs/local_vector_store.log")
+
+class IVFIndex:
+    """
+    Inverted-file index: vectors are bucketed by their nearest k-means centroid,
+    and a search only scans the buckets of the `nprobe` closest centroids.
+    """
+    def __init__(self, centroids: np.ndarray, assignments: np.ndarray):
+        self.centroids = centroids
+        self.assignments = assignments
+        self._order: Optional[np.ndarray] = None
+        self._offsets: Optional[np.ndarray] = None
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, nlist: Optional[int] = None, iterations: int = 10, seed: int = 0) -> "IVFIndex":
+        n = len(vectors)
+        nlist = min(n, nlist or max(1, int(math.sqrt(n))))
+        rng = np.random.default_rng(seed)
+        sample = vectors[rng.choice(n, size=min(n, nlist * 32), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+
+        # Spherical k-means on a sample: vectors are unit length, so nearest centroid = highest dot product
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            order = np.argsort(labels, kind="stable")
+            present, starts = np.unique(labels[order], return_index=True)
+            sums = np.add.reduceat(sample[order], starts, axis=0)
+            centroids[present] = LocalVectorStore._normalize(sums)
+
+        index = cls(centroids.astype(np.float32), np.empty(0, dtype=np.int32))
+        index.add(vectors)
+        return index
+
+    def assign(self, vectors: np.ndarray, block: int = 65536) -> np.ndarray:
+        return np.concatenate([
+            np.argmax(vectors[i:i + block] @ self.centroids.T, axis=1).astype(np.int32)
+            for i in range(0, len(vectors), block)
+        ]) if len(vectors) else np.empty(0, dtype=np.int32)
+
+    def add(self, vectors: np.ndarray):
+        self.assignments = np.concatenate([self.assignments, self.assign(vectors)])
+        self._order = None
+
+    def candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        if self._order is None:
+            # Bucket layout is rebuilt lazily, once per batch of additions
+            self._order = np.argsort(self.assignments, kind="stable").astype(np.int64)
+            self._offsets = np.searchsorted(self.assignments[self._order], np.arange(len(self.centroids) + 1))
+        nprobe = min(nprobe, len(self.centroids))
+        probes = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        return np.concatenate([self._order[self._offsets[c]:self._offsets[c + 1]] for c in probes])
+
+class MetadataIndex:
+    """
+    Inverted index over one metadata field: each value maps to its sorted rows,
+    and numeric values are also kept sorted so range conditions are two binary searches.
+    """
+    def __init__(self, values: Sequence[Any]):
+        postings: Dict[Any, List[int]] = {}
+        numeric = []
+        for row, value in enumerate(values):
+            if value is None:
+                continue
+            postings.setdefault(value, []).append(row)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                numeric.append((value, row))
+        self.postings = {value: np.asarray(rows, dtype=np.int64) for value, rows in postings.items()}
+        self.present = np.sort(np.concatenate(list(self.postings.values()))) if postings else np.empty(0, dtype=np.int64)
+        numeric.sort()
+        self.sorted_values = np.asarray([value for value, _ in numeric], dtype=np.float64)
+        self.sorted_rows = np.asarray([row for _, row in numeric], dtype=np.int64)
+
+    def rows(self, condition: Any) -> np.ndarray:
+        if not isinstance(condition, dict):
+            return self.postings.get(condition, np.empty(0, dtype=np.int64))
+        result = None
+        for op, operand in condition.items():
+            if op == "$eq":
+                rows = self.postings.get(operand, np.empty(0, dtype=np.int64))
+            elif op == "$in":
+                rows = self._union([self.postings.get(value, np.empty(0, dtype=np.int64)) for value in operand])
+            elif op == "$ne":
+                rows = np.setdiff1d(self.present, self.postings.get(operand, np.empty(0, dtype=np.int64)), assume_unique=True)
+            elif op == "$nin":
+                rows = np.setdiff1d(self.present, self.rows({"$in": operand}), assume_unique=True)
+            elif op in ("$gt", "$gte", "$lt", "$lte"):
+                side = "right" if op in ("$gt", "$lte") else "left"
+                cut = np.searchsorted(self.sorted_values, operand, side=side)
+                rows = np.sort(self.sorted_rows[cut:] if op in ("$gt", "$gte") else self.sorted_rows[:cut])
+            else:
+                raise ValueError(f"unsupported filter operator '{op}'")
+            result = rows if result is None else np.intersect1d(result, rows, assume_unique=True)
+        return result if result is not None else self.present
+
+    @staticmethod
+    def _union(parts: List[np.ndarray]) -> np.ndarray:
+        return np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process vector store backed by a NumPy matrix of unit-normalized embeddings.
+
+    Collections smaller than `ivf_threshold` are searched exactly with one matrix-vector product.
+    Larger ones get an IVF index and only the `nprobe` nearest buckets are scored.
+    Scores are cosine distances (lower is better), like Chroma's.
+
+    Metadata filters (Chroma `where` syntax) are answered from per-field inverted indexes,
+    and only the matching rows are scanned, exactly.
+
+    Saved collections are memory-mapped on load, so uvicorn workers share one copy through the page cache.
+    With dtype "float16" or "int8" the scan runs over a scalar-quantized copy of the matrix,
+    and with `rescore` the top `k * rescore_factor` candidates are re-ranked with the float32 vectors.
+    """
+    DTYPES = ("float32", "float16", "int8")
+
+    def __init__(self, embedding_function: Embeddings, persist_path: Optional[Path] = None,
+                 ivf_threshold: int = 50_000, nprobe: int = 8, dtype: str = "float32",
+                 rescore: bool = True, rescore_factor: int = 4, mmap: bool = True):
+        if dtype not in self.DTYPES:
+            raise ValueError(f"unsupported dtype '{dtype}', expected one of {self.DTYPES}")
+        self._embedding = embedding_function
+        self.persist_path = persist_path
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self.dtype = dtype
+        self.rescore = rescore
+        self.rescore_factor = rescore_factor
+        self.mmap = mmap
+        self._ids: List[str] = []
+        self._texts: List[str] = []
+        self._metadatas: List[dict] = []
+        self._rows: Dict[str, int] = {}
+        self._vectors: Optional[np.ndarray] = None
+        self._buffer: Optional[np.ndarray] = None  # over-allocated storage that _vectors is a view of, when in RAM
+        self._codes: Optional[np.ndarray] = None  # quantized copy of _vectors, None when stale or float32
+        self._scale: Optional[np.ndarray] = None  # per-dimension int8 scale
+        self._ivf: Optional[IVFIndex] = None
+        self._writes = 0  # bumped on every add or delete, so a concurrently trained IVF index can be discarded
+        self._meta_indexes: Dict[str, MetadataIndex] = {}  # built lazily per field, dropped on writes
+        self._lock = threading.RLock()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    # === Writes ===
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        return self.add_embeddings(texts, self._embedding.embed_documents(texts), metadatas, ids)
+
+    def add_embeddings(self, texts: Sequence[str], embeddings: Sequence[Sequence[float]],
+                       metadatas: Optional[Sequence[dict]] = None, ids: Optional[Sequence[str]] = None) -> List[str]:
+        ids = list(ids) if ids is not None else [os.urandom(16).hex() for _ in texts]
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        vectors = self._normalize(np.asarray(embeddings, dtype=np.float32))
+        latest = {doc_id: i for i, doc_id in enumerate(ids)}
+        if len(latest) < len(ids):
+            # Repeated ids within one call: the last occurrence wins
+            keep = sorted(latest.values())
+            texts, metadatas, ids, vectors = [texts[i] for i in keep], [metadatas[i] for i in keep], [ids[i] for i in keep], vectors[keep]
+
+        with self._lock:
+            self._make_writable()
+            self._meta_indexes = {}
+            self._writes += 1
+            new_rows = []
+            for i, doc_id in enumerate(ids):
+                row = self._rows.get(doc_id)
+                if row is not None:
+                    # Upsert: overwrite in place
+                    self._texts[row], self._metadatas[row] = texts[i], metadatas[i]
+                    self._vectors[row] = vectors[i]
+                    continue
+                self._rows[doc_id] = len(self._ids)
+                self._ids.append(doc_id)
+                self._texts.append(texts[i])
+                self._metadatas.append(metadatas[i])
+                new_rows.append(i)
+
+            appended = vectors[new_rows]
+            self._append_vectors(appended)
+            if self._ivf is not None and len(new_rows) < len(ids):
+                self._ivf = None  # overwritten rows may belong to another bucket now
+            elif self._ivf is not None:
+                self._ivf.add(appended)
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        with self._lock:
+            drop = {self._rows[doc_id] for doc_id in ids or [] if doc_id in self._rows}
+            if not drop:
+                return False
+            self._make_writable()
+            self._meta_indexes = {}
+            self._writes += 1
+            keep = [row for row in range(len(self._ids)) if row not in drop]
+            self._ids = [self._ids[row] for row in keep]
+            self._texts = [self._texts[row] for row in keep]
+            self._metadatas = [self._metadatas[row] for row in keep]
+            self._vectors = self._vectors[keep]
+            self._buffer = None
+            self._rows = {doc_id: row for row, doc_id in enumerate(self._ids)}
+            self._ivf = None
+        return True
+
+    def update_metadata(self, ids: Sequence[str], metadatas: Sequence[dict]):
+        """Merge keys into the metadata of existing documents, like Chroma's `update`; unknown ids are ignored."""
+        with self._lock:
+            self._meta_indexes = {}
+            for doc_id, metadata in zip(ids, metadatas):
+                row = self._rows.get(doc_id)
+                if row is not None:
+                    self._metadatas[row] = {**self._metadatas[row], **metadata}
+
+    # === Reads ===
+    def get_by_ids(self, ids: Sequence[str], /) -> List[Document]:
+        return [self._document(self._rows[doc_id]) for doc_id in ids if doc_id in self._rows]
+
+    def get(self, ids: Optional[Sequence[str]] = None, where: Optional[dict] = None, limit: Optional[int] = None,
+            offset: int = 0, **kwargs: Any) -> dict:
+        """Chroma-compatible `get`: documents by id and/or `where` clause, in insertion order."""
+        with self._lock:
+            rows = self._subset_rows(ids, where)
+            rows = (range(len(self._ids)) if rows is None else rows.tolist())[offset:None if limit is None else offset + limit]
+            return {
+                "ids": [self._ids[row] for row in rows],
+                "documents": [self._texts[row] for row in rows],
+                "metadatas": [self._metadatas[row] for row in rows],
+            }
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self._embedding.embed_query(query), k, **kwargs)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, **kwargs)]
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        query = self._normalize(np.asarray(embedding, dtype=np.float32)[None, :])[0]
+        rows, scores = self._search(query, k, kwargs.get("ids"), kwargs.get("filter"))
+        return [(self._document(row), 1.0 - float(score)) for row, score in zip(rows, scores)]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        return lambda distance: 1.0 - distance
+
+    def _search(self, query: np.ndarray, k: int, ids: Optional[Sequence[str]] = None,
+                where: Optional[dict] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k rows for the query; `ids` and `where` restrict the search to a subset, which is scanned exactly."""
+        if ids is None and not where:
+            self._ensure_ivf()
+        with self._lock:
+            vectors, codes, scale = self._vectors, self._codes, self._scale
+            if vectors is None or not len(vectors):
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            if ids is not None or where:
+                rows = self._subset_rows(ids, where)
+            elif len(vectors) >= self.ivf_threshold and self._ivf is not None:
+                rows = self._ivf.candidates(query, self.nprobe)
+            else:
+                rows = None  # the index was invalidated by a concurrent write: scan exactly
+
+        if codes is None:
+            return self._top_k(rows, self._scores(vectors, rows, query), k)
+
+        # Scan the compact copy, then optionally re-rank a wider candidate set at full precision
+        approx_query = query * scale if scale is not None else query
+        if not self.rescore:
+            return self._top_k(rows, self._scores(codes, rows, approx_query), k)
+        candidates, _ = self._top_k(rows, self._scores(codes, rows, approx_query), k * self.rescore_factor)
+        candidates = np.sort(candidates)  # sequential page access on the memory-mapped float32 matrix
+        return self._top_k(candidates, np.asarray(vectors[candidates], dtype=np.float32) @ query, k)
+
+    def _subset_rows(self, ids: Optional[Sequence[str]], where: Optional[dict]) -> Optional[np.ndarray]:
+        """Sorted rows selected by ids and/or a `where` clause; None means every row."""
+        rows = None
+        if ids is not None:
+            rows = np.unique(np.fromiter((self._rows[i] for i in ids if i in self._rows), dtype=np.int64))
+        if where:
+            matched = self._where_rows(where)
+            rows = matched if rows is None else np.intersect1d(rows, matched, assume_unique=True)
+        return rows
+
+    def _where_rows(self, where: dict) -> np.ndarray:
+        result = None
+        for key, condition in where.items():
+            if key == "$and":
+                rows = self._where_rows(condition[0])
+                for clause in condition[1:]:
+                    rows = np.intersect1d(rows, self._where_rows(clause), assume_unique=True)
+            elif key == "$or":
+                rows = MetadataIndex._union([self._where_rows(clause) for clause in condition])
+            else:
+                index = self._meta_indexes.get(key)
+                if index is None:
+                    index = self._meta_indexes[key] = MetadataIndex([metadata.get(key) for metadata in self._metadatas])
+                rows = index.rows(condition)
+            result = rows if result is None else np.intersect1d(result, rows, assume_unique=True)
+        return result if result is not None else np.arange(len(self._ids))
+
+    @staticmethod
+    def _scores(matrix: np.ndarray, rows: Optional[np.ndarray], query: np.ndarray, block: int = 4096) -> np.ndarray:
+        """
+        Dot products of the query with the given rows (all rows when None).
+        Quantized rows are converted to float32 block by block to keep temporary memory bounded.
+        """
+        if rows is None and matrix.dtype == np.float32:
+            return matrix @ query
+        total = len(matrix) if rows is None else len(rows)
+        if not total:
+            return np.empty(0, dtype=np.float32)
+        return np.concatenate([
+            np.asarray(matrix[i:i + block] if rows is None else matrix[rows[i:i + block]], dtype=np.float32) @ query
+            for i in range(0, total, block)
+        ])
+
+    @staticmethod
+    def _top_k(rows: Optional[np.ndarray], scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Best k (row, score) pairs, best first; `rows` maps score positions to rows (identity when None)."""
+        k = min(k, len(scores))
+        if k == 0:
+            return np.empty(0, dtype=np.int64), scores[:0]
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return (top if rows is None else rows[top]), scores[top]
+
+    def _make_writable(self):
+        """Copy a memory-mapped matrix into RAM before modifying it; the quantized copy becomes stale."""
+        if isinstance(self._vectors, np.memmap):
+            self._vectors = np.array(self._vectors)
+        self._codes, self._scale = None, None
+
+    def _append_vectors(self, appended: np.ndarray):
+        """Append rows into a buffer whose capacity doubles, so a build copies the matrix O(log n) times."""
+        size = 0 if self._vectors is None else len(self._vectors)
+        needed = size + len(appended)
+        if self._buffer is None or len(self._buffer) < needed:
+            buffer = np.empty((max(needed, 2 * size, 1024), appended.shape[1]), dtype=np.float32)
+            if size:
+                buffer[:size] = self._vectors
+            self._buffer = buffer
+        self._buffer[size:needed] = appended
+        self._vectors = self._buffer[:needed]
+
+    def _ensure_ivf(self) -> Optional[IVFIndex]:
+        """
+        Train the IVF index once the store reaches `ivf_threshold`. Training runs outside the lock so searches
+        are not blocked; its result is dropped if the vectors were written meanwhile.
+        """
+        with self._lock:
+            ivf, vectors, writes = self._ivf, self._vectors, self._writes
+        if ivf is not None or vectors is None or len(vectors) < self.ivf_threshold:
+            return ivf
+        logger.info(f"training IVF index over {len(vectors)} vectors")
+        ivf = IVFIndex.train(vectors)
+        with self._lock:
+            if self._writes != writes:
+                return None
+            self._ivf = ivf
+        return ivf
+
+    def _quantize(self):
+        if self.dtype == "float16":
+            self._codes, self._scale = self._vectors.astype(np.float16), None
+        elif self.dtype == "int8":
+            scale = np.abs(self._vectors).max(axis=0) / 127.0
+            scale = np.where(scale == 0, 1.0, scale).astype(np.float32)
+            self._codes = np.clip(np.rint(self._vectors / scale), -127, 127).astype(np.int8)
+            self._scale = scale
+
+    def _document(self, row: int) -> Document:
+        return Document(id=self._ids[row], page_content=self._texts[row], metadata=self._metadatas[row])
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1.0, norms)
+
+    # === Persistence ===
+    def save(self, path: Optional[Path] = None):
+        path = Path(path or self.persist_path)
+        path.mkdir(parents=True, exist_ok=True)
+        # Trained here rather than on the first query, so loading workers get the index from ivf.npz
+        self._ensure_ivf()
+        with self._lock:
+            vectors = self._vectors if self._vectors is not None else np.empty((0, 0), dtype=np.float32)
+            self._atomic_write(path / "vectors.npy", lambda f: np.save(f, vectors))
+            if self.dtype != "float32" and self._vectors is not None:
+                if self._codes is None:
+                    self._quantize()
+                self._atomic_write(path / f"vectors.{self.dtype}.npy", lambda f: np.save(f, self._codes))
+                if self._scale is not None:
+                    self._atomic_write(path / "scale.npy", lambda f: np.save(f, self._scale))
+            self._atomic_write(path / "docs.jsonl", lambda f: f.write("".join(
+                json.dumps({"id": i, "text": t, "meta": m}, ensure_ascii=False) + "\n"
+                for i, t, m in zip(self._ids, self._texts, self._metadatas)
+            ).encode("utf-8")))
+            ivf_path = path / "ivf.npz"
+            if self._ivf is not None:
+                self._atomic_write(ivf_path, lambda f: np.savez(f, centroids=self._ivf.centroids, assignments=self._ivf.assignments))
+            elif ivf_path.exists():
+                ivf_path.unlink()
+        logger.info(f"saved {len(self._ids)} vectors to {path}")
+
+    @classmethod
+    def load(cls, path: Path, embedding_function: Embeddings, **kwargs: Any) -> "LocalVectorStore":
+        store = cls(embedding_function, persist_path=path, **kwargs)
+        if not (path / "docs.jsonl").exists():
+            return store
+        with open(path / "docs.jsonl", "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                store._rows[record["id"]] = len(store._ids)
+                store._ids.append(record["id"])
+                store._texts.append(record["text"])
+                store._metadatas.append(record["meta"])
+        if not store._ids:
+            return store
+        mmap_mode = "r" if store.mmap else None
+        store._vectors = np.load(path / "vectors.npy", mmap_mode=mmap_mode)
+        codes_path = path / f"vectors.{store.dtype}.npy"
+        if store.dtype != "float32" and codes_path.exists():
+            store._codes = np.load(codes_path, mmap_mode=mmap_mode)
+            store._scale = np.load(path / "scale.npy") if store.dtype == "int8" else None
+        elif store.dtype != "float32":
+            logger.warning(f"no {store.dtype} copy saved in {path}, quantizing in memory")
+            store._quantize()
+        if (path / "ivf.npz").exists():
+            ivf = np.load(path / "ivf.npz")
+            store._ivf = IVFIndex(ivf["centroids"], ivf["assignments"])
+        logger.info(f"loaded {len(store._ids)} vectors from {path}")
+        return store
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   ids: Optional[List[str]] = None, persist_path: Optional[Path] = None, **kwargs: Any) -> "LocalVectorStore":
+        store = cls(embedding, persist_path=persist_path, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+    @staticmethod
+    def _atomic_write(path: Path, write: Callable):
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
@@ -0,0 +1,173 @@
+import asyncio
+import heapq
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from local_vector_store import LocalVectorStore
+from utils.logger import get_logger
+
+
+logger = get_logger(name="sharded_vector_store", log_file="logs/sharded_vector_store.log")
+
+def shard_of(key: str, shards: int) -> int:
+    """Stable shard number of a routing key (Python's hash() is salted per process)."""
+    return zlib.crc32(key.encode("utf-8")) % shards
+
+class ShardedVectorStore(VectorStore):
+    """
+    One logical collection partitioned across several vector stores (Chroma collections or local stores).
+
+    Chunks are routed by a hash of their id ("hash", evenly sized shards) or of their source file
+    ("source", a file's chunks stay together, so per-file reads and rebuilds touch one shard).
+    Searches embed the query once, run on every shard concurrently and merge the per-shard top-k by distance;
+    all shards must use the same backend and distance.
+    """
+    SHARD_BY = ("hash", "source")
+
+    def __init__(self, shards: Sequence[VectorStore], shard_by: str = "hash", max_workers: Optional[int] = None):
+        if not shards:
+            raise ValueError("a sharded store needs at least one shard")
+        if shard_by not in self.SHARD_BY:
+            raise ValueError(f"unknown shard key '{shard_by}', expected one of {self.SHARD_BY}")
+        self.shards = list(shards)
+        self.shard_by = shard_by
+        self._pool = ThreadPoolExecutor(max_workers=max_workers or len(self.shards), thread_name_prefix="shard")
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.shards[0].embeddings
+
+    def __len__(self) -> int:
+        return sum(self._count(shard) for shard in self.shards)
+
+    def shard_index(self, doc_id: str, metadata: Optional[dict] = None) -> int:
+        key = (metadata or {}).get("source", doc_id) if self.shard_by == "source" else doc_id
+        return shard_of(key, len(self.shards))
+
+    def locate(self, ids: Sequence[str]) -> Dict[int, List[int]]:
+        """shard number -> positions in `ids` of the documents stored on that shard"""
+        positions: Dict[int, List[int]] = {}
+        if self.shard_by == "hash":
+            for i, doc_id in enumerate(ids):
+                positions.setdefault(self.shard_index(doc_id), []).append(i)
+            return positions
+        # Source routing cannot be derived from the id: ask every shard which ids it holds
+        found = self._map(lambda shard: set(shard.get(ids=list(ids), include=[])["ids"]))
+        for index, held in enumerate(found):
+            hits = [i for i, doc_id in enumerate(ids) if doc_id in held]
+            if hits:
+                positions[index] = hits
+        return positions
+
+    # === Writes ===
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        ids = list(ids) if ids is not None else [os.urandom(16).hex() for _ in texts]
+        groups: Dict[int, List[int]] = {}
+        for i, (doc_id, metadata) in enumerate(zip(ids, metadatas)):
+            groups.setdefault(self.shard_index(doc_id, metadata), []).append(i)
+        list(self._pool.map(
+            lambda item: self.shards[item[0]].add_texts(
+                [texts[i] for i in item[1]], metadatas=[metadatas[i] for i in item[1]], ids=[ids[i] for i in item[1]]
+            ),
+            groups.items()
+        ))
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        ids = list(ids or [])
+        for index, positions in self.locate(ids).items():
+            self.shards[index].delete(ids=[ids[i] for i in positions])
+        return True
+
+    # === Reads ===
+    def get_by_ids(self, ids: Sequence[str], /) -> List[Document]:
+        ids = list(ids)
+        located = list(self.locate(ids).items())
+        found = self._pool.map(lambda item: self.shards[item[0]].get_by_ids([ids[i] for i in item[1]]), located)
+        by_id = {doc.id: doc for doc in chain.from_iterable(found)}
+        return [by_id[doc_id] for doc_id in ids if doc_id in by_id]
+
+    def get(self, ids: Optional[Sequence[str]] = None, where: Optional[dict] = None, limit: Optional[int] = None,
+            offset: int = 0, **kwargs: Any) -> dict:
+        """Chroma-compatible `get` over all shards, in shard order; paging skips whole shards by their size."""
+        result = {"ids": [], "documents": [], "metadatas": []}
+        for shard in self.shards:
+            if limit is not None and len(result["ids"]) >= limit:
+                break
+            if ids is None and where is None:
+                size = self._count(shard)
+                if offset >= size:
+                    offset -= size
+                    continue
+                wanted = None if limit is None else limit - len(result["ids"])
+                part = shard.get(limit=wanted, offset=offset, include=["documents", "metadatas"])
+                offset = 0
+            else:
+                part = shard.get(ids=list(ids) if ids is not None else None, where=where, include=["documents", "metadatas"])
+                skipped = min(offset, len(part["ids"]))
+                offset -= skipped
+                part = {key: part[key][skipped:] for key in result}
+            for key in result:
+                result[key].extend(part[key])
+        if limit is not None:
+            result = {key: values[:limit] for key, values in result.items()}
+        return result
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self.embeddings.embed_query(query), k, **kwargs)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, **kwargs)]
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self._merge(self._map(lambda shard: self._search_shard(shard, embedding, k, kwargs)), k)
+
+    async def asimilarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in await self.asimilarity_search_with_score(query, k, **kwargs)]
+
+    async def asimilarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        embedding = await self.embeddings.aembed_query(query)
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(*(
+            loop.run_in_executor(self._pool, self._search_shard, shard, embedding, k, kwargs) for shard in self.shards
+        ))
+        return self._merge(results, k)
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        return self.shards[0]._select_relevance_score_fn()
+
+    @staticmethod
+    def _search_shard(shard: VectorStore, embedding: List[float], k: int, kwargs: dict) -> List[Tuple[Document, float]]:
+        if isinstance(shard, LocalVectorStore):
+            return shard.similarity_search_by_vector_with_score(embedding, k, **kwargs)
+        # Chroma: despite the name, these are raw distances like similarity_search_with_score's
+        return shard.similarity_search_by_vector_with_relevance_scores(embedding, k, **kwargs)
+
+    @staticmethod
+    def _merge(results: Iterable[List[Tuple[Document, float]]], k: int) -> List[Tuple[Document, float]]:
+        # Every shard returns distances (lower is better), so the global top-k is the k smallest
+        return heapq.nsmallest(k, chain.from_iterable(results), key=lambda pair: pair[1])
+
+    def _map(self, fn: Callable[[VectorStore], Any]) -> List[Any]:
+        return list(self._pool.map(fn, self.shards))
+
+    @staticmethod
+    def _count(shard: VectorStore) -> int:
+        return len(shard) if isinstance(shard, LocalVectorStore) else shard._collection.count()
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   **kwargs: Any) -> "ShardedVectorStore":
+        raise NotImplementedError("sharded collections are created by VectorStoreBuilder with shards > 1")
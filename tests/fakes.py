@@ -0,0 +1,12 @@
+from typing import List
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+
+class CountingRetriever(BaseRetriever):
+    """Returns three documents echoing the query and counts how often it was called."""
+    calls: int = 0
+
+    def _get_relevant_documents(self, query: str, *, run_manager) -> List[Document]:
+        self.calls += 1
+        return [Document(page_content=f"{query} {i}") for i in range(3)]
@@ -0,0 +1,65 @@
+from langchain_core.embeddings import FakeEmbeddings
+
+from bm25_index import BM25Index, tokenize
+from local_vector_store import LocalVectorStore
+from utils.hybrid_retriever import HybridRetriever
+
+
+TEXTS = {
+    "a": "We fine-tune GPT-4 on arXiv 2301.12345 and report results in Eq_3.",
+    "b": "Attention is all you need: the transformer architecture.",
+    "c": "Retrieval augmented generation combines a retriever with a generator.",
+    "d": "Dense retrieval with dual encoders outperforms BM25 on some benchmarks.",
+}
+
+def _index(path=None) -> BM25Index:
+    index = BM25Index(path)
+    index.add(list(TEXTS), list(TEXTS.values()))
+    return index
+
+def test_tokenize_keeps_identifiers_and_their_parts():
+    tokens = tokenize("GPT-4 and arXiv 2301.12345")
+
+    assert "gpt-4" in tokens and "gpt" in tokens
+    assert "2301.12345" in tokens and "12345" in tokens
+
+def test_exact_identifier_ranks_first():
+    index = _index()
+
+    assert index.search("2301.12345", k=2)[0][0] == "a"
+    assert index.search("gpt-4 results", k=2)[0][0] == "a"
+    assert {doc_id for doc_id, _ in index.search("retrieval", k=4)} == {"c", "d"}
+
+def test_delete_and_upsert_survive_save_and_load(tmp_path):
+    index = _index(tmp_path / "bm25")
+    index.save()
+    index.delete(["b"])
+    index.add(["c"], ["completely new text about transformer models"])
+    index.save()
+
+    loaded = BM25Index.load(tmp_path / "bm25")
+
+    assert len(loaded) == 3
+    assert [doc_id for doc_id, _ in loaded.search("transformer", k=5)] == ["c"]
+    assert loaded.search("generator", k=5) == []
+    loaded.add(["e"], ["transformer transformer transformer"])
+    assert loaded.search("transformer", k=5)[0][0] == "e"
+
+def test_hybrid_retriever_finds_lexical_only_matches():
+    store = LocalVectorStore(FakeEmbeddings(size=16))
+    store.add_texts(list(TEXTS.values()), ids=list(TEXTS))
+    # Vector scores of fake embeddings are noise; an exact lexical match must outweigh them
+    retriever = HybridRetriever(vectorstore=store, lexical_index=_index(), search_k=2, alpha=0.3)
+
+    docs = retriever.invoke("2301.12345")
+
+    assert docs[0].id == "a"
+
+def test_hybrid_retriever_prefilter_restricts_vector_search():
+    store = LocalVectorStore(FakeEmbeddings(size=16))
+    store.add_texts(list(TEXTS.values()), ids=list(TEXTS))
+    retriever = HybridRetriever(vectorstore=store, lexical_index=_index(), search_k=4, prefilter=2)
+
+    docs = retriever.invoke("dense retrieval")
+
+    assert {doc.id for doc in docs} == {"c", "d"}
@@ -0,0 +1,146 @@
+import asyncio
+import json
+import re
+from types import SimpleNamespace
+import pytest
+from langchain_core.embeddings import FakeEmbeddings
+
+from agents.classifier_agent import ClassifierAgent
+from api.scheduler import RequestScheduler
+from local_vector_store import LocalVectorStore
+from utils.classification_job import ClassificationJob
+
+
+class BatchLLM:
+    """Labels documents mentioning "protein" as Biology and everything else as Physics."""
+    def __init__(self, fail_after: int = None):
+        self.prompts = []
+        self.fail_after = fail_after
+
+    async def ainvoke(self, prompt: str):
+        if self.fail_after is not None and len(self.prompts) >= self.fail_after:
+            raise ConnectionError("ollama went away")
+        self.prompts.append(prompt)
+        documents = re.split(r"\[(\d+)\]\n", prompt)[1:]
+        if not documents:
+            label = "Biology" if "protein" in prompt.split("Document (")[-1] else "Physics"
+            return SimpleNamespace(content=json.dumps({"discipline": label}), response_metadata={})
+        reply = [
+            {"id": int(number), "discipline": "Biology" if "protein" in text else "Physics"}
+            for number, text in zip(documents[::2], documents[1::2])
+        ]
+        return SimpleNamespace(content="Here you go:\n" + json.dumps(reply), response_metadata={})
+
+class Builder:
+    """The parts of VectorStoreBuilder the job uses."""
+    def __init__(self, persist_dir):
+        self.persist_dir = persist_dir
+        self.versions = 0
+
+    def update_metadata(self, vector_db, ids, metadatas):
+        vector_db.update_metadata(ids, metadatas)
+
+    def _persist(self, vector_db):
+        pass
+
+    def bump_version(self, collection_name):
+        self.versions += 1
+
+def _store(files: int = 10, chunks: int = 3) -> LocalVectorStore:
+    store = LocalVectorStore(FakeEmbeddings(size=8))
+    texts, metadatas = [], []
+    for f in range(files):
+        topic = "protein folding" if f % 2 else "quantum fields"
+        for c in range(chunks):
+            texts.append(f"file {f} chunk {c} about {topic}")
+            metadatas.append({"source": f"paper{f}.pdf"})
+    store.add_texts(texts, metadatas=metadatas)
+    return store
+
+def test_labels_every_chunk_per_source_with_batched_prompts(tmp_path):
+    store, llm, builder = _store(), BatchLLM(), Builder(tmp_path)
+    job = ClassificationJob(ClassifierAgent(llm), builder, batch_size=4, max_concurrency=2, page_size=7)
+
+    summary = asyncio.run(job.run(store))
+
+    assert summary["classified"] == 10
+    assert summary["chunks_updated"] == 30
+    assert summary["labels"] == {"Biology": 5, "Physics": 5}
+    assert len(llm.prompts) == 3  # 10 files in batches of 4
+    biology = store.get(where={"discipline": "Biology"})
+    assert len(biology["ids"]) == 15
+    assert all("protein" in text for text in biology["documents"])
+    assert builder.versions == 1
+
+def test_interrupted_job_resumes_from_checkpoint(tmp_path):
+    store, builder = _store(), Builder(tmp_path)
+    job = ClassificationJob(ClassifierAgent(BatchLLM(fail_after=1)), builder, batch_size=4, max_concurrency=1)
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(job.run(store))
+    assert len(job.load_checkpoint()) == 4
+
+    llm = BatchLLM()
+    job = ClassificationJob(ClassifierAgent(llm), builder, batch_size=4, max_concurrency=1)
+    summary = asyncio.run(job.run(store))
+
+    assert summary["skipped"] == 4
+    assert summary["classified"] == 6
+    assert len(llm.prompts) == 2
+    assert all(meta.get("discipline") for meta in store.get()["metadatas"])
+
+def test_pages_through_the_collection_and_labels_units_split_across_pages(tmp_path):
+    store, llm, builder = _store(files=6, chunks=5), BatchLLM(), Builder(tmp_path)
+    job = ClassificationJob(ClassifierAgent(llm), builder, batch_size=2, max_concurrency=1, page_size=3)
+    reads = []
+    get = store.get
+    store.get = lambda **kwargs: reads.append(kwargs) or get(**kwargs)
+
+    summary = asyncio.run(job.run(store))
+
+    assert all(read["limit"] == 3 for read in reads)
+    assert summary["classified"] == 6 and summary["chunks_updated"] == 30
+    for meta, text in zip(store.get()["metadatas"], store.get()["documents"]):
+        assert meta["discipline"] == ("Biology" if "protein" in text else "Physics")
+
+def test_job_state_is_shared_through_lock_and_status_files(tmp_path):
+    store, builder = _store(), Builder(tmp_path)
+    running = ClassificationJob(ClassifierAgent(BatchLLM()), builder)
+    other_worker = ClassificationJob(ClassifierAgent(BatchLLM()), builder)
+
+    assert running.try_lock()
+    assert not other_worker.try_lock() and other_worker.is_running()
+    with pytest.raises(RuntimeError):
+        asyncio.run(other_worker.run(store))
+    asyncio.run(running.run(store))
+    running.unlock()
+
+    status = other_worker.status()
+    assert status["progress"]["state"] == "done" and status["result"]["classified"] == 10
+    assert other_worker.try_lock()
+    other_worker.unlock()
+
+def test_prompts_wait_for_bulk_slots_and_retry_when_overloaded(tmp_path, monkeypatch):
+    scheduler = RequestScheduler("test", max_concurrency=1, max_queue=0)
+    job = ClassificationJob(ClassifierAgent(BatchLLM()), Builder(tmp_path), batch_size=4, max_concurrency=2, scheduler=scheduler)
+    sleep = asyncio.sleep
+    monkeypatch.setattr(asyncio, "sleep", lambda seconds: sleep(0))
+
+    async def main():
+        # Another request holds the only slot for a moment
+        await scheduler.acquire()
+        asyncio.get_running_loop().call_later(0.05, scheduler.release)
+        return await job.run(_store())
+
+    summary = asyncio.run(main())
+
+    stats = scheduler.stats()
+    assert summary["classified"] == 10
+    assert stats["admitted"] == 4 and stats["rejected"] >= 1 and stats["active"] == 0
+
+def test_unknown_labels_fall_back_to_other():
+    agent = ClassifierAgent(llm=None)
+
+    assert agent.parse_label('{"discipline": "physics"}') == "Physics"
+    assert agent.parse_label('```json\n{"discipline": "Astrology"}\n```') == "Other"
+    assert agent.parse_label("not json at all") == "Other"
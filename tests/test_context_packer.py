@@ -0,0 +1,41 @@
+from langchain.schema import Document
+
+from agents.ingestion_agent import _make_splitter
+from utils.context_packer import ContextPacker, overlap_length
+
+
+TEXT = " ".join(f"Sentence {i} describes result number {i} of the experiment." for i in range(120))
+
+def _chunks(source: str = "a.pdf") -> list:
+    return _make_splitter(1000, 200).split_documents([Document(page_content=TEXT, metadata={"source": source})])
+
+def test_overlap_length_finds_shared_boundary():
+    assert overlap_length("the quick brown fox jumps over", "fox jumps over the lazy dog", min_overlap=5) == 14
+    assert overlap_length("completely different text here", "nothing shared at all here", min_overlap=5) == 0
+
+def test_overlapping_chunks_are_stitched_without_repeats():
+    chunks = _chunks()
+    assert len(chunks) > 3
+
+    context, stats = ContextPacker(token_budget=None).pack(list(reversed(chunks)) + chunks[:2])
+
+    assert stats["passages"] == 1
+    assert context.count("Sentence 30 describes") == 1
+    assert stats["packed_tokens"] < stats["naive_tokens"]
+
+def test_budget_is_filled_by_relevance():
+    other = Document(page_content="An unrelated passage about a different paper. " * 10, metadata={"source": "b.pdf"})
+    chunks = _chunks()
+
+    context, stats = ContextPacker(token_budget=400).pack([chunks[0], chunks[2], other])
+
+    assert stats["packed_tokens"] <= 400
+    assert stats["passages"] == 2
+    assert context.startswith(chunks[0].page_content)
+    assert "different paper" in context
+
+def test_oversized_best_chunk_is_truncated_not_dropped():
+    context, stats = ContextPacker(token_budget=50).pack(_chunks()[:1])
+
+    assert context
+    assert stats["packed_tokens"] <= 50
@@ -0,0 +1,72 @@
+import asyncio
+from langchain_core.language_models import FakeListChatModel
+
+from agents.orchestrator_agent import OrchetratorAgent
+from tests.fakes import CountingRetriever
+from utils.conversation_memory import ConversationMemory, SessionStore
+
+
+class RecordingChatModel(FakeListChatModel):
+    prompts: list = []
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs):
+        self.prompts.append(messages[-1].content)
+        return super()._call(messages, stop, run_manager, **kwargs)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        self.prompts.append(messages[-1].content)
+        async for chunk in super()._astream(messages, stop, run_manager, **kwargs):
+            yield chunk
+
+def test_old_turns_are_folded_into_a_bounded_summary():
+    llm = RecordingChatModel(responses=["user asked about attention and transformers"], prompts=[])
+    memory = ConversationMemory(llm, token_budget=200)
+
+    async def main():
+        for i in range(30):
+            await memory.add_turn(f"question {i} about attention heads", f"answer {i} " + "detail " * 20)
+            assert memory.tokens() <= 220
+
+    asyncio.run(main())
+
+    history = memory.render()
+    assert "user asked about attention and transformers" in history
+    assert "question 29" in history and "question 0 " not in history
+    # Each update only sends the previous summary and the turns being folded
+    assert llm.prompts and all("question 29" not in prompt and prompt.count("User:") <= 3 for prompt in llm.prompts)
+
+def test_session_store_evicts_idle_and_least_recent_sessions():
+    store = SessionStore(lambda: ConversationMemory(None), max_sessions=2, ttl=0.05)
+    first = store.get("a")
+    store.get("b")
+    assert store.get("a") is first
+    store.get("c")
+    assert len(store) == 2 and store.get("a") is first
+
+    asyncio.run(asyncio.sleep(0.06))
+    assert store.get("d") is not first
+    assert store.stats()["sessions"] == 1 and store.stats()["evicted"] == 3
+
+def test_session_store_only_continues_issued_sessions():
+    store = SessionStore(lambda: ConversationMemory(None))
+    issued = store.open()
+
+    assert store.open(issued) == issued
+    assert store.open("chosen-by-client") not in ("chosen-by-client", issued)
+    assert len(store) == 2
+
+def test_history_reaches_the_answer_prompt():
+    llm = RecordingChatModel(responses=["it has eight heads", "each head attends separately"], prompts=[])
+    orchestrator = OrchetratorAgent(None, llm, retriever=CountingRetriever())
+    memory = ConversationMemory(llm)
+
+    async def ask(query):
+        answer = "".join([c["content"] async for c in orchestrator.stream(query, history=memory.render())])
+        await memory.add_turn(query, answer)
+        return answer
+
+    asyncio.run(ask("how many heads does the model use?"))
+    asyncio.run(ask("how do they work?"))
+
+    assert "Conversation so far" not in llm.prompts[0]
+    assert "User: how many heads does the model use?\nAssistant: it has eight heads" in llm.prompts[1]
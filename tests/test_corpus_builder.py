@@ -0,0 +1,80 @@
+import os
+import pytest
+
+fitz = pytest.importorskip("fitz")
+pytest.importorskip("arxiv")
+pytest.importorskip("pdfplumber")
+import corpus_scraper
+from corpus_loader import CorpusLoader
+from corpus_scraper import CorpusBuilder
+
+_process_pdf = corpus_scraper._process_pdf
+
+def _crash_on_a(pdf, chunker=None):
+    if pdf.name == "a.pdf":
+        os._exit(1)  # a segfault inside MuPDF kills the worker the same way
+    return _process_pdf(pdf, chunker)
+
+
+def _write_pdf(path, text: str):
+    doc = fitz.open()
+    for paragraph in text.split("\n\n"):
+        doc.new_page().insert_text((72, 72), paragraph)
+    doc.save(path)
+    doc.close()
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_single_pass_build_skips_unchanged_files(tmp_path, workers):
+    pdf_dir, out_dir = tmp_path / "pdfs", tmp_path / "text"
+    pdf_dir.mkdir()
+    _write_pdf(pdf_dir / "a.pdf", "graph neural networks\n\nmessage passing")
+    _write_pdf(pdf_dir / "b.pdf", "remote sensing of land cover")
+    (pdf_dir / "broken.pdf").write_bytes(b"%PDF-1.4 truncated")
+
+    builder = CorpusBuilder(pdf_dir, out_dir, workers=workers)
+    summary = builder.build_corpus()
+
+    assert summary["processed"] == 2 and summary["corrupted"] == 1
+    assert not (pdf_dir / "broken.pdf").exists()
+    papers = dict(CorpusLoader(out_dir).iter_papers())
+    assert "message passing" in " ".join(doc.page_content for doc in papers["a.pdf"])
+    assert papers["a.pdf"][0].metadata["paper_id"] == "a"
+    assert {"open", "extract", "chunk", "write", "hash"} <= set(builder.timings.stats())
+
+    assert CorpusBuilder(pdf_dir, out_dir, workers=workers).build_corpus()["skipped"] == 2
+
+    _write_pdf(pdf_dir / "b.pdf", "remote sensing of urban heat islands")
+    (pdf_dir / "a.pdf").unlink()
+    summary = CorpusBuilder(pdf_dir, out_dir, workers=workers).build_corpus()
+    assert summary["processed"] == 1 and summary["removed"] == 1
+    papers = dict(CorpusLoader(out_dir).iter_papers())
+    assert set(papers) == {"b.pdf"}
+    assert "urban" in papers["b.pdf"][0].page_content
+
+def test_converts_legacy_output_directory(tmp_path):
+    pdf_dir, out_dir = tmp_path / "pdfs", tmp_path / "text"
+    pdf_dir.mkdir()
+    out_dir.mkdir()
+    _write_pdf(pdf_dir / "a.pdf", "graph neural networks")
+    (out_dir / "a.json").write_text('[{"text": "stale", "meta": {"paper_id": "a"}}]', encoding="utf-8")
+
+    assert CorpusBuilder(pdf_dir, out_dir).build_corpus()["processed"] == 1
+
+    assert not (out_dir / "a.json").exists()
+    assert not CorpusLoader(out_dir).legacy
+
+def test_worker_crash_keeps_files_and_processes_the_rest(tmp_path, monkeypatch):
+    pdf_dir, out_dir = tmp_path / "pdfs", tmp_path / "text"
+    pdf_dir.mkdir()
+    for name in "abcdef":
+        _write_pdf(pdf_dir / f"{name}.pdf", f"paper {name} about graphs")
+    monkeypatch.setattr(corpus_scraper, "_process_pdf", _crash_on_a)
+
+    summary = CorpusBuilder(pdf_dir, out_dir, workers=2).build_corpus()
+
+    assert summary["failed"] == 1 and summary["corrupted"] == 0 and summary["processed"] == 5
+    assert len(list(pdf_dir.glob("*.pdf"))) == 6
+    assert set(dict(CorpusLoader(out_dir).iter_papers())) == {f"{name}.pdf" for name in "bcdef"}
+    # Not in the manifest, so the next run tries it again
+    monkeypatch.setattr(corpus_scraper, "_process_pdf", _process_pdf)
+    assert CorpusBuilder(pdf_dir, out_dir, workers=2).build_corpus()["processed"] == 1
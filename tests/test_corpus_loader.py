@@ -0,0 +1,63 @@
+import json
+
+from corpus_loader import CorpusLoader, CorpusWriter
+
+
+def _meta(paper_id: str) -> dict:
+    return {"paper_id": paper_id, "filename": f"{paper_id}.pdf", "path": f"/papers/{paper_id}.pdf"}
+
+def test_round_trip_streams_papers_and_random_access(tmp_path):
+    with CorpusWriter(tmp_path, shard_bytes=200) as writer:
+        for p in range(5):
+            writer.add_paper(f"p{p}", _meta(f"p{p}"), [f"paper {p} chunk {c} é" for c in range(4)], file_hash=f"h{p}")
+
+    loader = CorpusLoader(tmp_path)
+    papers = list(loader.iter_papers())
+
+    assert len(list(tmp_path.glob("chunks-*.jsonl"))) > 1  # rolled over at shard_bytes
+    assert [source for source, _ in papers] == [f"p{p}.pdf" for p in range(5)]
+    assert papers[2][1][3].page_content == "paper 2 chunk 3 é"
+    assert papers[2][1][3].metadata == {**_meta("p2"), "source": "p2.pdf", "chunk": 3}
+    assert loader.get_chunk("p4", 1).page_content == "paper 4 chunk 1 é"
+    assert loader.file_hashes()["p0.pdf"] == "h0"
+    # Metadata is stored once per paper, not per chunk
+    assert "path" not in (tmp_path / "chunks-00000.jsonl").read_text(encoding="utf-8")
+
+def test_updates_deletes_torn_lines_and_compaction(tmp_path):
+    with CorpusWriter(tmp_path) as writer:
+        writer.add_paper("a", _meta("a"), ["old a"])
+        writer.add_paper("b", _meta("b"), ["b0", "b1"])
+    with CorpusWriter(tmp_path) as writer:
+        writer.add_paper("a", _meta("a"), ["new a 0", "new a 1"])
+        writer.delete_paper("b")
+    with open(tmp_path / "papers.jsonl", "a", encoding="utf-8") as f:
+        f.write('{"paper_id": "c", "me')  # interrupted append
+
+    loader = CorpusLoader(tmp_path)
+    assert [doc.page_content for doc in loader.iter_documents()] == ["new a 0", "new a 1"]
+    assert loader.dead_chunks() == 3
+
+    stats = CorpusWriter.compact(tmp_path)
+    loader = CorpusLoader(tmp_path)
+    assert stats["chunks"] == 2 and loader.dead_chunks() == 0
+    assert [doc.page_content for doc in loader.load_documents()] == ["new a 0", "new a 1"]
+
+def test_append_after_a_torn_line_keeps_the_new_record(tmp_path):
+    with CorpusWriter(tmp_path) as writer:
+        writer.add_paper("a", _meta("a"), ["a0"])
+    with open(tmp_path / "papers.jsonl", "a", encoding="utf-8") as f:
+        f.write('{"paper_id": "b", "me')  # interrupted append
+    with CorpusWriter(tmp_path) as writer:
+        writer.add_paper("c", _meta("c"), ["c0"])
+
+    assert [doc.page_content for doc in CorpusLoader(tmp_path).iter_documents()] == ["a0", "c0"]
+
+def test_reads_legacy_per_paper_json(tmp_path):
+    records = [{"text": f"chunk {c}", "meta": _meta("old")} for c in range(3)]
+    (tmp_path / "old.json").write_text(json.dumps(records, indent=2), encoding="utf-8")
+
+    loader = CorpusLoader(tmp_path)
+    (source, docs), = loader.iter_papers()
+
+    assert loader.legacy and source == "old.pdf"
+    assert [doc.metadata["chunk"] for doc in docs] == [0, 1, 2]
@@ -0,0 +1,87 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+pytest.importorskip("arxiv")
+pytest.importorskip("fitz")
+pytest.importorskip("pdfplumber")
+from corpus_scraper import ArxivDownloader, HostRateLimiter, PDFDownloader, make_session
+
+
+PDF = b"%PDF-1.4\n" + bytes(range(256)) * 400 + b"\n%%EOF"
+
+class Handler(BaseHTTPRequestHandler):
+    """Serves PDF for /pdf/<id>, honours Range, and cuts the first response for ids starting with "flaky" in half."""
+    requests = []
+    cut = set()
+
+    def do_GET(self):
+        paper_id = self.path.rsplit("/", 1)[-1]
+        range_header = self.headers.get("Range")
+        type(self).requests.append((paper_id, range_header))
+        start = int(range_header.split("=")[1].rstrip("-")) if range_header else 0
+        body = PDF[start:]
+        self.send_response(206 if range_header else 200)
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("Content-Length", str(len(body)))
+        if range_header:
+            self.send_header("Content-Range", f"bytes {start}-{len(PDF) - 1}/{len(PDF)}")
+        self.end_headers()
+        if paper_id.startswith("flaky") and paper_id not in type(self).cut:
+            type(self).cut.add(paper_id)
+            self.wfile.write(body[:len(body) // 2])
+            self.wfile.flush()
+            self.connection.close()
+            return
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    Handler.requests, Handler.cut = [], set()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/pdf"
+    httpd.shutdown()
+
+def _downloader(tmp_path, workers: int = 3) -> ArxivDownloader:
+    fetcher = PDFDownloader(sleep=0, timeout=5, session=make_session(workers), rate_limiter=HostRateLimiter(rate=1000))
+    return ArxivDownloader(tmp_path, downloader=fetcher, workers=workers)
+
+def test_concurrent_download_records_manifest_and_skips_on_rerun(tmp_path, server):
+    papers = [(f"2401.{i:05d}", f"{server}/2401.{i:05d}", f"paper {i}") for i in range(6)]
+
+    summary = _downloader(tmp_path).download_all(papers)
+
+    assert summary == {"downloaded": 6, "skipped": 0, "failed": 0}
+    assert all((tmp_path / f"{paper_id}.pdf").read_bytes() == PDF for paper_id, _, _ in papers)
+    assert not list(tmp_path.glob("*.part"))
+
+    requests_before = len(Handler.requests)
+    again = _downloader(tmp_path).download_all(papers)
+    assert again["skipped"] == 6
+    assert len(Handler.requests) == requests_before
+    assert len(_downloader(tmp_path).manifest.completed) == 6
+
+def test_interrupted_download_resumes_with_range(tmp_path, server):
+    summary = _downloader(tmp_path).download_all([("flaky1", f"{server}/flaky1", "flaky")])
+
+    assert summary["downloaded"] == 1
+    assert (tmp_path / "flaky1.pdf").read_bytes() == PDF
+    (_, first), (_, resumed) = Handler.requests
+    assert first is None
+    # Resumed from the bytes that reached the .part file before the connection dropped
+    assert 0 < int(resumed.removeprefix("bytes=").rstrip("-")) <= len(PDF) // 2
+
+def test_rate_limiter_spaces_requests_per_host():
+    limiter = HostRateLimiter(rate=20)
+    start = time.monotonic()
+    for _ in range(5):
+        limiter.wait("http://a.example/x")
+    limiter.wait("http://b.example/x")
+
+    assert time.monotonic() - start >= 0.2 - 1e-3
@@ -0,0 +1,62 @@
+import asyncio
+from typing import List
+from langchain_core.embeddings import Embeddings
+
+from utils.embedding_cache import CachedEmbeddings, EmbeddingCache
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.calls: List[str] = []
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls.extend(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+def test_cache_skips_already_embedded_text(tmp_path):
+    inner = CountingEmbeddings()
+    cache = EmbeddingCache(tmp_path / "embeddings.sqlite")
+    embeddings = CachedEmbeddings(inner, cache, model_name="nomic-embed-text")
+
+    first = embeddings.embed_documents(["alpha", "beta"])
+    second = embeddings.embed_documents(["beta", "alpha", "gamma"])
+
+    assert inner.calls == ["alpha", "beta", "gamma"]
+    assert second[:2] == [first[1], first[0]]
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 3
+
+def test_cache_persists_and_is_keyed_by_model(tmp_path):
+    path = tmp_path / "embeddings.sqlite"
+    CachedEmbeddings(CountingEmbeddings(), EmbeddingCache(path), "model-a").embed_query("text")
+
+    inner = CountingEmbeddings()
+    asyncio.run(CachedEmbeddings(inner, EmbeddingCache(path), "model-a").aembed_query("text"))
+    assert inner.calls == []
+
+    CachedEmbeddings(inner, EmbeddingCache(path), "model-b").embed_query("text")
+    assert inner.calls == ["text"]
+
+def test_lru_eviction_keeps_recently_used(tmp_path):
+    cache = EmbeddingCache(tmp_path / "embeddings.sqlite", max_entries=2)
+    cache.put_many({"a": [1.0], "b": [2.0]})
+    cache.get_many(["a"])
+    cache.put_many({"c": [3.0]})
+
+    assert cache.get_many(["a", "b", "c"]) == [[1.0], None, [3.0]]
+    assert cache.stats()["size"] == 2
+
+def test_caches_sharing_a_file_respect_one_bound(tmp_path):
+    path = tmp_path / "embeddings.sqlite"
+    first, second = EmbeddingCache(path, max_entries=3), EmbeddingCache(path, max_entries=3)
+    first.put_many({"a": [1.0], "b": [2.0]})
+    second.put_many({"c": [3.0]})
+    # Hits are only recorded by the next write, whichever process makes it
+    assert first.get_many(["a"]) == [[1.0]]
+    first.put_many({"d": [4.0]})
+
+    assert second.get_many(["a", "b", "c", "d"]) == [[1.0], None, [3.0], [4.0]]
+    assert second.stats()["size"] == 3
@@ -0,0 +1,85 @@
+import asyncio
+import pytest
+from langchain_core.embeddings import FakeEmbeddings
+
+from agents.retriever_agent import RetrieverAgent
+from bm25_index import BM25Index
+from local_vector_store import LocalVectorStore
+from utils.cache import RetrievalCache
+from utils.filters import build_where, matches, parse_date, where_from_payload
+from utils.hybrid_retriever import HybridRetriever
+
+
+def _store(n: int = 60) -> LocalVectorStore:
+    store = LocalVectorStore(FakeEmbeddings(size=8))
+    store.add_texts(
+        [f"chunk {i} about transformers" for i in range(n)],
+        metadatas=[
+            {"source": f"paper{i % 6}.pdf", "page": i % 4, "date": 20200101 + (i % 3) * 10000,
+             "discipline": "Physics" if i % 2 else "Biology"}
+            for i in range(n)
+        ],
+        ids=[str(i) for i in range(n)],
+    )
+    return store
+
+def test_build_where_and_dates():
+    assert build_where() is None
+    assert build_where(source="a.pdf") == {"source": "a.pdf"}
+    assert build_where(source=["a.pdf", "b.pdf"], date_from="2021", date_to="2021-06") == {"$and": [
+        {"source": {"$in": ["a.pdf", "b.pdf"]}},
+        {"date": {"$gte": 20210101}},
+        {"date": {"$lte": 20210631}},
+    ]}
+    assert parse_date("D:20230501120000Z") == 20230501
+    with pytest.raises(ValueError):
+        where_from_payload({"author": "x"})
+    with pytest.raises(ValueError):
+        parse_date("yesterday")
+    assert parse_date("2023-5-1") == 20230501 and parse_date("2023-5", end=True) == 20230531
+    assert parse_date(20230501) == 20230501 and parse_date("2023-05-01T12:00:00+00:00") == 20230501
+    for invalid in ("2023-13", "2023-02-30", "2023/05/01", "2023-5-1x", "20235"):
+        with pytest.raises(ValueError):
+            parse_date(invalid)
+
+def test_matches_evaluates_operators():
+    metadata = {"source": "a.pdf", "page": 3, "date": 20210505}
+    assert matches(metadata, {"$and": [{"source": {"$in": ["a.pdf"]}}, {"page": {"$gte": 2}}]})
+    assert matches(metadata, {"$or": [{"source": "b.pdf"}, {"date": {"$lt": 20220101}}]})
+    assert not matches(metadata, {"page": {"$ne": 3}})
+    assert not matches(metadata, {"discipline": {"$gte": "A"}})
+
+def test_filtered_search_only_returns_matching_chunks():
+    store = _store()
+    where = build_where(source=["paper1.pdf", "paper3.pdf"], date_from="2021")
+
+    docs = store.similarity_search("transformers", k=50, filter=where)
+
+    expected = [meta for meta in store.get()["metadatas"] if matches(meta, where)]
+    assert len(docs) == len(expected) > 0
+    assert all(matches(doc.metadata, where) for doc in docs)
+
+def test_get_with_where_clause_matches_pure_python_evaluation():
+    store = _store()
+    where = {"$or": [{"page": 0}, {"$and": [{"discipline": "Physics"}, {"date": {"$gt": 20210101}}]}]}
+
+    result = store.get(where=where)
+
+    assert result["ids"] == [i for i, meta in zip(store.get()["ids"], store.get()["metadatas"]) if matches(meta, where)]
+    store.update_metadata(["0"], [{"page": 9}])
+    assert "0" not in store.get(where=where)["ids"]
+
+def test_hybrid_and_retriever_agent_respect_filter():
+    store = _store()
+    index = BM25Index()
+    stored = store.get()
+    index.add(stored["ids"], stored["documents"])
+    retriever = HybridRetriever(vectorstore=store, lexical_index=index, search_k=10)
+    agent = RetrieverAgent(store, llm=None, retriever=retriever, cache=RetrievalCache("corpus_db"))
+    where = {"source": "paper2.pdf"}
+
+    unfiltered = asyncio.run(agent.run("transformers", k=5))
+    filtered = asyncio.run(agent.run("transformers", k=5, filter=where))
+
+    assert filtered and all(doc.metadata["source"] == "paper2.pdf" for doc in filtered)
+    assert any(doc.metadata["source"] != "paper2.pdf" for doc in unfiltered)
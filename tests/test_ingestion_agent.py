@@ -0,0 +1,52 @@
+import asyncio
+from pathlib import Path
+
+from agents.ingestion_agent import IngestionAgent
+
+
+def make_pdf(text: str) -> bytes:
+    stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R /Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for i, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % i + obj + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for off in offsets:
+        out += b"%010d 00000 n \n" % off
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return out
+
+def _write_corpus(tmp_path: Path, n: int = 4) -> Path:
+    for i in range(n):
+        (tmp_path / f"paper_{i}.pdf").write_bytes(make_pdf(f"content of paper {i}"))
+    (tmp_path / "broken.pdf").write_bytes(b"not a pdf")
+    return tmp_path
+
+def test_parallel_ingestion_matches_sequential(tmp_path):
+    pdf_dir = _write_corpus(tmp_path)
+
+    sequential = asyncio.run(IngestionAgent(pdf_dir=pdf_dir).run())
+    parallel = asyncio.run(IngestionAgent(pdf_dir=pdf_dir, workers=3).run())
+
+    def key(docs):
+        return sorted((d.metadata["source"], d.page_content) for d in docs)
+
+    assert key(parallel) == key(sequential)
+    assert {d.metadata["source"] for d in parallel} == {f"paper_{i}.pdf" for i in range(4)}
+
+def test_stream_yields_per_file_and_skips_broken(tmp_path):
+    pdf_dir = _write_corpus(tmp_path, n=2)
+
+    async def collect():
+        return [name async for name, _ in IngestionAgent(pdf_dir=pdf_dir, workers=2).stream()]
+
+    assert sorted(asyncio.run(collect())) == ["paper_0.pdf", "paper_1.pdf"]
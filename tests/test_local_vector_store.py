@@ -0,0 +1,87 @@
+import numpy as np
+from langchain_core.embeddings import FakeEmbeddings
+
+from local_vector_store import LocalVectorStore
+
+
+DIM = 32
+
+def _vectors(n: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(20, DIM))
+    return (centers[rng.integers(0, 20, n)] + 0.3 * rng.normal(size=(n, DIM))).astype(np.float32)
+
+def _store(n: int, **options) -> LocalVectorStore:
+    store = LocalVectorStore(FakeEmbeddings(size=DIM), **options)
+    store.add_embeddings([f"chunk {i}" for i in range(n)], _vectors(n), [{"i": i} for i in range(n)], [str(i) for i in range(n)])
+    return store
+
+def test_exact_search_returns_nearest_first():
+    store = _store(500)
+    query = _vectors(500)[42]
+
+    results = store.similarity_search_by_vector_with_score(query.tolist(), k=3)
+
+    assert results[0][0].id == "42"
+    assert results[0][1] < 1e-5
+    assert [score for _, score in results] == sorted(score for _, score in results)
+
+def test_ivf_search_keeps_high_recall():
+    vectors = _vectors(3000)
+    store = _store(3000, ivf_threshold=1000, nprobe=8)
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    recall = 0.0
+    for row in range(0, 3000, 100):
+        truth = set(np.argsort(-(normalized @ normalized[row]))[:10].astype(str))
+        found = {doc.id for doc in store.similarity_search_by_vector(vectors[row].tolist(), k=10)}
+        recall += len(truth & found) / 10
+
+    assert store._ivf is not None
+    assert recall / 30 > 0.9
+
+def test_batched_adds_grow_one_buffer():
+    vectors = _vectors(3000)
+    store = LocalVectorStore(FakeEmbeddings(size=DIM))
+    buffers = set()
+    for i in range(0, 3000, 50):
+        store.add_embeddings([f"chunk {j}" for j in range(i, i + 50)], vectors[i:i + 50], ids=[str(j) for j in range(i, i + 50)])
+        buffers.add(len(store._buffer))
+
+    assert len(store._vectors) == 3000 and buffers == {1024, 2000, 4000}
+    query = vectors[1234].tolist()
+    assert [doc.id for doc in store.similarity_search_by_vector(query, k=5)] == [doc.id for doc in _store(3000).similarity_search_by_vector(query, k=5)]
+
+def test_save_load_upsert_and_delete(tmp_path):
+    store = _store(200, ivf_threshold=100)
+    store.save(tmp_path)
+
+    # The IVF index is trained and written by save, not by the first query
+    assert (tmp_path / "ivf.npz").exists()
+    loaded = LocalVectorStore.load(tmp_path, FakeEmbeddings(size=DIM), ivf_threshold=100)
+    assert loaded._ivf is not None
+    query = _vectors(200)[7].tolist()
+    assert loaded.similarity_search_by_vector(query, k=5) == store.similarity_search_by_vector(query, k=5)
+
+    loaded.delete(ids=["7"])
+    loaded.add_embeddings(["replaced"], [_vectors(200)[8]], ids=["8"])
+    assert len(loaded) == 199
+    assert loaded.get_by_ids(["7", "8"])[0].page_content == "replaced"
+
+def test_quantized_memory_mapped_load_with_rescoring(tmp_path):
+    vectors = _vectors(1000)
+    store = LocalVectorStore(FakeEmbeddings(size=DIM), dtype="int8")
+    store.add_embeddings([f"chunk {i}" for i in range(1000)], vectors, ids=[str(i) for i in range(1000)])
+    store.save(tmp_path)
+
+    loaded = LocalVectorStore.load(tmp_path, FakeEmbeddings(size=DIM), dtype="int8")
+    assert isinstance(loaded._codes, np.memmap) and loaded._codes.dtype == np.int8
+    assert loaded._codes.nbytes * 4 == loaded._vectors.nbytes
+
+    exact = LocalVectorStore.load(tmp_path, FakeEmbeddings(size=DIM))
+    for row in (3, 300, 900):
+        query = vectors[row].tolist()
+        assert loaded.similarity_search_by_vector(query, k=5) == exact.similarity_search_by_vector(query, k=5)
+
+    loaded.add_embeddings(["new"], [vectors[0]], ids=["new"])
+    assert loaded._codes is None and not isinstance(loaded._vectors, np.memmap)
@@ -0,0 +1,39 @@
+from langchain.schema import Document
+
+from utils.manifest import IndexManifest
+
+
+def test_chunk_ids_are_deterministic_and_unique():
+    docs = [
+        Document(page_content="same text", metadata={"source": "a.pdf"}),
+        Document(page_content="same text", metadata={"source": "a.pdf"}),
+        Document(page_content="same text", metadata={"source": "b.pdf"}),
+    ]
+    ids = IndexManifest.chunk_ids(docs)
+
+    assert ids == IndexManifest.chunk_ids(docs)
+    assert len(set(ids)) == 3
+    assert ids[1] == f"{ids[0]}-1"
+
+def test_stale_and_removed_sources(tmp_path):
+    manifest = IndexManifest(tmp_path / "corpus_db.manifest.json")
+    manifest.files = {
+        "kept.pdf": {"hash": "h1", "chunks": ["c1"]},
+        "changed.pdf": {"hash": "h2", "chunks": ["c2"]},
+        "gone.pdf": {"hash": "h3", "chunks": ["c3"]},
+    }
+    manifest.save()
+
+    reloaded = IndexManifest.load(manifest.path)
+    current = {"kept.pdf": "h1", "changed.pdf": "h2-new", "added.pdf": "h4"}
+
+    assert sorted(reloaded.stale_sources(current)) == ["added.pdf", "changed.pdf"]
+    assert reloaded.removed_sources(current) == ["gone.pdf"]
+
+def test_hash_file_tracks_content(tmp_path):
+    path = tmp_path / "paper.pdf"
+    path.write_bytes(b"v1")
+    first = IndexManifest.hash_file(path)
+    path.write_bytes(b"v2")
+
+    assert IndexManifest.hash_file(path) != first
@@ -0,0 +1,83 @@
+import asyncio
+import time
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.runnables import RunnableLambda
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from utils.multi_query_retriever import FusionMultiQueryRetriever, reciprocal_rank_fusion
+from utils.timing import StageTimings
+
+
+def _doc(text: str) -> Document:
+    return Document(page_content=text, metadata={"source": "a.pdf"})
+
+def _store() -> InMemoryVectorStore:
+    store = InMemoryVectorStore(DeterministicFakeEmbedding(size=16))
+    store.add_documents([_doc(f"chunk {i}") for i in range(20)])
+    return store
+
+def test_rrf_prefers_documents_ranked_high_by_several_queries():
+    a, b, c, d = (_doc(t) for t in "abcd")
+    fused = reciprocal_rank_fusion([[a, b, c], [b, d, a], [b, c]])
+
+    assert [doc.page_content for doc in fused] == ["b", "a", "c", "d"]
+
+def test_variant_searches_are_fused():
+    chain = RunnableLambda(lambda _: ["chunk 3", "chunk 7"])
+    retriever = FusionMultiQueryRetriever(vectorstore=_store(), llm_chain=chain, search_k=3)
+
+    docs = asyncio.run(retriever.ainvoke("chunk 1"))
+    contents = {doc.page_content for doc in docs}
+
+    assert {"chunk 1", "chunk 3", "chunk 7"} <= contents
+    assert len(contents) == len(docs)
+
+def test_zero_latency_budget_skips_expansion():
+    calls = []
+    chain = RunnableLambda(lambda q: calls.append(q) or ["chunk 5"])
+    retriever = FusionMultiQueryRetriever(vectorstore=_store(), llm_chain=chain, latency_budget=0)
+
+    asyncio.run(retriever.ainvoke("chunk 1"))
+    assert calls == []
+
+def test_slow_expansion_falls_back_to_original_query():
+    async def slow_expansion(_):
+        await asyncio.sleep(1)
+        return ["chunk 5"]
+
+    retriever = FusionMultiQueryRetriever(
+        vectorstore=_store(), llm_chain=RunnableLambda(slow_expansion), latency_budget=0.05, search_k=2
+    )
+    start = time.perf_counter()
+    docs = asyncio.run(retriever.ainvoke("chunk 1"))
+
+    assert time.perf_counter() - start < 0.5
+    assert docs[0].page_content == "chunk 1"
+
+def test_original_query_search_overlaps_expansion():
+    searched = []
+
+    class RecordingStore(InMemoryVectorStore):
+        async def asimilarity_search(self, query, k=4, **kwargs):
+            searched.append(query)
+            await asyncio.sleep(0.05)
+            return await super().asimilarity_search(query, k=k, **kwargs)
+
+    store = RecordingStore(DeterministicFakeEmbedding(size=16))
+    store.add_documents([_doc(f"chunk {i}") for i in range(20)])
+    seen_during_expansion = []
+
+    async def expansion(_):
+        await asyncio.sleep(0.05)
+        seen_during_expansion.extend(searched)
+        return ["chunk 3"]
+
+    retriever = FusionMultiQueryRetriever(vectorstore=store, llm_chain=RunnableLambda(expansion), search_k=3,
+                                          timings=StageTimings())
+    docs = asyncio.run(retriever.ainvoke("chunk 1"))
+
+    assert seen_during_expansion == ["chunk 1"]
+    assert searched == ["chunk 1", "chunk 3"]
+    assert {"chunk 1", "chunk 3"} <= {doc.page_content for doc in docs}
+    assert set(retriever.timings.stats()) == {"expand", "search_original", "search_variant"}
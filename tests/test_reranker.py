@@ -0,0 +1,65 @@
+import asyncio
+import time
+from typing import List
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from agents.retriever_agent import RetrieverAgent
+from utils.reranker import LexicalScorer, Reranker
+
+
+DOCS = [
+    Document(page_content="Unrelated text about cooking pasta and tomatoes."),
+    Document(page_content="Transformers use self attention to model long range dependencies."),
+    Document(page_content="Self attention in transformers, and why attention scales quadratically."),
+    Document(page_content="A survey of convolutional networks for image classification."),
+]
+
+class ListRetriever(BaseRetriever):
+    docs: List[Document]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return list(self.docs)
+
+class SlowScorer:
+    def score(self, query, docs):
+        time.sleep(0.05)
+        return LexicalScorer().score(query, docs)
+
+def test_lexical_scorer_prefers_overlap_and_ignores_batching():
+    query = "self attention in transformers"
+    scores = LexicalScorer().score(query, DOCS)
+
+    assert scores.argmax() == 2
+    assert scores[0] == 0
+    batched = Reranker(batch_size=1).rerank(query, DOCS, top_n=4)
+    assert batched == Reranker(batch_size=32).rerank(query, DOCS, top_n=4)
+
+def test_token_budget_limits_kept_documents():
+    reranker = Reranker(token_budget=20)
+
+    kept = reranker.rerank("self attention transformers", DOCS, top_n=4)
+
+    assert kept == [DOCS[2]]
+
+def test_latency_budget_keeps_unscored_candidates_in_retrieval_order():
+    reranker = Reranker(SlowScorer(), batch_size=1, latency_budget=0.01)
+
+    kept = reranker.rerank("convolutional image classification", DOCS, top_n=4)
+
+    # Only the first batch is scored in time; the rest follow in their original order
+    assert kept == DOCS
+
+def test_retriever_agent_reranks_wider_candidate_set_and_reports_timings():
+    agent = RetrieverAgent(
+        vector_db=None, llm=None, retriever=ListRetriever(docs=DOCS),
+        reranker=Reranker(), candidate_k=4
+    )
+    timings = {}
+
+    docs = asyncio.run(agent.run("convolutional image classification", k=1, timings=timings))
+
+    assert docs == [DOCS[3]]
+    assert set(timings) == {"retrieve", "rerank"}
+    assert set(agent.timings.stats()) == {"retrieve", "rerank"}
@@ -0,0 +1,45 @@
+import asyncio
+import time
+
+from agents.retriever_agent import RetrieverAgent
+from tests.fakes import CountingRetriever
+from utils.cache import RetrievalCache, TTLCache
+
+
+def test_ttl_cache_expires_and_evicts_lru():
+    cache = TTLCache(max_size=2, ttl=0.05)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    time.sleep(0.06)
+    assert cache.get("c") is None
+    assert cache.stats()["hits"] == 2
+
+def test_retrieval_cache_normalizes_query_and_tracks_version():
+    version = {"value": "1"}
+    cache = RetrievalCache("corpus_db", version_fn=lambda: version["value"])
+
+    assert cache.key("Key takeaways?", 5) == cache.key("  key   TAKEAWAYS ", 5)
+    assert cache.key("key takeaways", 5) != cache.key("key takeaways", 3)
+
+    cache.set(cache.key("key takeaways", 5), ["doc"])
+    version["value"] = "2"
+    assert cache.get(cache.key("key takeaways", 5)) is None
+
+def test_retriever_agent_serves_repeats_from_cache():
+    retriever = CountingRetriever()
+    agent = RetrieverAgent(vector_db=None, llm=None, retriever=retriever, cache=RetrievalCache("corpus_db"))
+
+    async def main():
+        first = await agent.run("Summarize this book", k=2)
+        second = await agent.run("summarize this book?", k=2)
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert retriever.calls == 1
+    assert [d.page_content for d in first] == [d.page_content for d in second]
+    assert agent.cache.stats()["hit_rate"] == 0.5
@@ -0,0 +1,71 @@
+import asyncio
+import time
+from typing import List
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.retrievers import BaseRetriever
+
+from agents.orchestrator_agent import OrchetratorAgent
+from agents.retriever_agent import RetrieverAgent
+from tests.fakes import CountingRetriever
+
+
+DELAY = 0.3
+
+class SlowRetriever(BaseRetriever):
+    """Sync-only retriever standing in for a slow expansion + vector search."""
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        time.sleep(DELAY)
+        return [Document(page_content=f"{query} {i}", metadata={"source": "a.pdf"}) for i in range(10)]
+
+class SlowAsyncRetriever(SlowRetriever):
+    async def _aget_relevant_documents(self, query: str, *, run_manager) -> List[Document]:
+        await asyncio.sleep(DELAY)
+        return [Document(page_content=f"{query} {i}", metadata={"source": "a.pdf"}) for i in range(10)]
+
+async def _run_concurrently(agent: RetrieverAgent, n: int):
+    start = time.perf_counter()
+    results = await asyncio.gather(*(agent.run(f"query {i}", k=3) for i in range(n)))
+    return results, time.perf_counter() - start
+
+def test_concurrent_queries_overlap_with_async_retriever():
+    agent = RetrieverAgent(vector_db=None, llm=None, retriever=SlowAsyncRetriever())
+    results, elapsed = asyncio.run(_run_concurrently(agent, n=5))
+
+    assert [len(docs) for docs in results] == [3] * 5
+    assert elapsed < DELAY * 2
+
+def test_sync_retriever_does_not_block_event_loop():
+    agent = RetrieverAgent(vector_db=None, llm=None, retriever=SlowRetriever())
+
+    async def main():
+        ticks = 0
+
+        async def heartbeat():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        beat = asyncio.create_task(heartbeat())
+        results, elapsed = await _run_concurrently(agent, n=4)
+        beat.cancel()
+        return results, elapsed, ticks
+
+    results, elapsed, ticks = asyncio.run(main())
+    assert all(len(docs) == 3 for docs in results)
+    assert elapsed < DELAY * 2
+    assert ticks > 5
+
+def test_rag_answer_reuses_documents_retrieved_by_orchestrator():
+    retriever = CountingRetriever()
+    orchestrator = OrchetratorAgent(None, FakeListChatModel(responses=["answer"]), retriever=retriever)
+
+    async def collect():
+        return "".join([c["content"] async for c in orchestrator.stream("what is attention?")])
+
+    assert asyncio.run(collect()) == "answer"
+    assert asyncio.run(orchestrator.run("how are heads combined?"))["content"] == "answer"
+    assert retriever.calls == 2
+    assert {"retrieve", "first_token"} <= set(orchestrator.retriever_agent.timings.stats())
@@ -0,0 +1,78 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+
+from api.routes import query
+from api.scheduler import Overloaded, RequestScheduler
+
+
+def test_interactive_requests_are_admitted_before_bulk():
+    scheduler = RequestScheduler("test", max_concurrency=1, max_queue=8, queue_timeout=5)
+    order = []
+
+    async def request(name: str, priority: str):
+        async with scheduler.slot(priority):
+            order.append(name)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        await scheduler.acquire()
+        waiting = [asyncio.create_task(request(f"{priority}{i}", priority))
+                   for i, priority in enumerate(["bulk", "interactive", "bulk", "interactive"])]
+        await asyncio.sleep(0.01)
+        assert scheduler.stats()["queue_depth"] == 4
+        scheduler.release()
+        await asyncio.gather(*waiting)
+
+    asyncio.run(main())
+
+    assert order == ["interactive1", "interactive3", "bulk0", "bulk2"]
+    stats = scheduler.stats()
+    assert stats["active"] == 0 and stats["queue_depth"] == 0 and stats["admitted"] == 5
+    assert {"wait_interactive", "wait_bulk", "service"} <= set(stats["timings"])
+
+def test_full_queue_and_queue_timeout_fail_fast():
+    scheduler = RequestScheduler("test", max_concurrency=1, max_queue=1, queue_timeout=0.05)
+
+    async def main():
+        await scheduler.acquire()
+        waiter = asyncio.create_task(scheduler.acquire("bulk"))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded):
+            await scheduler.acquire()
+        with pytest.raises(Overloaded) as timed_out:
+            await waiter
+        assert timed_out.value.retry_after >= 1
+        # The abandoned waiter does not swallow the next released slot
+        scheduler.release()
+        await asyncio.wait_for(scheduler.acquire(), 1)
+
+    asyncio.run(main())
+
+    stats = scheduler.stats()
+    assert stats["rejected"] == 1 and stats["timed_out"] == 1
+    assert stats["active"] == 1 and stats["queue_depth"] == 0
+
+def test_query_route_returns_429_when_overloaded(monkeypatch):
+    class Orchestrator:
+        async def cached_answer(self, q, use_cache=True, filter=None):
+            return ("cached", None) if q == "cached" else (None, None)
+
+        async def run(self, q, use_cache=True, filter=None, cache_vector=None):
+            return "answer"
+
+    scheduler = RequestScheduler("test", max_concurrency=1, max_queue=0)
+    monkeypatch.setattr(query, "orchestrator", Orchestrator())
+    monkeypatch.setattr(query, "scheduler", scheduler)
+
+    async def main():
+        assert (await query.single_query(q="q", source=None, page=None, discipline=None))["response"] == "answer"
+        await scheduler.acquire()
+        with pytest.raises(HTTPException) as rejected:
+            await query.single_query(q="q", source=None, page=None, discipline=None)
+        # A cache hit does not need a slot
+        assert (await query.single_query(q="cached", source=None, page=None, discipline=None))["response"] == "cached"
+        return rejected.value
+
+    rejected = asyncio.run(main())
+    assert rejected.status_code == 429 and "Retry-After" in rejected.headers
@@ -0,0 +1,58 @@
+import asyncio
+from typing import List
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import FakeListChatModel
+
+from agents.orchestrator_agent import OrchetratorAgent
+from tests.fakes import CountingRetriever
+from utils.semantic_cache import SemanticAnswerCache
+
+
+class KeywordEmbeddings(Embeddings):
+    """Queries sharing keywords embed close together, regardless of wording around them."""
+    vocabulary = ["takeaways", "book", "method", "results"]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        words = text.lower()
+        return [1.0 if word in words else 0.0 for word in self.vocabulary] + [0.1]
+
+def test_lookup_matches_paraphrase_within_route_only():
+    cache = SemanticAnswerCache(KeywordEmbeddings(), threshold=0.95)
+    answer = {"type": "response", "content": "be consistent", "metadata": {}}
+
+    async def main():
+        cache.store(await cache.embed("key takeaways of the book?"), "key takeaways of the book?", "ResponseAgent", answer)
+        return (
+            cache.lookup(await cache.embed("what are the book's main takeaways"), "ResponseAgent"),
+            cache.lookup(await cache.embed("what are the book's main takeaways"), "SummarizerAgent"),
+            cache.lookup(await cache.embed("explain the method"), "ResponseAgent"),
+        )
+
+    assert asyncio.run(main()) == (answer, None, None)
+
+def test_eviction_is_bounded_and_lru():
+    cache = SemanticAnswerCache(KeywordEmbeddings(), threshold=0.99, max_size=2)
+
+    async def main():
+        for word in ["takeaways", "book", "method"]:
+            cache.store(await cache.embed(word), word, "ResponseAgent", {"content": word})
+        return [cache.lookup(await cache.embed(word), "ResponseAgent") for word in ["takeaways", "book", "method"]]
+
+    assert asyncio.run(main()) == [None, {"content": "book"}, {"content": "method"}]
+    assert cache.stats()["size"] == 2
+
+def test_orchestrator_replays_cached_stream_and_honours_opt_out():
+    llm = FakeListChatModel(responses=["first answer", "second answer"])
+    cache = SemanticAnswerCache(KeywordEmbeddings(), threshold=0.95)
+    orchestrator = OrchetratorAgent(None, llm, retriever=CountingRetriever(), answer_cache=cache)
+
+    async def collect(query, use_cache=True):
+        return "".join([c["content"] async for c in orchestrator.stream(query, use_cache=use_cache)])
+
+    assert asyncio.run(collect("book takeaways")) == "first answer"
+    assert asyncio.run(collect("takeaways from the book?")) == "first answer"
+    assert asyncio.run(collect("takeaways from the book?", use_cache=False)) == "second answer"
+    assert cache.stats()["hits"] == 1
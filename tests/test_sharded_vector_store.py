@@ -0,0 +1,118 @@
+import asyncio
+import pytest
+from langchain.schema import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from local_vector_store import LocalVectorStore
+from sharded_vector_store import ShardedVectorStore
+from utils.manifest import IndexManifest
+from vector_store import VectorStoreBuilder
+
+
+EMBEDDING = DeterministicFakeEmbedding(size=16)
+
+def _documents(files: int = 6, chunks: int = 5) -> list:
+    return [
+        Document(page_content=f"paper {f} section {c} on topic {f * c % 7}", metadata={"source": f"paper{f}.pdf", "page": c})
+        for f in range(files) for c in range(chunks)
+    ]
+
+def _builder(tmp_path, **kwargs) -> VectorStoreBuilder:
+    builder = VectorStoreBuilder(tmp_path / "db", cache_path=None, backend="local", batch_size=4, **kwargs)
+    builder.embeddings = EMBEDDING
+    return builder
+
+def test_scatter_gather_matches_single_store():
+    docs = _documents()
+    single = LocalVectorStore(EMBEDDING)
+    single.add_documents(docs, ids=[str(i) for i in range(len(docs))])
+    sharded = ShardedVectorStore([LocalVectorStore(EMBEDDING) for _ in range(4)])
+    sharded.add_documents(docs, ids=[str(i) for i in range(len(docs))])
+
+    assert len(sharded) == len(docs)
+    assert all(len(shard) < len(docs) for shard in sharded.shards)
+    for query in ["topic 3", "paper 5 section 1"]:
+        expected = [doc.id for doc in single.similarity_search(query, k=5)]
+        assert [doc.id for doc in sharded.similarity_search(query, k=5)] == expected
+        assert [doc.id for doc, _ in asyncio.run(sharded.asimilarity_search_with_score(query, k=5))] == expected
+
+def test_source_routing_paging_and_lookups():
+    docs = _documents()
+    sharded = ShardedVectorStore([LocalVectorStore(EMBEDDING) for _ in range(3)], shard_by="source")
+    ids = [str(i) for i in range(len(docs))]
+    sharded.add_documents(docs, ids=ids)
+
+    for shard in sharded.shards:
+        sources = {meta["source"] for meta in shard.get()["metadatas"]}
+        assert all(len(sharded.get(where={"source": source})["ids"]) == 5 for source in sources)
+        assert not sources & {meta["source"] for other in sharded.shards if other is not shard for meta in other.get()["metadatas"]}
+    pages = [sharded.get(limit=7, offset=offset)["ids"] for offset in range(0, len(docs), 7)]
+    assert sorted(sum(pages, []), key=int) == ids
+    assert [doc.id for doc in sharded.get_by_ids(["12", "3", "missing"])] == ["12", "3"]
+
+    sharded.delete(ids=["3"])
+    assert len(sharded) == len(docs) - 1
+
+def test_builder_builds_and_rebuilds_one_shard(tmp_path):
+    docs = _documents()
+    builder = _builder(tmp_path, shards=3)
+    built = builder.build_vectorstore(docs, "corpus_db", overwrite=True)
+    assert isinstance(built, ShardedVectorStore)
+
+    loaded = builder.load_vectorstore("corpus_db")
+    assert builder.load_layout("corpus_db") == {"shards": 3, "shard_by": "hash"}
+    assert len(loaded) == len(docs)
+    before = [len(shard) for shard in loaded.shards]
+    builder.update_metadata(loaded, [loaded.get(limit=1)["ids"][0]], [{"discipline": "Physics"}])
+    assert len(loaded.get(where={"discipline": "Physics"})["ids"]) == 1
+
+    # Rebuilding shard 1 from the corpus minus one file only changes that shard
+    ids = IndexManifest.chunk_ids(docs)
+    dropped = next(doc for doc, cid in zip(docs, ids) if loaded.shard_index(cid, doc.metadata) == 1)
+    remaining = [doc for doc in docs if doc.metadata["source"] != dropped.metadata["source"]]
+    rebuilt = builder.rebuild_shard(remaining, 1, "corpus_db")
+
+    after = [len(shard) for shard in builder.load_vectorstore("corpus_db").shards]
+    assert after[0] == before[0] and after[2] == before[2]
+    assert after[1] < before[1]
+    assert all(doc.metadata["source"] != dropped.metadata["source"] for doc in rebuilt.shards[1].similarity_search("paper", k=50))
+    assert builder.load_lexical_index("corpus_db").search("paper", k=100)
+
+def test_rebuilding_a_shard_updates_the_manifest(tmp_path):
+    docs = _documents()
+    hashes = {f"paper{f}.pdf": f"v1-{f}" for f in range(6)}
+    builder = _builder(tmp_path, shards=2, shard_by="source")
+    store = builder.build_vectorstore(docs, "corpus_db", overwrite=True, file_hashes=hashes)
+
+    # paper0 changed and lost a chunk; the shard holding it is rebuilt from its files only
+    shard = store.shard_index("", {"source": "paper0.pdf"})
+    files = [doc for doc in docs if store.shard_index("", doc.metadata) == shard and doc.metadata != {"source": "paper0.pdf", "page": 4}]
+    builder.rebuild_shard(files, shard, "corpus_db", file_hashes={**hashes, "paper0.pdf": "v2-0"})
+
+    manifest = builder.load_manifest("corpus_db")
+    assert manifest.files["paper0.pdf"]["hash"] == "v2-0"
+    assert len(manifest.files["paper0.pdf"]["chunks"]) == 4
+    assert sum(len(entry["chunks"]) for entry in manifest.files.values()) == len(builder.load_vectorstore("corpus_db")) == 29
+    assert builder.stale_sources({**hashes, "paper0.pdf": "v2-0"}, "corpus_db") == []
+
+def test_shards_apply_to_new_collections_and_conflict_with_existing_ones(tmp_path):
+    docs = _documents()
+    created = _builder(tmp_path, shards=3).build_vectorstore(docs, "corpus_db")
+    assert isinstance(created, ShardedVectorStore) and len(created.shards) == 3
+
+    _builder(tmp_path).build_vectorstore(docs, "single")
+    with pytest.raises(ValueError, match="already exists"):
+        _builder(tmp_path, shards=2).build_vectorstore(docs, "single")
+    with pytest.raises(ValueError, match="already exists"):
+        _builder(tmp_path, shards=2).open_stream("corpus_db")
+
+def test_incremental_build_shards_a_new_collection_and_rejects_a_layout_change(tmp_path):
+    docs = _documents()
+    hashes = {f"paper{f}.pdf": f"v1-{f}" for f in range(6)}
+    created, _ = _builder(tmp_path, shards=3).sync_vectorstore(docs, hashes, "corpus_db")
+    assert isinstance(created, ShardedVectorStore) and len(created) == len(docs)
+    assert _builder(tmp_path).load_layout("corpus_db") == {"shards": 3, "shard_by": "hash"}
+
+    _builder(tmp_path).sync_vectorstore(docs, hashes, "single")
+    with pytest.raises(ValueError, match="already exists"):
+        _builder(tmp_path, shards=2).sync_vectorstore(docs, hashes, "single")
@@ -0,0 +1,101 @@
+import asyncio
+import threading
+import time
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
+
+from utils.single_flight import CoalescingChatOllama, SingleFlight, SingleFlightEmbeddings
+
+
+class SlowOllama(CoalescingChatOllama):
+    """Replaces the HTTP call with a slow token stream and counts upstream requests."""
+    def model_post_init(self, context):
+        super().model_post_init(context)
+        self._upstream = []
+
+    async def _aiterate_over_stream(self, messages, stop=None, **kwargs):
+        self._upstream.append(messages[-1].content)
+        for token in ["single ", "flight ", "answer"]:
+            await asyncio.sleep(0.01)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    calls: int = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        time.sleep(0.05)
+        return super().embed_documents(texts)
+
+    async def aembed_documents(self, texts):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return super().embed_documents(texts)
+
+def test_concurrent_identical_streams_share_one_request():
+    llm = SlowOllama(model="test")
+
+    async def collect(prompt: str, delay: float = 0) -> str:
+        await asyncio.sleep(delay)
+        return "".join([chunk.content async for chunk in llm.astream(prompt)])
+
+    async def main():
+        # The late caller joins mid-stream and still receives every token
+        return await asyncio.gather(collect("q"), collect("q"), collect("q", delay=0.015), collect("other"))
+
+    answers = asyncio.run(main())
+
+    assert answers == ["single flight answer"] * 4
+    assert sorted(llm._upstream) == ["other", "q"]
+    assert llm.stats()["stream"] == {"calls": 2, "shared": 2, "in_flight": 0}
+
+def test_concurrent_identical_invokes_share_one_request():
+    llm = SlowOllama(model="test")
+
+    async def main():
+        return await asyncio.gather(*(llm.ainvoke("q") for _ in range(5)))
+
+    replies = asyncio.run(main())
+
+    assert {reply.content for reply in replies} == {"single flight answer"}
+    assert len({id(reply) for reply in replies}) == 5
+    assert llm._upstream == ["q"]
+    # Sequential calls are not coalesced
+    asyncio.run(llm.ainvoke("q"))
+    assert llm._upstream == ["q", "q"]
+
+def test_embedding_calls_are_coalesced_across_threads_and_tasks():
+    inner = CountingEmbeddings(size=8)
+    embeddings = SingleFlightEmbeddings(inner)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(embeddings.embed_query("q"))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert inner.calls == 1 and all(vector == results[0] for vector in results)
+
+    async def main():
+        return await asyncio.gather(*(embeddings.aembed_query("q") for _ in range(4)), embeddings.aembed_query("r"))
+
+    vectors = asyncio.run(main())
+    assert inner.calls == 3 and vectors[0] == results[0]
+
+def test_errors_reach_every_waiter_and_are_not_cached():
+    flight = SingleFlight()
+    attempts = []
+
+    async def failing():
+        attempts.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def main():
+        return await asyncio.gather(*(flight.ado("k", failing) for _ in range(3)), return_exceptions=True)
+
+    assert all(isinstance(result, RuntimeError) for result in asyncio.run(main()))
+    asyncio.run(main())
+    assert len(attempts) == 2
+    assert flight.stats() == {"calls": 2, "shared": 4, "in_flight": 0}
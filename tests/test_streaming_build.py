@@ -0,0 +1,72 @@
+import asyncio
+import pytest
+from langchain.schema import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from agents.embedding_agent import EmbeddingAgent
+
+
+FILES = {f"paper{f}.pdf": [f"paper {f} chunk {c} about topic {c}" for c in range(5)] for f in range(8)}
+HASHES = {name: f"hash-{name}" for name in FILES}
+
+def _agent(tmp_path) -> EmbeddingAgent:
+    agent = EmbeddingAgent(persist_dir=str(tmp_path / "db"), cache_path=None, backend="local", batch_size=4, max_concurrency=2)
+    agent.builder.embeddings = DeterministicFakeEmbedding(size=16)
+    return agent
+
+async def _parsed(names, fail_after: int = None):
+    for i, name in enumerate(names):
+        if fail_after is not None and i == fail_after:
+            raise RuntimeError("parser crashed")
+        await asyncio.sleep(0)
+        yield name, [Document(page_content=text, metadata={"source": name, "page": c}) for c, text in enumerate(FILES[name])]
+
+def test_streaming_build_indexes_everything_with_checkpoints(tmp_path):
+    agent = _agent(tmp_path)
+
+    summary = asyncio.run(agent.run_stream(_parsed(list(FILES)), HASHES, overwrite=True, queue_size=2, checkpoint_chunks=10))
+
+    assert summary["files_added"] == 8 and summary["chunks_added"] == 40
+    assert summary["checkpoints"] >= 3
+    store = asyncio.run(agent.load())
+    assert len(store) == 40
+    assert set(agent.builder.load_manifest("corpus_db").files) == set(FILES)
+    assert agent.builder.load_lexical_index("corpus_db").search("chunk", k=100)
+
+def test_interrupted_build_leaves_usable_index_and_resumes(tmp_path):
+    agent = _agent(tmp_path)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(agent.run_stream(_parsed(list(FILES), fail_after=5), HASHES, overwrite=True, checkpoint_chunks=10))
+
+    finished = set(agent.builder.load_manifest("corpus_db").files)
+    store = asyncio.run(agent.load())
+    assert finished and len(finished) <= 5
+    assert {doc.metadata["source"] for doc in store.similarity_search("topic", k=100)} >= finished
+
+    # Resume: only files missing from the manifest are parsed and embedded again
+    stale = asyncio.run(agent.stale_sources(HASHES))
+    assert set(stale) == set(FILES) - finished
+    summary = asyncio.run(agent.run_stream(_parsed(stale), HASHES))
+
+    assert summary["files_added"] == len(stale)
+    assert len(asyncio.run(agent.load())) == 40
+    assert set(agent.builder.load_manifest("corpus_db").files) == set(FILES)
+
+def test_incremental_stream_replaces_changed_and_drops_removed_files(tmp_path):
+    agent = _agent(tmp_path)
+    asyncio.run(agent.run_stream(_parsed(list(FILES)), HASHES, overwrite=True))
+
+    hashes = {name: digest for name, digest in HASHES.items() if name != "paper7.pdf"}
+    hashes["paper0.pdf"] = "changed"
+    FILES["paper0.pdf"][0] = "paper 0 rewritten opening"
+    try:
+        summary = asyncio.run(agent.run_stream(_parsed(["paper0.pdf"]), hashes))
+    finally:
+        FILES["paper0.pdf"][0] = "paper 0 chunk 0 about topic 0"
+
+    assert summary["files_removed"] == 1 and summary["files_updated"] == 1
+    assert summary["chunks_added"] == 1 and summary["chunks_unchanged"] == 4
+    store = asyncio.run(agent.load())
+    assert len(store) == 35
+    assert "paper 0 rewritten opening" in store.get(where={"source": "paper0.pdf"})["documents"]
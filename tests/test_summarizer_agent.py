@@ -0,0 +1,110 @@
+import asyncio
+import random
+from types import SimpleNamespace
+from langchain.schema import Document
+from langchain_core.embeddings import FakeEmbeddings
+
+from agents.summarizer_agent import SummarizerAgent
+from local_vector_store import LocalVectorStore
+
+
+class CountingLLM:
+    """Echoes a short summary and records how many calls overlap."""
+    def __init__(self):
+        self.calls = 0
+        self.active = 0
+        self.peak = 0
+
+    async def ainvoke(self, prompt: str):
+        self.calls += 1
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        return SimpleNamespace(content=f"summary {self.calls}", response_metadata={})
+
+    async def astream(self, prompt: str):
+        self.calls += 1
+        for token in ["final ", "summary"]:
+            yield SimpleNamespace(content=token, response_metadata={})
+
+def _store(n: int = 40) -> LocalVectorStore:
+    store = LocalVectorStore(FakeEmbeddings(size=8))
+    store.add_texts(
+        [f"chunk {i} " + "text " * 100 for i in range(n)] + ["other paper"],
+        metadatas=[{"source": "book.pdf", "page": i // 4} for i in range(n)] + [{"source": "other.pdf", "page": 0}],
+    )
+    return store
+
+def test_run_summarizes_whole_source_with_bounded_concurrency_and_cache():
+    llm = CountingLLM()
+    agent = SummarizerAgent(llm, vector_db=_store(), max_concurrency=3, section_chars=2000, fan_in=3)
+    document = Document(page_content="chunk 7", metadata={"source": "book.pdf"})
+
+    result = asyncio.run(agent.run(document))
+    first_calls = llm.calls
+
+    assert result["metadata"]["chunks"] == 40
+    assert llm.peak <= 3
+    assert first_calls > 10  # one call per ~2000-char section, then the reduce levels
+
+    again = asyncio.run(agent.run(document))
+    assert again["content"] == result["content"]
+    assert llm.calls == first_calls
+
+def test_stream_reports_progress_before_final_summary():
+    llm = CountingLLM()
+    agent = SummarizerAgent(llm, vector_db=_store(), section_chars=2000, fan_in=3)
+    document = Document(page_content="chunk 7", metadata={"source": "book.pdf"})
+
+    async def collect():
+        return [frame async for frame in agent.stream(document)]
+
+    frames = asyncio.run(collect())
+    progress = [frame for frame in frames if frame["type"] == "progress"]
+
+    assert progress[0]["metadata"]["stage"] == "map"
+    maps = [frame["metadata"] for frame in progress if frame["metadata"]["stage"] == "map"]
+    assert maps[-1]["done"] == maps[-1]["total"] > 1
+    assert any(frame["metadata"]["stage"] == "reduce" for frame in progress)
+    assert "".join(frame["content"] for frame in frames if frame["type"] == "summary") == "final summary"
+
+    # The streamed final pass is cached too
+    frames = asyncio.run(collect())
+    assert [frame["content"] for frame in frames if frame["type"] == "summary"] == ["final summary"]
+
+def test_stream_stopped_early_cancels_pending_llm_calls():
+    llm = CountingLLM()
+    agent = SummarizerAgent(llm, vector_db=_store(), max_concurrency=1, section_chars=2000, fan_in=3)
+    document = Document(page_content="chunk 7", metadata={"source": "book.pdf"})
+
+    async def first_frame_then_stop():
+        stream = agent.stream(document)
+        await stream.__anext__()
+        await stream.aclose()
+        calls = llm.calls
+        await asyncio.sleep(0.1)
+        return calls
+
+    calls = asyncio.run(first_frame_then_stop())
+    assert llm.calls == calls
+
+def test_sections_follow_reading_order_when_the_store_returns_chunks_shuffled():
+    store = LocalVectorStore(FakeEmbeddings(size=8))
+    order = list(range(12))
+    random.Random(0).shuffle(order)
+    # Corpus chunks have no page, only their index within the paper
+    store.add_texts([f"part{i:02d}" for i in order], metadatas=[{"source": "paper.pdf", "chunk": i} for i in order])
+    agent = SummarizerAgent(CountingLLM(), vector_db=store, section_chars=10**6)
+
+    chunks = asyncio.run(agent._source_chunks(Document(page_content="part00", metadata={"source": "paper.pdf"})))
+
+    assert [doc.page_content for doc in chunks] == [f"part{i:02d}" for i in range(12)]
+    assert agent._sections(chunks)[0].index("part00") < agent._sections(chunks)[0].index("part11")
+
+def test_single_chunk_without_store_keeps_old_behaviour():
+    llm = CountingLLM()
+    result = asyncio.run(SummarizerAgent(llm).run(Document(page_content="short", metadata={"source": "a.pdf"})))
+
+    assert result["content"] == "summary 1"
+    assert llm.calls == 1
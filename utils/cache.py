@@ -0,0 +1,74 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+from utils.filters import filter_key
+
+
+class TTLCache:
+    """Bounded in-memory LRU cache whose entries expire `ttl` seconds after being stored."""
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = 300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[1] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+        }
+
+def normalize_query(query: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation so trivial variants share a key."""
+    return re.sub(r"\s+", " ", query.lower()).strip().rstrip("?!. ")
+
+class RetrievalCache(TTLCache):
+    """
+    Cache of retrieved documents keyed by normalized query, k, metadata filter and collection.
+    The collection version is part of the key, so a rebuild invalidates every entry at once.
+    """
+    def __init__(self, collection_name: str, version_fn: Callable[[], str] = lambda: "0",
+                 max_size: int = 1024, ttl: Optional[float] = 300):
+        super().__init__(max_size=max_size, ttl=ttl)
+        self.collection_name = collection_name
+        self.version_fn = version_fn
+
+    def key(self, query: str, k: int, filter: Optional[dict] = None) -> tuple:
+        return (normalize_query(query), k, filter_key(filter), self.collection_name, self.version_fn())
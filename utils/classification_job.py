@@ -0,0 +1,243 @@
+import asyncio
+import fcntl
+import json
+import os
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+from langchain_core.vectorstores import VectorStore
+
+from utils.logger import get_logger
+
+
+logger = get_logger(name="classification_job", log_file="logs/classification_job.log")
+
+class ClassificationJob:
+    """
+    Labels a whole collection with the ClassifierAgent and writes `discipline` into chunk metadata.
+
+    With `per_source`, one representative text per file (its first chunks) is classified and the label is
+    applied to every chunk of that file; otherwise each chunk is classified on its own.
+    The collection is read `page_size` chunks at a time; units are sent `batch_size` per prompt, with at most
+    `max_concurrency` prompts in flight, so memory holds one page and the units waiting for a prompt.
+    Given the server's `scheduler`, every prompt also waits for a bulk slot, behind interactive requests.
+    Finished units are appended to a JSONL checkpoint only after their labels are written,
+    so an interrupted job resumes where it stopped.
+
+    Progress is written to a status file next to the checkpoint, and a lock file allows one run at a time,
+    so every server worker reports (and refuses to duplicate) the same job.
+    """
+    def __init__(self, classifier, builder, collection_name: str = "corpus_db", checkpoint_path: Optional[Path] = None,
+                 batch_size: int = 8, max_concurrency: int = 4, per_source: bool = True,
+                 page_size: int = 1000, sample_chars: int = 1000, scheduler=None):
+        self.classifier = classifier
+        self.scheduler = scheduler
+        self.builder = builder
+        self.collection_name = collection_name
+        self.checkpoint_path = Path(checkpoint_path or builder.persist_dir / f"{collection_name}.classify.jsonl")
+        self.status_path = self.checkpoint_path.with_suffix(".status.json")
+        self.lock_path = self.checkpoint_path.with_suffix(".lock")
+        self.batch_size = max(1, batch_size)
+        self.max_concurrency = max(1, max_concurrency)
+        self.per_source = per_source
+        self.page_size = page_size
+        self.sample_chars = sample_chars
+        self.progress = {"state": "idle", "done": 0, "skipped": 0, "chunks": 0}
+        self._lock_file = None
+
+    # === Cross-process state ===
+    def try_lock(self) -> bool:
+        """Take the job lock without waiting; False while a run holds it, in this or another process."""
+        if self._lock_file is not None:
+            return False
+        self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+        lock_file = open(self.lock_path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def unlock(self):
+        if self._lock_file is not None:
+            self._lock_file.close()  # closing releases the flock
+            self._lock_file = None
+
+    def is_running(self) -> bool:
+        if self._lock_file is not None:
+            return True
+        if self.try_lock():
+            self.unlock()
+            return False
+        return True
+
+    def status(self) -> dict:
+        """Progress and result of the latest run, as written by whichever process ran it."""
+        try:
+            with open(self.status_path, "r", encoding="utf-8") as f:
+                status = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {"progress": {**self.progress, "state": "idle"}, "result": None}
+        if status["progress"]["state"] == "running" and not self.is_running():
+            # The process running it died without recording the outcome
+            status["progress"]["state"] = "interrupted"
+        return status
+
+    def _save_status(self, result: Optional[dict] = None):
+        self.status_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.status_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"progress": self.progress, "result": result}, f)
+        os.replace(tmp_path, self.status_path)
+
+    # === Run ===
+    async def run(self, vector_db: VectorStore, restart: bool = False) -> dict:
+        locked = self._lock_file is None
+        if locked and not self.try_lock():
+            raise RuntimeError("classification job already running")
+        try:
+            return await self._run(vector_db, restart)
+        except Exception as e:
+            self.progress["state"] = "failed"
+            self._save_status({"error": str(e)})
+            raise
+        finally:
+            if locked:
+                self.unlock()
+
+    async def _run(self, vector_db: VectorStore, restart: bool) -> dict:
+        if restart and self.checkpoint_path.exists():
+            self.checkpoint_path.unlink()
+        finished = self.load_checkpoint()
+        self.progress = {"state": "running", "done": 0, "skipped": 0, "chunks": 0}
+        self._save_status()
+        labels: Counter = Counter()
+        known = dict(finished)  # unit key -> label, from the checkpoint or this run
+        seen: Set[str] = set()
+        waiting: Dict[str, Tuple[str, List[str]]] = {}  # unit key -> (sample, chunk ids) awaiting a prompt
+        counts = {"updated": 0, "reapplied": 0}
+        lock = asyncio.Lock()
+
+        async def classify(keys: List[str]):
+            queue: asyncio.Queue = asyncio.Queue()
+            for i in range(0, len(keys), self.batch_size):
+                queue.put_nowait(keys[i:i + self.batch_size])
+
+            async def worker():
+                while not queue.empty():
+                    batch = queue.get_nowait()
+                    results = await self._classify_batch([waiting[key][0] for key in batch])
+                    chunk_ids, metadatas = [], []
+                    for key, label in zip(batch, results):
+                        chunk_ids.extend(waiting[key][1])
+                        metadatas.extend([{"discipline": label}] * len(waiting[key][1]))
+                        labels[label] += 1
+                    async with lock:
+                        # One metadata update per batch, checkpointed only once it is written
+                        await asyncio.to_thread(self.builder.update_metadata, vector_db, chunk_ids, metadatas)
+                        self._append_checkpoint(dict(zip(batch, results)))
+                        known.update(zip(batch, results))
+                        counts["updated"] += len(chunk_ids)
+                        self.progress["done"] += len(batch)
+                        self._save_status()
+                    logger.info(f"classified {self.progress['done']} units")
+
+            await asyncio.gather(*(worker() for _ in range(min(self.max_concurrency, queue.qsize()))))
+            for key in keys:
+                del waiting[key]
+
+        offset = 0
+        while True:
+            page = await asyncio.to_thread(
+                vector_db.get, limit=self.page_size, offset=offset, include=["documents", "metadatas"]
+            )
+            if not page["ids"]:
+                break
+            offset += len(page["ids"])
+            self.progress["chunks"] += len(page["ids"])
+
+            # Re-apply known labels (cheap, no LLM) to chunks that lack them, e.g. chunks added by an
+            # incremental build, not yet saved when the last run stopped, or on a later page than their unit's
+            stale_ids, stale_metadatas = [], []
+            for chunk_id, text, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+                text, metadata = text or "", metadata or {}
+                key = metadata.get("source", chunk_id) if self.per_source else chunk_id
+                if key not in seen:
+                    seen.add(key)
+                    if key in finished:
+                        labels[finished[key]] += 1
+                        self.progress["skipped"] += 1
+                if key in known:
+                    if metadata.get("discipline") != known[key]:
+                        stale_ids.append(chunk_id)
+                        stale_metadatas.append({"discipline": known[key]})
+                    continue
+                sample, chunk_ids = waiting.get(key, ("", []))
+                if len(sample) < self.sample_chars:
+                    sample = f"{sample}\n{text}" if sample else text
+                chunk_ids.append(chunk_id)
+                waiting[key] = (sample, chunk_ids)
+            if stale_ids:
+                await asyncio.to_thread(self.builder.update_metadata, vector_db, stale_ids, stale_metadatas)
+                counts["reapplied"] += len(stale_ids)
+
+            # Prompt once enough units wait to fill every worker; a unit cut by the page boundary
+            # is labelled from its first chunks and the rest pick the label up on the next page
+            ready = self.batch_size * self.max_concurrency
+            while len(waiting) >= ready:
+                await classify(list(waiting)[:ready])
+        if waiting:
+            await classify(list(waiting))
+
+        if counts["updated"] or counts["reapplied"]:
+            # Metadata changed: persist the local store and invalidate cached retrievals
+            await asyncio.to_thread(self.builder._persist, vector_db)
+            self.builder.bump_version(self.collection_name)
+        self.progress["state"] = "done"
+        summary = {
+            "units": len(seen),
+            "classified": self.progress["done"],
+            "skipped": self.progress["skipped"],
+            "chunks_updated": counts["updated"] + counts["reapplied"],
+            "labels": dict(labels),
+        }
+        self._save_status(summary)
+        logger.info(f"classification job finished: {summary}")
+        return summary
+
+    async def _classify_batch(self, texts: List[str]) -> List[str]:
+        """One prompt, admitted by the server's RequestScheduler (as bulk traffic) when there is one."""
+        if self.scheduler is None:
+            return await self.classifier.classify_batch(texts, self.sample_chars)
+        while True:
+            try:
+                async with self.scheduler.slot("bulk"):
+                    return await self.classifier.classify_batch(texts, self.sample_chars)
+            except Exception as e:
+                # Overloaded: a background job waits its turn instead of failing
+                if getattr(e, "retry_after", None) is None:
+                    raise
+                logger.info(f"scheduler busy, retrying batch in {e.retry_after}s")
+                await asyncio.sleep(e.retry_after)
+
+    def load_checkpoint(self) -> Dict[str, str]:
+        finished: Dict[str, str] = {}
+        if not self.checkpoint_path.exists():
+            return finished
+        with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn last line from an interrupted write
+                finished[entry["key"]] = entry["discipline"]
+        return finished
+
+    def _append_checkpoint(self, results: Dict[str, str]):
+        self.checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.checkpoint_path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps({"key": key, "discipline": label}) + "\n" for key, label in results.items()))
+            f.flush()
+            os.fsync(f.fileno())
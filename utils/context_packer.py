@@ -0,0 +1,112 @@
+import re
+import threading
+from typing import List, Optional, Sequence, Tuple
+from langchain_core.documents import Document
+
+from utils.tokens import estimate_tokens
+from utils.logger import get_logger
+
+
+logger = get_logger(name="context_packer", log_file="logs/context_packer.log")
+
+def overlap_length(left: str, right: str, min_overlap: int = 20, max_overlap: int = 400) -> int:
+    """Length of the longest suffix of `left` that is also a prefix of `right` (0 if shorter than min_overlap)."""
+    if len(left) < min_overlap or len(right) < min_overlap:
+        return 0
+    tail = left[-max_overlap:]
+    probe = right[:min_overlap]
+    start = tail.find(probe)
+    while start != -1:
+        if right.startswith(tail[start:]):
+            return len(tail) - start
+        start = tail.find(probe, start + 1)
+    return 0
+
+class ContextPacker:
+    """
+    Turns ranked chunks into a prompt context that fits a token budget.
+
+    Exact duplicates and chunks contained in another chunk are dropped; chunks of the same source whose
+    text overlaps (the splitter's chunk_overlap) are stitched into one passage without the repeated part.
+    Passages are then added in relevance order, the rank of a passage being that of its best chunk,
+    until the budget is used up.
+    """
+    def __init__(self, token_budget: Optional[int] = 2000, min_overlap: int = 20, max_overlap: int = 400,
+                 separator: str = "\n\n"):
+        self.token_budget = token_budget
+        self.min_overlap = min_overlap
+        self.max_overlap = max_overlap
+        self.separator = separator
+        self.requests = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self._lock = threading.Lock()
+
+    def pack(self, docs: Sequence[Document]) -> Tuple[str, dict]:
+        """:return: (context text, stats with naive and packed token counts)"""
+        passages = self._merge(self._dedupe(docs))
+        passages.sort(key=lambda passage: passage[0])
+
+        parts, used = [], 0
+        for _, _, text in passages:
+            cost = estimate_tokens(text)
+            if self.token_budget is not None and used + cost > self.token_budget:
+                if parts:
+                    continue  # a smaller, less relevant passage may still fit
+                # Never send an empty context: cut the best passage down to the budget
+                text = text[:self.token_budget * 4]
+                cost = estimate_tokens(text)
+            parts.append(text)
+            used += cost
+
+        naive = sum(estimate_tokens(doc.page_content) for doc in docs)
+        stats = {"chunks": len(docs), "passages": len(parts), "naive_tokens": naive, "packed_tokens": used}
+        with self._lock:
+            self.requests += 1
+            self.tokens_in += naive
+            self.tokens_out += used
+        return self.separator.join(parts), stats
+
+    def _dedupe(self, docs: Sequence[Document]) -> List[Tuple[int, str, str]]:
+        """(rank, source, text) of the chunks that are not repeated inside a better-ranked chunk."""
+        kept: List[Tuple[int, str, str]] = []
+        for rank, doc in enumerate(docs):
+            text = doc.page_content.strip()
+            normalized = re.sub(r"\s+", " ", text)
+            source = doc.metadata.get("source", "")
+            if not text or any(source == s and normalized in re.sub(r"\s+", " ", t) for _, s, t in kept):
+                continue
+            # A later chunk may contain earlier, better-ranked ones; keep the better rank
+            contained = [item for item in kept if item[1] == source and re.sub(r"\s+", " ", item[2]) in normalized]
+            if contained:
+                rank = min(item[0] for item in contained)
+                kept = [item for item in kept if item not in contained]
+            kept.append((rank, source, text))
+        return kept
+
+    def _merge(self, chunks: List[Tuple[int, str, str]]) -> List[Tuple[int, str, str]]:
+        """Stitch overlapping chunks of the same source until no pair overlaps."""
+        merged = True
+        while merged:
+            merged = False
+            for i, (rank_a, source_a, text_a) in enumerate(chunks):
+                for j, (rank_b, source_b, text_b) in enumerate(chunks):
+                    if i == j or source_a != source_b:
+                        continue
+                    overlap = overlap_length(text_a, text_b, self.min_overlap, self.max_overlap)
+                    if overlap:
+                        chunks[i] = (min(rank_a, rank_b), source_a, text_a + text_b[overlap:])
+                        del chunks[j]
+                        merged = True
+                        break
+                if merged:
+                    break
+        return chunks
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "token_budget": self.token_budget,
+            "avg_naive_tokens": self.tokens_in / self.requests if self.requests else 0.0,
+            "avg_packed_tokens": self.tokens_out / self.requests if self.requests else 0.0,
+        }
@@ -0,0 +1,146 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+from langchain_core.prompts import ChatPromptTemplate
+
+from utils.tokens import estimate_tokens
+from utils.logger import get_logger
+
+
+logger = get_logger(name="conversation_memory", log_file="logs/conversation_memory.log")
+
+SUMMARY_PROMPT = ChatPromptTemplate.from_template(
+    """Update the running summary of a conversation between a user and a research assistant.
+Keep the topics, papers, names and numbers that later questions may refer to.
+Reply with the updated summary only, in at most {words} words.
+
+Current summary:
+{summary}
+
+New exchanges:
+{turns}"""
+)
+
+def clip(text: str, tokens: int) -> str:
+    """Cut `text` to roughly `tokens` tokens."""
+    return text if estimate_tokens(text) <= tokens else text[:tokens * 4].rstrip() + "..."
+
+class ConversationMemory:
+    """
+    Prompt history of one conversation under a fixed token budget.
+
+    The latest turns are kept verbatim. Once they exceed their share of the budget, the oldest ones are
+    folded into a running summary. Each update sends the LLM only the previous summary and the turns being
+    folded, so its cost does not grow with the length of the conversation.
+    """
+    def __init__(self, llm, token_budget: int = 800, summary_share: float = 0.5):
+        self.llm = llm
+        self.token_budget = token_budget
+        self.summary_budget = int(token_budget * summary_share)
+        self.turns_budget = token_budget - self.summary_budget
+        self.summary = ""
+        self.turns: List[Tuple[str, str]] = []
+        self._lock = asyncio.Lock()
+
+    async def add_turn(self, question: str, answer: str):
+        async with self._lock:
+            # A single turn never takes more than the verbatim share of the budget
+            half = max(1, self.turns_budget // 2)
+            self.turns.append((clip(question, half), clip(answer, half)))
+            evicted = []
+            while len(self.turns) > 1 and self._turns_tokens() > self.turns_budget:
+                evicted.append(self.turns.pop(0))
+            if evicted:
+                self.summary = await self._summarize(evicted)
+
+    def render(self) -> str:
+        """History section for the prompt, empty for a new conversation."""
+        if not self.summary and not self.turns:
+            return ""
+        parts = [f"Summary of the earlier conversation: {self.summary}"] if self.summary else []
+        parts += [self._format(turn) for turn in self.turns]
+        return "Conversation so far:\n" + "\n".join(parts) + "\n"
+
+    def tokens(self) -> int:
+        return estimate_tokens(self.render())
+
+    async def _summarize(self, evicted: List[Tuple[str, str]]) -> str:
+        turns = "\n".join(self._format(turn) for turn in evicted)
+        try:
+            reply = await self.llm.ainvoke(SUMMARY_PROMPT.format_messages(
+                summary=self.summary or "(none)", turns=turns, words=int(self.summary_budget * 0.75)
+            ))
+            summary = reply.content.strip()
+        except Exception as e:
+            logger.warning(f"conversation summary failed, keeping the earlier questions only: {e}")
+            summary = " ".join([self.summary] + [f"The user asked: {question}" for question, _ in evicted]).strip()
+        # Keep the newest part when the summary overshoots its budget
+        return summary if estimate_tokens(summary) <= self.summary_budget else "..." + summary[-self.summary_budget * 4:]
+
+    def _turns_tokens(self) -> int:
+        return sum(estimate_tokens(self._format(turn)) for turn in self.turns)
+
+    @staticmethod
+    def _format(turn: Tuple[str, str]) -> str:
+        return f"User: {turn[0]}\nAssistant: {turn[1]}"
+
+class SessionStore:
+    """
+    ConversationMemory per session id, bounded to `max_sessions` (least recently used dropped first)
+    and to sessions active within the last `ttl` seconds. Every memory is token-bounded, so RAM is capped
+    at roughly max_sessions * token_budget tokens.
+    """
+    def __init__(self, factory: Callable[[], ConversationMemory], max_sessions: int = 5000, ttl: Optional[float] = 1800):
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.evicted = 0
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def open(self, session_id: Optional[str] = None) -> str:
+        """
+        Session to use for a connection: `session_id` when it was issued here and is still live,
+        otherwise a newly issued one. Clients can only continue sessions, never name them.
+        """
+        self._expire(time.monotonic())
+        if session_id is None or session_id not in self._sessions:
+            session_id = str(uuid.uuid4())
+        self.get(session_id)
+        return session_id
+
+    def get(self, session_id: str) -> ConversationMemory:
+        now = time.monotonic()
+        self._expire(now)
+        entry = self._sessions.pop(session_id, None)
+        memory = entry[0] if entry is not None else self.factory()
+        self._sessions[session_id] = (memory, now)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evicted += 1
+        return memory
+
+    def drop(self, session_id: str):
+        self._sessions.pop(session_id, None)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _expire(self, now: float):
+        # Ordered by last use, so idle sessions are at the front
+        while self.ttl is not None and self._sessions:
+            session_id, (_, last_used) = next(iter(self._sessions.items()))
+            if now - last_used <= self.ttl:
+                break
+            del self._sessions[session_id]
+            self.evicted += 1
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "ttl": self.ttl,
+            "evicted": self.evicted,
+            "tokens": sum(memory.tokens() for memory, _ in self._sessions.values()),
+        }
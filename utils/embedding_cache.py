@@ -0,0 +1,151 @@
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+from langchain_core.embeddings import Embeddings
+
+from utils.logger import get_logger
+
+
+logger = get_logger(name="embedding_cache", log_file="logs/embedding_cache.log")
+
+class EmbeddingCache:
+    """
+    On-disk LRU cache of embedding vectors, keyed by model name plus a hash of the text.
+    Backed by SQLite so it survives crashes and can be shared by several processes.
+
+    Lookups only read. The recency of hits is recorded later, in the next write transaction
+    (or once `touch_batch` hits are pending). The LRU clock and the entry count are read inside each
+    write transaction, so they stay right when several processes write to the same file.
+    """
+    def __init__(self, path: Path, max_entries: int = 200_000, touch_batch: int = 1024):
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_batch = touch_batch
+        self.hits = 0
+        self.misses = 0
+        self._touched: Set[str] = set()
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Autocommit mode: writes open their own BEGIN IMMEDIATE transaction
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def key(model_name: str, text: str) -> str:
+        return f"{model_name}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+    def get_many(self, keys: List[str]) -> List[Optional[List[float]]]:
+        if not keys:
+            return []
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+            self._touched.update(found)
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+            if len(self._touched) >= self.touch_batch:
+                self._write({})
+        return [found.get(key) for key in keys]
+
+    def put_many(self, items: Dict[str, List[float]]):
+        if not items:
+            return
+        with self._lock:
+            self._write(items)
+
+    def flush(self):
+        """Record the recency of pending hits."""
+        with self._lock:
+            if self._touched:
+                self._write({})
+
+    def _write(self, items: Dict[str, List[float]]):
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            clock = self._conn.execute("SELECT COALESCE(MAX(last_used), 0) + 1 FROM embeddings").fetchone()[0]
+            if self._touched:
+                self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(clock, key) for key in self._touched])
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), clock) for key, vector in items.items()]
+            )
+            self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if self._size > self.max_entries:
+                self._evict(self._size - self.max_entries)
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._touched.clear()
+
+    def _evict(self, count: int):
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (count,)
+        )
+        self._size -= count
+        logger.info(f"evicted {count} least recently used embeddings")
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": self._size,  # as of this process's last write
+            "max_entries": self.max_entries,
+        }
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that consults an EmbeddingCache before calling the underlying model."""
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, model_name: str):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model_name = model_name
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors, missing = self._lookup(texts)
+        if missing:
+            computed = self.embeddings.embed_documents([texts[i] for i in missing])
+            self._store(keys, vectors, missing, computed)
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        # SQLite calls may wait on another process's write lock, so they stay off the event loop
+        keys, vectors, missing = await asyncio.to_thread(self._lookup, texts)
+        if missing:
+            computed = await self.embeddings.aembed_documents([texts[i] for i in missing])
+            await asyncio.to_thread(self._store, keys, vectors, missing, computed)
+        return vectors
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    def _lookup(self, texts: List[str]):
+        keys = [EmbeddingCache.key(self.model_name, text) for text in texts]
+        vectors = self.cache.get_many(keys)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        return keys, vectors, missing
+
+    def _store(self, keys: List[str], vectors: list, missing: List[int], computed: List[List[float]]):
+        for i, vector in zip(missing, computed):
+            vectors[i] = vector
+        self.cache.put_many({keys[i]: vectors[i] for i in missing})
@@ -0,0 +1,110 @@
+import json
+import re
+from datetime import date, datetime
+from typing import Any, Iterable, Optional, Union
+
+
+def parse_date(value: Union[str, int, date, None], end: bool = False) -> Optional[int]:
+    """
+    Date as an int YYYYMMDD, the form stored in chunk metadata (Chroma only compares numbers).
+    Accepts "2023", "2023-05", "2023-05-01" (zero padding optional, ISO times ignored),
+    PDF dates such as "D:20230501..." and ints;
+    partial dates expand to the first day, or the last possible day with `end`.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, (date, datetime)):
+        return value.year * 10000 + value.month * 100 + value.day
+    text = str(value).strip()
+    if text.startswith("D:"):
+        # PDF dates: D:YYYYMMDDHHmmSS with an optional timezone suffix
+        digits = re.sub(r"\D", "", text[2:])[:8]
+        match = re.fullmatch(r"(\d{4})(\d{2})?(\d{2})?", digits)
+    elif text.isdigit():
+        match = re.fullmatch(r"(\d{4})(\d{2})?(\d{2})?", text)
+    else:
+        # YYYY[-M[-D]], optionally followed by an ISO time ("2023-05-01T12:00:00+00:00")
+        match = re.fullmatch(r"(\d{4})(?:-(\d{1,2})(?:-(\d{1,2})(?:[T ]\d{2}:\d{2}.*)?)?)?", text)
+    if match is None:
+        raise ValueError(f"unrecognized date '{value}', expected YYYY, YYYY-MM or YYYY-MM-DD")
+    year, month, day = (int(part) if part else None for part in match.groups())
+    try:
+        date(year, month or 1, day or 1)
+    except ValueError as e:
+        raise ValueError(f"invalid date '{value}': {e}") from None
+    if month is None:
+        month, day = (12, 31) if end else (1, 1)
+    elif day is None:
+        day = 31 if end else 1
+    return year * 10000 + month * 100 + day
+
+def build_where(source: Union[str, Iterable[str], None] = None, page: Union[int, Iterable[int], None] = None,
+                discipline: Union[str, Iterable[str], None] = None,
+                date_from: Union[str, int, None] = None, date_to: Union[str, int, None] = None) -> Optional[dict]:
+    """Chroma-style `where` clause for the supported filters, or None when no filter is set."""
+    clauses = []
+    for key, value in (("source", source), ("page", page), ("discipline", discipline)):
+        if value is None or value == "" or value == []:
+            continue
+        values = [value] if isinstance(value, (str, int)) else list(value)
+        if key == "page":
+            values = [int(v) for v in values]
+        clauses.append({key: values[0]} if len(values) == 1 else {key: {"$in": values}})
+    if date_from not in (None, ""):
+        clauses.append({"date": {"$gte": parse_date(date_from)}})
+    if date_to not in (None, ""):
+        clauses.append({"date": {"$lte": parse_date(date_to, end=True)}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+def where_from_payload(payload: Optional[dict]) -> Optional[dict]:
+    """`where` clause from a request's `filter` object with keys source, page, discipline, date_from, date_to."""
+    if not payload:
+        return None
+    allowed = {"source", "page", "discipline", "date_from", "date_to"}
+    unknown = set(payload) - allowed
+    if unknown:
+        raise ValueError(f"unsupported filter keys {sorted(unknown)}, expected {sorted(allowed)}")
+    return build_where(**payload)
+
+def matches(metadata: dict, where: Optional[dict]) -> bool:
+    """Evaluate a `where` clause against one metadata dict."""
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(metadata, clause) for clause in condition):
+                return False
+        elif not _check(metadata.get(key), condition):
+            return False
+    return True
+
+def _check(value: Any, condition: Any) -> bool:
+    if not isinstance(condition, dict):
+        return value == condition
+    for op, operand in condition.items():
+        if op == "$eq":
+            ok = value == operand
+        elif op == "$ne":
+            ok = value != operand
+        elif op == "$in":
+            ok = value in operand
+        elif op == "$nin":
+            ok = value not in operand
+        elif op in ("$gt", "$gte", "$lt", "$lte"):
+            if value is None:
+                return False
+            ok = {"$gt": value > operand, "$gte": value >= operand, "$lt": value < operand, "$lte": value <= operand}[op]
+        else:
+            raise ValueError(f"unsupported filter operator '{op}'")
+        if not ok:
+            return False
+    return True
+
+def filter_key(where: Optional[dict]) -> str:
+    """Stable string form of a `where` clause, for cache keys."""
+    return json.dumps(where, sort_keys=True) if where else ""
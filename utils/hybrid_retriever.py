@@ -0,0 +1,94 @@
+import asyncio
+from typing import Dict, List, Optional, Sequence, Tuple
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores import VectorStore
+
+from bm25_index import BM25Index
+from utils.filters import matches
+from utils.multi_query_retriever import doc_key
+from utils.logger import get_logger
+
+
+logger = get_logger(name="hybrid_retriever", log_file="logs/hybrid_retriever.log")
+
+def min_max(scores: Dict[str, float]) -> Dict[str, float]:
+    """Rescale scores to [0, 1] so lexical and vector scores can be added."""
+    if not scores:
+        return {}
+    low, high = min(scores.values()), max(scores.values())
+    if high == low:
+        return dict.fromkeys(scores, 1.0)
+    return {key: (score - low) / (high - low) for key, score in scores.items()}
+
+class HybridRetriever(BaseRetriever):
+    """
+    Lexical + vector retrieval fused by weighted, min-max normalized scores.
+
+    BM25 catches exact identifiers (model names, arXiv ids, equation labels) that embeddings blur,
+    the vector search catches paraphrases. `alpha` is the weight of the vector score.
+    With `prefilter` set, the vector search is restricted to the top `prefilter` BM25 candidates
+    instead of the whole collection. A `filter` (Chroma `where` clause) passed to invoke applies to both sides.
+    """
+    vectorstore: VectorStore
+    lexical_index: BM25Index
+    search_k: int = 10
+    alpha: float = 0.5
+    prefilter: Optional[int] = None
+    filter_overfetch: int = 10
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun,
+                                       filter: Optional[dict] = None) -> List[Document]:
+        lexical_hits = await asyncio.to_thread(self._lexical_search, query, filter)
+        vector_hits = await self.vectorstore.asimilarity_search_with_score(
+            query, k=self.search_k, **self._vector_kwargs(lexical_hits, filter)
+        )
+        missing = self._missing_ids(vector_hits, lexical_hits)
+        fetched = await self.vectorstore.aget_by_ids(missing) if missing else []
+        return self._fuse(vector_hits, lexical_hits, fetched)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun,
+                                filter: Optional[dict] = None) -> List[Document]:
+        lexical_hits = self._lexical_search(query, filter)
+        vector_hits = self.vectorstore.similarity_search_with_score(
+            query, k=self.search_k, **self._vector_kwargs(lexical_hits, filter)
+        )
+        missing = self._missing_ids(vector_hits, lexical_hits)
+        fetched = self.vectorstore.get_by_ids(missing) if missing else []
+        return self._fuse(vector_hits, lexical_hits, fetched)
+
+    def _lexical_search(self, query: str, filter: Optional[dict] = None) -> List[Tuple[str, float]]:
+        k = max(self.search_k, self.prefilter or 0)
+        if not filter:
+            return self.lexical_index.search(query, k=k)
+        # The BM25 index has no metadata: over-fetch, then keep the hits whose chunk matches the filter
+        hits = self.lexical_index.search(query, k=k * self.filter_overfetch)
+        allowed = {doc.id for doc in self.vectorstore.get_by_ids([doc_id for doc_id, _ in hits]) if matches(doc.metadata, filter)}
+        return [(doc_id, score) for doc_id, score in hits if doc_id in allowed][:k]
+
+    def _vector_kwargs(self, lexical_hits: List[Tuple[str, float]], filter: Optional[dict] = None) -> dict:
+        kwargs = {"filter": filter} if filter else {}
+        if self.prefilter is not None and lexical_hits:
+            # Without any lexical match this falls back to a full (filtered) vector search
+            kwargs["ids"] = [doc_id for doc_id, _ in lexical_hits[:self.prefilter]]
+        return kwargs
+
+    def _missing_ids(self, vector_hits: Sequence[Tuple[Document, float]], lexical_hits: List[Tuple[str, float]]) -> List[str]:
+        found = {doc.id for doc, _ in vector_hits}
+        return [doc_id for doc_id, _ in lexical_hits[:self.search_k] if doc_id not in found]
+
+    def _fuse(self, vector_hits: Sequence[Tuple[Document, float]], lexical_hits: List[Tuple[str, float]],
+              fetched: List[Document]) -> List[Document]:
+        docs = {doc_key(doc): doc for doc in fetched}
+        docs.update({doc_key(doc): doc for doc, _ in vector_hits})
+        # Stores return distances (lower is closer); negate so that higher is better like BM25
+        vector_scores = min_max({doc_key(doc): -distance for doc, distance in vector_hits})
+        lexical_scores = min_max(dict(lexical_hits[:self.search_k]))
+        scores = {
+            key: self.alpha * vector_scores.get(key, 0.0) + (1 - self.alpha) * lexical_scores.get(key, 0.0)
+            for key in docs
+        }
+        ranked = sorted(scores, key=scores.get, reverse=True)
+        logger.info(f"hybrid retrieval: {len(vector_hits)} vector hits, {len(lexical_hits)} lexical hits, {len(ranked)} fused")
+        return [docs[key] for key in ranked]
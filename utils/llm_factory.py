@@ -1,5 +1,32 @@
-from langchain_ollama import ChatOllama
+from functools import lru_cache
+from typing import Optional
+import httpx
+from langchain_core.embeddings import Embeddings
+from langchain_ollama import ChatOllama, OllamaEmbeddings
 
-def make_llm(model: str = "gemma3", temperature: float = 0.3) -> ChatOllama:
-    """Factory to create an Ollama LLM instance."""
-    return ChatOllama(model=model, temperature=temperature)
+from utils.single_flight import CoalescingChatOllama, SingleFlightEmbeddings
+
+def client_kwargs(pool_size: int = 32, timeout: Optional[float] = 120) -> dict:
+    """HTTP options for the Ollama clients: a keep-alive connection pool sized for concurrent sessions."""
+    return {
+        "limits": httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size, keepalive_expiry=60),
+        "timeout": timeout,
+    }
+
+@lru_cache(maxsize=None)
+def make_llm(model: str = "gemma3", temperature: float = 0.3, pool_size: int = 32, timeout: Optional[float] = 120,
+             single_flight: bool = True) -> ChatOllama:
+    """
+    Factory to create an Ollama LLM instance.
+    Instances are shared per model and options, so every agent uses the same connection pool and
+    concurrent identical calls are coalesced.
+    """
+    llm_class = CoalescingChatOllama if single_flight else ChatOllama
+    return llm_class(model=model, temperature=temperature, client_kwargs=client_kwargs(pool_size, timeout))
+
+@lru_cache(maxsize=None)
+def make_embeddings(model: str = "nomic-embed-text", pool_size: int = 32, timeout: Optional[float] = 120,
+                    single_flight: bool = True) -> Embeddings:
+    """Factory to create the shared Ollama embedding client for a model."""
+    embeddings = OllamaEmbeddings(model=model, client_kwargs=client_kwargs(pool_size, timeout))
+    return SingleFlightEmbeddings(embeddings) if single_flight else embeddings
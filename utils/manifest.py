@@ -0,0 +1,67 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, List
+
+
+class IndexManifest:
+    """
+    Per-collection record of which files are indexed, their content hash,
+    and the ids of the chunks they produced.
+
+    Stored as JSON next to the vector store:
+    {"files": {"paper.pdf": {"hash": "<sha256>", "chunks": ["<chunk id>", ...]}}}
+    """
+    def __init__(self, path: Path, files: Dict[str, dict] = None):
+        self.path = path
+        self.files: Dict[str, dict] = files or {}
+
+    @classmethod
+    def load(cls, path: Path) -> "IndexManifest":
+        if not path.exists():
+            return cls(path)
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(path, data.get("files", {}))
+
+    def save(self):
+        """Write atomically so an interrupted build never leaves a truncated manifest."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"files": self.files}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def hash_file(path: Path, block_size: int = 1 << 20) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def chunk_ids(documents: list) -> List[str]:
+        """
+        Deterministic chunk ids from source name and chunk text.
+        Identical chunks within one source get an occurrence suffix so ids stay unique.
+        """
+        ids, seen = [], {}
+        for doc in documents:
+            source = doc.metadata.get("source", "")
+            digest = hashlib.sha256(f"{source}\0{doc.page_content}".encode("utf-8")).hexdigest()
+            count = seen.get(digest, 0)
+            seen[digest] = count + 1
+            ids.append(digest if count == 0 else f"{digest}-{count}")
+        return ids
+
+    def stale_sources(self, file_hashes: Dict[str, str]) -> List[str]:
+        """Sources that are new or whose content hash changed."""
+        return [
+            source for source, file_hash in file_hashes.items()
+            if self.files.get(source, {}).get("hash") != file_hash
+        ]
+
+    def removed_sources(self, file_hashes: Dict[str, str]) -> List[str]:
+        return [source for source in self.files if source not in file_hashes]
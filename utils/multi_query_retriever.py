@@ -0,0 +1,137 @@
+import asyncio
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, List, Optional, Sequence
+from langchain.retrievers.multi_query import DEFAULT_QUERY_PROMPT, LineListOutputParser
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.prompts import BasePromptTemplate
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables import Runnable
+from langchain_core.vectorstores import VectorStore
+
+from utils.timing import StageTimings
+from utils.logger import get_logger
+
+
+logger = get_logger(name="multi_query_retriever", log_file="logs/multi_query_retriever.log")
+
+def doc_key(doc: Document) -> str:
+    """Identity of a retrieved chunk: its store id when present, else source + text."""
+    return doc.id or f"{doc.metadata.get('source', '')}\0{doc.page_content}"
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Document]], k: int = 60) -> List[Document]:
+    """
+    Merge several ranked lists into one, scoring each document by sum(1 / (k + rank)).
+    Documents found by many queries, or near the top of any, come first.
+    """
+    scores: Dict[str, float] = {}
+    docs: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, 1):
+            key = doc_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            docs.setdefault(key, doc)
+    return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+class FusionMultiQueryRetriever(BaseRetriever):
+    """
+    Multi-query retriever that searches all query variants concurrently
+    and merges the results with reciprocal rank fusion.
+
+    A `filter` (Chroma `where` clause) passed to invoke restricts every variant search.
+
+    latency_budget (seconds) bounds the LLM query expansion:
+    None waits for it, 0 skips it, and any other value falls back to the original query alone
+    when the expansion does not finish in time.
+
+    With `speculative`, the async path searches the original query while the LLM is still expanding it,
+    so only the variant searches wait for the expansion. Stage durations go to `timings` when set.
+    """
+    vectorstore: VectorStore
+    llm_chain: Optional[Runnable] = None
+    search_k: int = 10
+    rrf_k: int = 60
+    include_original: bool = True
+    latency_budget: Optional[float] = None
+    speculative: bool = True
+    timings: Optional[StageTimings] = None
+
+    @classmethod
+    def from_llm(cls, vectorstore: VectorStore, llm, prompt: BasePromptTemplate = DEFAULT_QUERY_PROMPT, **kwargs) -> "FusionMultiQueryRetriever":
+        return cls(vectorstore=vectorstore, llm_chain=prompt | llm | LineListOutputParser(), **kwargs)
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun,
+                                       filter: Optional[dict] = None) -> List[Document]:
+        search_kwargs = {"filter": filter} if filter else {}
+        if not (self.speculative and self.include_original and self._should_expand()):
+            queries = await self.agenerate_queries(query)
+            rankings = await asyncio.gather(*(self._asearch(q, "search", search_kwargs) for q in queries))
+            return reciprocal_rank_fusion(rankings, k=self.rrf_k)
+
+        # The original query does not depend on the expansion, so its search overlaps the LLM call
+        original = asyncio.ensure_future(self._asearch(query, "search_original", search_kwargs))
+        try:
+            queries = await self.agenerate_queries(query)
+            variants = await asyncio.gather(*(self._asearch(q, "search_variant", search_kwargs) for q in queries[1:]))
+            rankings = [await original, *variants]
+        finally:
+            original.cancel()
+        return reciprocal_rank_fusion(rankings, k=self.rrf_k)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun,
+                                filter: Optional[dict] = None) -> List[Document]:
+        queries = self.generate_queries(query)
+        search_kwargs = {"filter": filter} if filter else {}
+        with ThreadPoolExecutor(max_workers=len(queries)) as pool:
+            rankings = list(pool.map(lambda q: self.vectorstore.similarity_search(q, k=self.search_k, **search_kwargs), queries))
+        return reciprocal_rank_fusion(rankings, k=self.rrf_k)
+
+    async def agenerate_queries(self, query: str) -> List[str]:
+        if not self._should_expand():
+            return [query]
+        try:
+            expansion = self.llm_chain.ainvoke({"question": query})
+            with self._time("expand"):
+                variants = await (expansion if self.latency_budget is None else asyncio.wait_for(expansion, self.latency_budget))
+        except asyncio.TimeoutError:
+            logger.warning(f"query expansion exceeded {self.latency_budget}s budget, using original query only")
+            variants = []
+        except Exception as e:
+            logger.error(f"query expansion failed, using original query only: {e}")
+            variants = []
+        return self._with_original(query, variants)
+
+    def generate_queries(self, query: str) -> List[str]:
+        if not self._should_expand():
+            return [query]
+        # Not a context manager: on timeout the expansion is abandoned instead of waited for
+        pool = ThreadPoolExecutor(max_workers=1)
+        future = pool.submit(self.llm_chain.invoke, {"question": query})
+        try:
+            variants = future.result(timeout=self.latency_budget)
+        except FutureTimeoutError:
+            logger.warning(f"query expansion exceeded {self.latency_budget}s budget, using original query only")
+            variants = []
+        except Exception as e:
+            logger.error(f"query expansion failed, using original query only: {e}")
+            variants = []
+        finally:
+            pool.shutdown(wait=False)
+        return self._with_original(query, variants)
+
+    async def _asearch(self, query: str, stage: str, search_kwargs: dict) -> List[Document]:
+        with self._time(stage):
+            return await self.vectorstore.asimilarity_search(query, k=self.search_k, **search_kwargs)
+
+    def _time(self, stage: str):
+        return self.timings.time(stage) if self.timings is not None else nullcontext()
+
+    def _should_expand(self) -> bool:
+        return self.llm_chain is not None and self.latency_budget != 0
+
+    def _with_original(self, query: str, variants: List[str]) -> List[str]:
+        queries = [query] if self.include_original or not variants else []
+        queries += [v.strip() for v in variants if v.strip() and v.strip() != query]
+        logger.info(f"generated queries: {queries}")
+        return queries
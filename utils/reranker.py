@@ -0,0 +1,118 @@
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from langchain_core.documents import Document
+
+from bm25_index import tokenize
+from utils.tokens import estimate_tokens
+from utils.logger import get_logger
+
+
+logger = get_logger(name="reranker", log_file="logs/reranker.log")
+
+class LexicalScorer:
+    """
+    Deterministic query/passage overlap score, no model needed.
+
+    Term frequencies of the query terms are saturated and length-normalized BM25-style,
+    weighted by term length as a cheap stand-in for rarity, and scored as one matrix product per batch.
+    A document's score does not depend on the other candidates, so batching does not change the order.
+    """
+    def __init__(self, k1: float = 1.2, b: float = 0.75, avg_length: float = 200.0):
+        self.k1 = k1
+        self.b = b
+        self.avg_length = avg_length
+
+    def score(self, query: str, docs: Sequence[Document]) -> np.ndarray:
+        terms: Dict[str, int] = {}
+        for term in tokenize(query):
+            terms.setdefault(term, len(terms))
+        if not terms or not docs:
+            return np.zeros(len(docs), dtype=np.float32)
+
+        counts = np.zeros((len(docs), len(terms)), dtype=np.float32)
+        lengths = np.empty(len(docs), dtype=np.float32)
+        for row, doc in enumerate(docs):
+            tokens = tokenize(doc.page_content)
+            lengths[row] = len(tokens)
+            columns = [terms[token] for token in tokens if token in terms]
+            if columns:
+                counts[row] = np.bincount(columns, minlength=len(terms))
+
+        weights = np.log1p([len(term) for term in terms]).astype(np.float32)
+        norm = self.k1 * (1 - self.b + self.b * lengths / self.avg_length)
+        saturated = counts * (self.k1 + 1) / (counts + norm[:, None])
+        coverage = (counts > 0).astype(np.float32)
+        return (saturated @ weights + coverage @ weights) / weights.sum()
+
+class CrossEncoderScorer:
+    """Scores (query, passage) pairs with a sentence-transformers cross-encoder on CPU."""
+    def __init__(self, model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2", batch_size: int = 32):
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as e:
+            raise ImportError("cross-encoder reranking requires `pip install sentence-transformers`") from e
+        self.model = CrossEncoder(model_name, device="cpu")
+        self.batch_size = batch_size
+
+    def score(self, query: str, docs: Sequence[Document]) -> np.ndarray:
+        pairs = [(query, doc.page_content) for doc in docs]
+        return np.asarray(self.model.predict(pairs, batch_size=self.batch_size), dtype=np.float32)
+
+class Reranker:
+    """
+    Re-scores a wide candidate set and keeps the best documents that fit the budgets.
+
+    :param batch_size: candidates scored per call to the scorer
+    :param token_budget: maximum estimated tokens of the kept documents (the best one is always kept)
+    :param latency_budget: seconds allowed for scoring; candidates not scored in time keep
+        their retrieval order behind the scored ones
+    """
+    def __init__(self, scorer=None, batch_size: int = 32, token_budget: Optional[int] = None,
+                 latency_budget: Optional[float] = None):
+        self.scorer = scorer or LexicalScorer()
+        self.batch_size = batch_size
+        self.token_budget = token_budget
+        self.latency_budget = latency_budget
+
+    def rerank(self, query: str, docs: Sequence[Document], top_n: int) -> List[Document]:
+        return [doc for doc, _ in self.rerank_with_scores(query, docs, top_n)]
+
+    def rerank_with_scores(self, query: str, docs: Sequence[Document], top_n: int) -> List[Tuple[Document, float]]:
+        docs = list(docs)
+        start = time.perf_counter()
+        scores = np.full(len(docs), -np.inf, dtype=np.float32)
+        scored = 0
+        while scored < len(docs):
+            if self.latency_budget is not None and scored and time.perf_counter() - start > self.latency_budget:
+                logger.warning(f"rerank budget of {self.latency_budget}s spent after {scored}/{len(docs)} candidates")
+                break
+            batch = docs[scored:scored + self.batch_size]
+            scores[scored:scored + len(batch)] = self.scorer.score(query, batch)
+            scored += len(batch)
+
+        # Stable sort: ties, and unscored candidates, keep their retrieval order
+        order = np.argsort(-scores, kind="stable")
+        kept, tokens = [], 0
+        for i in order[:top_n]:
+            cost = estimate_tokens(docs[i].page_content)
+            if kept and self.token_budget is not None and tokens + cost > self.token_budget:
+                break
+            kept.append((docs[i], float(scores[i])))
+            tokens += cost
+        logger.info(f"reranked {scored}/{len(docs)} candidates in {(time.perf_counter() - start) * 1000:.1f}ms, "
+                    f"kept {len(kept)} ({tokens} tokens)")
+        return kept
+
+def make_reranker(kind: str = "lexical", model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
+                  token_budget: Optional[int] = None, latency_budget: Optional[float] = None) -> Optional[Reranker]:
+    """Factory for the reranking stage; `kind` is none, lexical or cross-encoder."""
+    if kind == "none":
+        return None
+    if kind == "lexical":
+        scorer = LexicalScorer()
+    elif kind == "cross-encoder":
+        scorer = CrossEncoderScorer(model_name)
+    else:
+        raise ValueError(f"unknown reranker '{kind}', expected 'none', 'lexical' or 'cross-encoder'")
+    return Reranker(scorer, token_budget=token_budget, latency_budget=latency_budget)
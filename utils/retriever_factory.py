@@ -1,18 +1,36 @@
-from langchain.prompts import PromptTemplate
-from langchain.retrievers.multi_query import MultiQueryRetriever
+from typing import Optional
 from langchain_chroma import Chroma
+from langchain_core.retrievers import BaseRetriever
 
-# def make_retriever(vector_db: Chroma, llm, prompt: PromptTemplate) -> MultiQueryRetriever:
-#     """Factory to create a retriever with multi-query expansion."""
-#     return MultiQueryRetriever.from_llm(
-#         retriever=vector_db.as_retriever(),
-#         llm=llm,
-#         prompt=prompt
-#     )
+from bm25_index import BM25Index
+from utils.hybrid_retriever import HybridRetriever
+from utils.multi_query_retriever import FusionMultiQueryRetriever
 
-def make_retriever(vector_db: Chroma, llm) -> MultiQueryRetriever:
-    """Factory to create a retriever with multi-query expansion."""
-    return MultiQueryRetriever.from_llm(
-        retriever=vector_db.as_retriever(),
-        llm=llm
-    )
\ No newline at end of file
+
+def make_retriever(vector_db: Chroma, llm, latency_budget: Optional[float] = None, search_k: int = 10,
+                   mode: str = "multi_query", lexical_index: Optional[BM25Index] = None,
+                   alpha: float = 0.5, prefilter: Optional[int] = None) -> BaseRetriever:
+    """
+    Factory to create a retriever.
+
+    multi_query: LLM query expansion; variant searches run concurrently and are merged with reciprocal rank fusion.
+    hybrid: BM25 + vector search fused by normalized scores, no LLM call.
+    """
+    if mode == "hybrid":
+        if lexical_index is None:
+            raise ValueError("hybrid retrieval needs a lexical index; rebuild the collection to create one")
+        return HybridRetriever(
+            vectorstore=vector_db,
+            lexical_index=lexical_index,
+            search_k=search_k,
+            alpha=alpha,
+            prefilter=prefilter
+        )
+    if mode != "multi_query":
+        raise ValueError(f"unknown retrieval mode '{mode}', expected 'multi_query' or 'hybrid'")
+    return FusionMultiQueryRetriever.from_llm(
+        vectorstore=vector_db,
+        llm=llm,
+        search_k=search_k,
+        latency_budget=latency_budget
+    )
@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from utils.logger import get_logger
+
+
+logger = get_logger(name="semantic_cache", log_file="logs/semantic_cache.log")
+
+class SemanticAnswerCache:
+    """
+    Answers to earlier queries, found again by embedding similarity.
+
+    Entries are scoped to (route, collection, collection version), so a summary is never
+    served for a RAG question and a rebuild makes old answers unreachable.
+    Vectors live in one preallocated matrix; a lookup is a single matrix-vector product.
+    """
+    def __init__(self, embeddings: Embeddings, collection_name: str = "corpus_db",
+                 version_fn: Callable[[], str] = lambda: "0", threshold: float = 0.92,
+                 max_size: int = 512, ttl: Optional[float] = 3600):
+        self.embeddings = embeddings
+        self.collection_name = collection_name
+        self.version_fn = version_fn
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._vectors: Optional[np.ndarray] = None
+        self._entries: "OrderedDict[int, dict]" = OrderedDict()  # slot -> entry, least recently used first
+        self._free: List[int] = list(range(max_size - 1, -1, -1))
+        self._lock = threading.Lock()
+
+    async def embed(self, query: str) -> np.ndarray:
+        vector = np.asarray(await self.embeddings.aembed_query(query), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def lookup(self, vector: np.ndarray, route: str) -> Optional[dict]:
+        namespace = self._namespace(route)
+        with self._lock:
+            self._expire()
+            slots = [slot for slot, entry in self._entries.items() if entry["namespace"] == namespace]
+            if slots and self._vectors is not None and self._vectors.shape[1] == vector.shape[0]:
+                scores = self._vectors[slots] @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    slot = slots[best]
+                    self._entries.move_to_end(slot)
+                    self.hits += 1
+                    entry = self._entries[slot]
+                    logger.info(f"semantic cache hit ({scores[best]:.3f}) for previously answered '{entry['query']}'")
+                    return entry["answer"]
+            self.misses += 1
+            return None
+
+    def store(self, vector: np.ndarray, query: str, route: str, answer: dict):
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+                # First entry, or the embedding model changed: start over with the new dimension
+                self._vectors = np.zeros((self.max_size, vector.shape[0]), dtype=np.float32)
+                self._entries.clear()
+                self._free = list(range(self.max_size - 1, -1, -1))
+            if not self._free:
+                slot, _ = self._entries.popitem(last=False)
+                self._free.append(slot)
+            slot = self._free.pop()
+            self._vectors[slot] = vector
+            self._entries[slot] = {
+                "namespace": self._namespace(route),
+                "query": query,
+                "answer": answer,
+                "created": time.monotonic(),
+            }
+
+    def _namespace(self, route: str) -> tuple:
+        return (route, self.collection_name, self.version_fn())
+
+    def _expire(self):
+        if self.ttl is None:
+            return
+        now = time.monotonic()
+        expired = [slot for slot, entry in self._entries.items() if now - entry["created"] > self.ttl]
+        for slot in expired:
+            del self._entries[slot]
+            self._free.append(slot)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "threshold": self.threshold,
+        }
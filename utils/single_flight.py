@@ -0,0 +1,189 @@
+import asyncio
+import hashlib
+import json
+import threading
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_ollama import ChatOllama
+from pydantic import PrivateAttr
+
+
+class SingleFlight:
+    """
+    Runs one call per key at a time: callers that ask for a key already in flight wait for that call's
+    result instead of starting their own. Results are shared between callers, so they must not be mutated.
+    """
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._lock = threading.Lock()
+        self._futures: Dict[Hashable, Future] = {}
+        self._tasks: Dict[Hashable, asyncio.Future] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            future = self._futures.get(key)
+            leader = future is None
+            if leader:
+                future = self._futures[key] = Future()
+                self.calls += 1
+            else:
+                self.shared += 1
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._futures.pop(key, None)
+
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._tasks.get(key)
+        if task is None:
+            self.calls += 1
+            task = self._tasks[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda done: self._tasks.pop(key, None) if self._tasks.get(key) is done else None)
+        else:
+            self.shared += 1
+        # A cancelled caller must not cancel the call other callers are waiting on
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "shared": self.shared, "in_flight": len(self._futures) + len(self._tasks)}
+
+class _Broadcast:
+    def __init__(self):
+        self.events: List[tuple] = []
+        self.subscribers: List[asyncio.Queue] = []
+        self.task: Optional[asyncio.Task] = None
+
+    def publish(self, event: tuple):
+        self.events.append(event)
+        for queue in self.subscribers:
+            queue.put_nowait(event)
+
+class StreamFlight:
+    """
+    Single-flight for async streams: one upstream stream per key is consumed by a background task and every
+    chunk is fanned out to all subscribers. A subscriber that joins late first receives the chunks it missed.
+    The upstream stream is cancelled once every subscriber has gone.
+    """
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._flights: Dict[Hashable, _Broadcast] = {}
+
+    async def stream(self, key: Hashable, factory: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        flight = self._flights.get(key)
+        if flight is None:
+            self.calls += 1
+            flight = self._flights[key] = _Broadcast()
+            flight.task = asyncio.create_task(self._pump(key, flight, factory))
+        else:
+            self.shared += 1
+        queue: asyncio.Queue = asyncio.Queue()
+        for event in flight.events:
+            queue.put_nowait(event)
+        flight.subscribers.append(queue)
+        try:
+            while True:
+                kind, item = await queue.get()
+                if kind == "chunk":
+                    yield item
+                elif kind == "error":
+                    raise item
+                else:
+                    return
+        finally:
+            flight.subscribers.remove(queue)
+            if not flight.subscribers and not flight.task.done():
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    async def _pump(self, key: Hashable, flight: _Broadcast, factory: Callable[[], AsyncIterator[Any]]):
+        try:
+            async for chunk in factory():
+                flight.publish(("chunk", chunk))
+        except asyncio.CancelledError:
+            self._forget(key, flight)
+            raise
+        except Exception as e:
+            end = ("error", e)
+        else:
+            end = ("end", None)
+        self._forget(key, flight)
+        flight.publish(end)
+
+    def _forget(self, key: Hashable, flight: _Broadcast):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "shared": self.shared, "in_flight": len(self._flights)}
+
+class CoalescingChatOllama(ChatOllama):
+    """
+    ChatOllama whose concurrent identical async calls (same messages, stop words and call options) share one
+    request to the server. Streamed tokens are fanned out to every waiting caller.
+    """
+    _results: SingleFlight = PrivateAttr(default_factory=SingleFlight)
+    _streams: StreamFlight = PrivateAttr(default_factory=StreamFlight)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs: Any) -> ChatResult:
+        result = await self._results.ado(
+            self._flight_key(messages, stop, kwargs),
+            lambda: super(CoalescingChatOllama, self)._agenerate(messages, stop, None, **kwargs)
+        )
+        # Callers annotate the result with their own run ids, so each gets a copy
+        return result.model_copy(deep=True)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        upstream = self._streams.stream(
+            self._flight_key(messages, stop, kwargs),
+            lambda: super(CoalescingChatOllama, self)._astream(messages, stop, None, **kwargs)
+        )
+        async for chunk in upstream:
+            chunk = chunk.model_copy(deep=True)
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    @staticmethod
+    def _flight_key(messages: List[BaseMessage], stop: Optional[List[str]], kwargs: dict) -> str:
+        payload = json.dumps([[(m.type, m.content) for m in messages], stop, kwargs], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def stats(self) -> dict:
+        return {"generate": self._results.stats(), "stream": self._streams.stats()}
+
+class SingleFlightEmbeddings(Embeddings):
+    """Embeddings wrapper under which concurrent requests for the same texts share one call to the model."""
+    def __init__(self, embeddings: Embeddings):
+        self.embeddings = embeddings
+        self.flight = SingleFlight()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.flight.do(tuple(texts), lambda: self.embeddings.embed_documents(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.flight.ado(tuple(texts), lambda: self.embeddings.aembed_documents(texts))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    def stats(self) -> dict:
+        return self.flight.stats()
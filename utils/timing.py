@@ -0,0 +1,43 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Optional
+import numpy as np
+
+
+class StageTimings:
+    """Rolling latency samples per pipeline stage (retrieve, rerank, ...), for logs and /metrics."""
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(stage, deque(maxlen=self.window)).append(seconds)
+
+    @contextmanager
+    def time(self, stage: str, into: Optional[dict] = None):
+        """Time the block; the duration in ms is also written to `into[stage]` when given."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.record(stage, elapsed)
+            if into is not None:
+                into[stage] = round(elapsed * 1000, 2)
+
+    def stats(self) -> dict:
+        with self._lock:
+            samples = {stage: np.asarray(values) * 1000 for stage, values in self._samples.items()}
+        return {
+            stage: {
+                "count": len(values),
+                "mean_ms": float(values.mean()),
+                "p50_ms": float(np.percentile(values, 50)),
+                "p95_ms": float(np.percentile(values, 95)),
+            }
+            for stage, values in samples.items() if len(values)
+        }
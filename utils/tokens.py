@@ -0,0 +1,3 @@
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token for English text), good enough for budgeting prompts."""
+    return max(1, (len(text) + 3) // 4)
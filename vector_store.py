@@ -1,60 +1,464 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
 from pathlib import Path
 from langchain_chroma import Chroma
-from langchain_ollama import OllamaEmbeddings
 from langchain.schema import Document
+from langchain_core.vectorstores import VectorStore
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import json
 import shutil
+import time
 import chromadb
 
+from bm25_index import BM25Index
 from corpus_loader import CorpusLoader
+from local_vector_store import LocalVectorStore
+from sharded_vector_store import ShardedVectorStore
+from utils.embedding_cache import CachedEmbeddings, EmbeddingCache
+from utils.llm_factory import make_embeddings
+from utils.manifest import IndexManifest
 from utils.logger import get_logger
 
 logger = get_logger(name="vectorstore_builder", log_file="logs/vectorstore_builder.log")
 
 class VectorStoreBuilder:
-    def __init__(self, persist_dir: Path, model_name: str = "nomic-embed-text"):
+    def __init__(self, persist_dir: Path, model_name: str = "nomic-embed-text", batch_size: int = 64, max_concurrency: int = 4,
+                 cache_path: Optional[Path] = Path(".cache/embeddings.sqlite"), cache_size: int = 200_000,
+                 backend: str = "chroma", local_options: Optional[dict] = None, lexical_index: bool = True,
+                 shards: int = 1, shard_by: str = "hash", client_options: Optional[dict] = None):
+        if backend not in ("chroma", "local"):
+            raise ValueError(f"unknown vector backend '{backend}', expected 'chroma' or 'local'")
+        if shard_by not in ShardedVectorStore.SHARD_BY:
+            raise ValueError(f"unknown shard key '{shard_by}', expected one of {ShardedVectorStore.SHARD_BY}")
         self.persist_dir = persist_dir
         self.model_name = model_name
-        self.embeddings = OllamaEmbeddings(model=self.model_name)
+        self.backend = backend
+        self.local_options = local_options or {}
+        self.lexical_index = lexical_index
+        # Layout used when a collection is created; existing collections keep the layout they were built with
+        self.shards = max(1, shards)
+        self.shard_by = shard_by
+        self.batch_size = batch_size
+        self.max_concurrency = max(1, max_concurrency)
+        # Shared per model and client options (see utils.llm_factory)
+        self.embeddings = make_embeddings(self.model_name, **(client_options or {}))
+        # Kept outside persist_dir so an overwrite build does not wipe it
+        self.embedding_cache = EmbeddingCache(cache_path, max_entries=cache_size) if cache_path else None
+        if self.embedding_cache is not None:
+            self.embeddings = CachedEmbeddings(self.embeddings, self.embedding_cache, self.model_name)
     
-    def build_vectorstore(self, documents: list[Document], collection_name: str = "corpus_vector_db", overwrite: bool = False) -> Chroma:
+    def build_vectorstore(self, documents: list[Document], collection_name: str = "corpus_vector_db", overwrite: bool = False,
+                          file_hashes: Optional[Dict[str, str]] = None) -> VectorStore:
         self.persist_dir.mkdir(parents=True, exist_ok=True)
         if overwrite:
             logger.info(f"overwriting existing vector store")
             shutil.rmtree(self.persist_dir, ignore_errors=True)
         
-        vector_db = Chroma.from_documents(
-            collection_name=collection_name,
-            documents=documents,
-            embedding=self.embeddings,
-            persist_directory=str(self.persist_dir)
-        )
+        ids = IndexManifest.chunk_ids(documents)
+        self._init_layout(collection_name, overwrite)
+        vector_db = self._open_store(collection_name)
+        self.write_batches(vector_db, documents, ids)
+        self._persist(vector_db)
+        if self.lexical_index:
+            lexical = BM25Index(self._lexical_path(collection_name)) if overwrite else self.load_lexical_index(collection_name)
+            lexical.add(ids, [doc.page_content for doc in documents])
+            lexical.save()
+
+        if file_hashes is not None:
+            manifest = IndexManifest(self._manifest_path(collection_name)) if overwrite else self.load_manifest(collection_name)
+            by_source = self._group_ids_by_source(documents, ids)
+            for source, chunk_ids in by_source.items():
+                manifest.files[source] = {"hash": file_hashes.get(source), "chunks": chunk_ids}
+            manifest.save()
 
+        self.bump_version(collection_name)
         logger.info(f"vector store built with {len(documents)} documents")
+        self._log_cache_stats()
         return vector_db
+
+    def sync_vectorstore(self, documents: list[Document], file_hashes: Dict[str, str],
+                         collection_name: str = "corpus_vector_db") -> Tuple[VectorStore, Dict[str, int]]:
+        """
+        Incrementally bring a collection in line with the current set of files.
+
+        :param documents: chunks of the new or changed files only
+        :param file_hashes: content hash of every file currently in the corpus
+        :return: (vector store, summary counts)
+        """
+        self._init_layout(collection_name, False)
+        manifest = self.load_manifest(collection_name)
+        vector_db = self.load_vectorstore(collection_name)
+        summary = dict.fromkeys([
+            "files_added", "files_updated", "files_removed", "files_unchanged",
+            "chunks_added", "chunks_removed", "chunks_unchanged"
+        ], 0)
+
+        delete_ids = self._drop_removed_sources(manifest, file_hashes, summary)
+        ids = IndexManifest.chunk_ids(documents)
+        by_source = self._group_ids_by_source(documents, ids)
+        stale = set(manifest.stale_sources(file_hashes))
+        summary["files_unchanged"] = len(file_hashes) - len(stale)
+        for source in stale - by_source.keys():
+            # Failed to parse this run: keep the old chunks and retry next time
+            logger.warning(f"no chunks for changed file {source}, keeping previous version")
+
+        removed, new_ids = self._diff_sources(manifest.files, by_source, file_hashes, summary)
+        delete_ids.extend(removed)
+
+        add_docs = [doc for doc, cid in zip(documents, ids) if cid in new_ids]
+        add_ids = [cid for cid in ids if cid in new_ids]
+        if delete_ids:
+            vector_db.delete(ids=delete_ids)
+        if add_docs:
+            self.write_batches(vector_db, add_docs, add_ids)
+        if delete_ids or add_docs:
+            self._persist(vector_db)
+            if self.lexical_index:
+                lexical = self.load_lexical_index(collection_name)
+                lexical.delete(delete_ids)
+                lexical.add(add_ids, [doc.page_content for doc in add_docs])
+                lexical.save()
+            self.bump_version(collection_name)
+        manifest.save()
+
+        summary["chunks_added"] = len(add_ids)
+        summary["chunks_removed"] = len(delete_ids)
+        logger.info(f"vector store synced for '{collection_name}': {summary}")
+        self._log_cache_stats()
+        return vector_db, summary
+
+    def open_stream(self, collection_name: str, overwrite: bool = False,
+                    file_hashes: Optional[Dict[str, str]] = None) -> Tuple[VectorStore, IndexManifest, Optional[BM25Index], Dict[str, int]]:
+        """
+        Open a collection for a streaming build: (vector store, manifest, lexical index, summary counts).
+        Without `overwrite`, chunks of files missing from `file_hashes` are dropped first.
+        """
+        if overwrite:
+            logger.info(f"overwriting existing vector store")
+            shutil.rmtree(self.persist_dir, ignore_errors=True)
+        self.persist_dir.mkdir(parents=True, exist_ok=True)
+        self._init_layout(collection_name, overwrite)
+        vector_db = self._open_store(collection_name)
+        manifest = self.load_manifest(collection_name)
+        lexical = self.load_lexical_index(collection_name) if self.lexical_index else None
+        summary = dict.fromkeys([
+            "files_added", "files_updated", "files_removed",
+            "chunks_added", "chunks_removed", "chunks_unchanged", "checkpoints"
+        ], 0)
+        if file_hashes is not None and not overwrite:
+            delete_ids = self._drop_removed_sources(manifest, file_hashes, summary)
+            if delete_ids:
+                vector_db.delete(ids=delete_ids)
+                if lexical is not None:
+                    lexical.delete(delete_ids)
+                summary["chunks_removed"] += len(delete_ids)
+        return vector_db, manifest, lexical, summary
+
+    def write_files(self, vector_db: VectorStore, files: List[Tuple[str, List[Document]]], file_hashes: Dict[str, str],
+                    manifest: IndexManifest, lexical: Optional[BM25Index], summary: Dict[str, int]):
+        """
+        Write the chunks of whole files, replacing the chunks the manifest recorded for them.
+        The manifest is only updated in memory, and only after the writes succeed; `checkpoint` saves it.
+        """
+        documents = [doc for _, docs in files for doc in docs]
+        ids = IndexManifest.chunk_ids(documents)
+        by_source = self._group_ids_by_source(documents, ids)
+        pending = {source: manifest.files[source] for source in by_source if source in manifest.files}
+        delete_ids, new_ids = self._diff_sources(pending, by_source, file_hashes, summary)
+
+        add = [(doc, cid) for doc, cid in zip(documents, ids) if cid in new_ids]
+        if delete_ids:
+            vector_db.delete(ids=delete_ids)
+        if add:
+            self.write_batches(vector_db, (doc for doc, _ in add), (cid for _, cid in add))
+        if lexical is not None:
+            lexical.delete(delete_ids)
+            lexical.add([cid for _, cid in add], [doc.page_content for doc, _ in add])
+        manifest.files.update(pending)
+        summary["chunks_added"] += len(add)
+        summary["chunks_removed"] += len(delete_ids)
+
+    def checkpoint(self, collection_name: str, vector_db: VectorStore, manifest: IndexManifest, lexical: Optional[BM25Index]):
+        """Make everything written so far durable and searchable; the manifest goes last so it never lists unsaved chunks."""
+        self._persist(vector_db)
+        if lexical is not None:
+            lexical.save()
+        manifest.save()
+        self.bump_version(collection_name)
+        logger.info(f"checkpoint: {len(manifest.files)} files in '{collection_name}'")
+
+    @staticmethod
+    def _drop_removed_sources(manifest: IndexManifest, file_hashes: Dict[str, str], summary: Dict[str, int]) -> list[str]:
+        delete_ids = []
+        for source in manifest.removed_sources(file_hashes):
+            delete_ids.extend(manifest.files.pop(source)["chunks"])
+            summary["files_removed"] += 1
+        return delete_ids
+
+    @staticmethod
+    def _diff_sources(files: Dict[str, dict], by_source: Dict[str, list[str]], file_hashes: Dict[str, str],
+                      summary: Dict[str, int]) -> Tuple[list[str], set]:
+        """Record the new chunk ids of each source in manifest `files`; returns (ids to delete, ids to add)."""
+        delete_ids, new_ids = [], set()
+        for source, chunk_ids in by_source.items():
+            old_ids = set(files.get(source, {}).get("chunks", []))
+            summary["files_updated" if source in files else "files_added"] += 1
+            summary["chunks_unchanged"] += len(old_ids.intersection(chunk_ids))
+            new_ids.update(cid for cid in chunk_ids if cid not in old_ids)
+            delete_ids.extend(old_ids.difference(chunk_ids))
+            files[source] = {"hash": file_hashes.get(source), "chunks": chunk_ids}
+        return delete_ids, new_ids
+
+    def write_batches(self, vector_db: VectorStore, documents: Iterable[Document], ids: Iterable[str]) -> int:
+        """
+        Embed and insert documents batch by batch.
+        At most `max_concurrency` batches are in flight, each written to the collection as soon as it is embedded,
+        so only those batches are held in memory when `documents` is a lazy iterable.
+        """
+        written = 0
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            pending = set()
+            for target, batch in self._batches(vector_db, zip(documents, ids)):
+                if len(pending) >= self.max_concurrency:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    written += sum(future.result() for future in done)
+                pending.add(pool.submit(self._write_batch, target, batch))
+            written += sum(future.result() for future in wait(pending).done)
+        return written
+
+    def _batches(self, vector_db: VectorStore, pairs: Iterator[Tuple[Document, str]]) -> Iterator[Tuple[VectorStore, list]]:
+        """(store, batch) pairs; a sharded store gets full batches per shard instead of every batch split across shards."""
+        if not isinstance(vector_db, ShardedVectorStore):
+            while batch := list(islice(pairs, self.batch_size)):
+                yield vector_db, batch
+            return
+        buffers: List[list] = [[] for _ in vector_db.shards]
+        for doc, cid in pairs:
+            index = vector_db.shard_index(cid, doc.metadata)
+            buffers[index].append((doc, cid))
+            if len(buffers[index]) >= self.batch_size:
+                yield vector_db.shards[index], buffers[index]
+                buffers[index] = []
+        for index, batch in enumerate(buffers):
+            if batch:
+                yield vector_db.shards[index], batch
+
+    def rebuild_shard(self, documents: list[Document], shard: int, collection_name: str = "corpus_vector_db",
+                      file_hashes: Optional[Dict[str, str]] = None) -> VectorStore:
+        """
+        Drop one shard and re-embed the chunks that route to it, leaving the other shards untouched.
+
+        :param documents: chunks of the corpus; those belonging to other shards are ignored
+        :param file_hashes: content hashes of the parsed files, recorded in the manifest for files held by this shard only
+        """
+        vector_db = self.load_vectorstore(collection_name)
+        if not isinstance(vector_db, ShardedVectorStore):
+            raise ValueError(f"collection '{collection_name}' is not sharded")
+        if not 0 <= shard < len(vector_db.shards):
+            raise ValueError(f"shard {shard} out of range, '{collection_name}' has {len(vector_db.shards)} shards")
+        old_ids = vector_db.shards[shard].get(include=[])["ids"]
+        self._drop_collection(vector_db.shards[shard], self._shard_names(collection_name, len(vector_db.shards))[shard])
+        vector_db.shards[shard] = self._open_collection(self._shard_names(collection_name, len(vector_db.shards))[shard])
+
+        ids = IndexManifest.chunk_ids(documents)
+        keep = [i for i, (doc, cid) in enumerate(zip(documents, ids)) if vector_db.shard_index(cid, doc.metadata) == shard]
+        self.write_batches(vector_db.shards[shard], [documents[i] for i in keep], [ids[i] for i in keep])
+        self._persist(vector_db.shards[shard])
+        if self.lexical_index:
+            lexical = self.load_lexical_index(collection_name)
+            lexical.delete(old_ids)
+            lexical.add([ids[i] for i in keep], [documents[i].page_content for i in keep])
+            lexical.save()
+        # Files with chunks on other shards are only partly rebuilt here
+        kept = set(keep)
+        split = {doc.metadata.get("source", "") for i, doc in enumerate(documents) if i not in kept}
+        self._update_shard_manifest(collection_name, set(old_ids), [documents[i] for i in keep], [ids[i] for i in keep],
+                                    {source: file_hash for source, file_hash in (file_hashes or {}).items() if source not in split})
+        self.bump_version(collection_name)
+        logger.info(f"rebuilt shard {shard} of '{collection_name}': {len(old_ids)} chunks dropped, {len(keep)} written")
+        return vector_db
+
+    def _update_shard_manifest(self, collection_name: str, old_ids: set, documents: list[Document], ids: list[str],
+                               file_hashes: Dict[str, str]):
+        """Replace the chunk ids the manifest lists for a shard (`old_ids`) with the rebuilt ones (`ids`)."""
+        if not self._manifest_path(collection_name).exists():
+            return  # built without file hashes, nothing to keep in sync
+        manifest = self.load_manifest(collection_name)
+        by_source = self._group_ids_by_source(documents, ids)
+        for source in set(by_source) | {source for source, entry in manifest.files.items() if old_ids.intersection(entry["chunks"])}:
+            entry = manifest.files.get(source, {"hash": None, "chunks": []})
+            chunks = [cid for cid in entry["chunks"] if cid not in old_ids] + by_source.get(source, [])
+            if not chunks:
+                manifest.files.pop(source, None)
+                continue
+            # Other shards may still hold an older version of a split file, so its hash is only
+            # recorded when this shard holds every chunk; otherwise the next incremental build reconciles it
+            on_this_shard = all(cid in old_ids for cid in entry["chunks"])
+            file_hash = file_hashes.get(source) if on_this_shard else None
+            manifest.files[source] = {"hash": file_hash or entry["hash"], "chunks": chunks}
+        manifest.save()
+
+    def update_metadata(self, vector_db: VectorStore, ids: list[str], metadatas: list[dict]):
+        """Merge metadata keys into existing chunks without re-embedding them."""
+        if isinstance(vector_db, ShardedVectorStore):
+            for index, positions in vector_db.locate(ids).items():
+                self.update_metadata(vector_db.shards[index], [ids[i] for i in positions], [metadatas[i] for i in positions])
+        elif isinstance(vector_db, LocalVectorStore):
+            vector_db.update_metadata(ids, metadatas)
+        else:
+            vector_db._collection.update(ids=ids, metadatas=metadatas)
+
+    def _write_batch(self, vector_db: VectorStore, batch: list) -> int:
+        docs, ids = zip(*batch)
+        vector_db.add_documents(list(docs), ids=list(ids))
+        logger.debug(f"wrote batch of {len(docs)} documents")
+        return len(docs)
+
+    def _log_cache_stats(self):
+        if self.embedding_cache is not None:
+            logger.info(f"embedding cache: {self.embedding_cache.stats()}")
+
+    def stale_sources(self, file_hashes: Dict[str, str], collection_name: str = "corpus_vector_db") -> list[str]:
+        return self.load_manifest(collection_name).stale_sources(file_hashes)
+
+    def collection_version(self, collection_name: str) -> str:
+        """Opaque stamp that changes every time the collection is rebuilt or updated."""
+        try:
+            return self._version_path(collection_name).read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return "0"
+
+    def bump_version(self, collection_name: str):
+        self.persist_dir.mkdir(parents=True, exist_ok=True)
+        self._version_path(collection_name).write_text(str(time.time_ns()), encoding="utf-8")
+
+    def _version_path(self, collection_name: str) -> Path:
+        return self.persist_dir / f"{collection_name}.version"
+
+    def load_manifest(self, collection_name: str) -> IndexManifest:
+        return IndexManifest.load(self._manifest_path(collection_name))
+
+    def _manifest_path(self, collection_name: str) -> Path:
+        return self.persist_dir / f"{collection_name}.manifest.json"
+
+    @staticmethod
+    def _group_ids_by_source(documents: list[Document], ids: list[str]) -> Dict[str, list[str]]:
+        by_source: Dict[str, list[str]] = {}
+        for doc, cid in zip(documents, ids):
+            by_source.setdefault(doc.metadata.get("source", ""), []).append(cid)
+        return by_source
     
-    def load_vectorstore(self, collection_name: str = "langchain") -> Chroma:
-        vector_db = Chroma(
+    def load_vectorstore(self, collection_name: str = "langchain") -> VectorStore:
+        vector_db = self._open_store(collection_name)
+        count = vector_db._collection.count() if isinstance(vector_db, Chroma) else len(vector_db)
+        logger.info(f"loaded {self.backend} vector store with {count} data from {self.persist_dir}")
+        return vector_db
+
+    def load_lexical_index(self, collection_name: str) -> BM25Index:
+        """BM25 index kept alongside the collection, empty if it has never been built."""
+        return BM25Index.load(self._lexical_path(collection_name))
+
+    def list_collections(self):
+        if self.backend == "local":
+            names = sorted(path.name.removesuffix(".local") for path in self.persist_dir.glob("*.local"))
+        else:
+            client = chromadb.PersistentClient(path=str(self.persist_dir))
+            names = [collection.name for collection in client.list_collections()]
+        logger.info(f"available collections: {names}")
+
+    def load_layout(self, collection_name: str) -> Optional[dict]:
+        """{"shards", "shard_by"} of a sharded collection, None for a single collection."""
+        try:
+            return json.loads(self._layout_path(collection_name).read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+
+    def _init_layout(self, collection_name: str, overwrite: bool):
+        """
+        Record the shard layout of a collection being created. An existing collection keeps its layout,
+        so asking for a different number of shards is an error rather than silently ignored.
+        """
+        layout = self.load_layout(collection_name)
+        if overwrite or (layout is None and not self._collection_exists(collection_name)):
+            if self.shards > 1:
+                self._save_layout(collection_name, {"shards": self.shards, "shard_by": self.shard_by})
+            return
+        if self.shards > 1 and layout != {"shards": self.shards, "shard_by": self.shard_by}:
+            current = f"{layout['shards']} shards by {layout['shard_by']}" if layout else "a single collection"
+            raise ValueError(
+                f"collection '{collection_name}' already exists as {current}; "
+                f"re-sharding it needs a full rebuild with overwrite"
+            )
+
+    def _collection_exists(self, collection_name: str) -> bool:
+        if self._manifest_path(collection_name).exists():
+            return True
+        if self.backend == "local":
+            return self._local_path(collection_name).exists()
+        client = chromadb.PersistentClient(path=str(self.persist_dir))
+        return collection_name in [collection.name for collection in client.list_collections()]
+
+    def _save_layout(self, collection_name: str, layout: dict):
+        self.persist_dir.mkdir(parents=True, exist_ok=True)
+        self._layout_path(collection_name).write_text(json.dumps(layout), encoding="utf-8")
+
+    def _layout_path(self, collection_name: str) -> Path:
+        return self.persist_dir / f"{collection_name}.shards.json"
+
+    @staticmethod
+    def _shard_names(collection_name: str, shards: int) -> List[str]:
+        return [f"{collection_name}-shard{i}" for i in range(shards)]
+
+    def _open_store(self, collection_name: str) -> VectorStore:
+        layout = self.load_layout(collection_name)
+        if layout is None:
+            return self._open_collection(collection_name)
+        shards = [self._open_collection(name) for name in self._shard_names(collection_name, layout["shards"])]
+        return ShardedVectorStore(shards, shard_by=layout["shard_by"])
+
+    def _drop_collection(self, vector_db: VectorStore, name: str):
+        if isinstance(vector_db, LocalVectorStore):
+            shutil.rmtree(self._local_path(name), ignore_errors=True)
+        else:
+            vector_db.delete_collection()
+
+    def _open_collection(self, collection_name: str) -> VectorStore:
+        if self.backend == "local":
+            return LocalVectorStore.load(self._local_path(collection_name), self.embeddings, **self.local_options)
+        return Chroma(
             collection_name=collection_name,
             embedding_function=self.embeddings,
             persist_directory=str(self.persist_dir)
         )
-        logger.info(f"loaded vector store with {vector_db._collection.count()} data from {self.persist_dir}")
-        return vector_db
 
-    def list_collections(self):
-        client = chromadb.PersistentClient(path=str(self.persist_dir))
-        collections = client.list_collections()
-        logger.info(f"available collections: {[collection.name for collection in collections]}")
+    def _persist(self, vector_db: VectorStore):
+        # Chroma persists on every write; local stores are written out once per build or sync
+        if isinstance(vector_db, ShardedVectorStore):
+            for shard in vector_db.shards:
+                self._persist(shard)
+        elif isinstance(vector_db, LocalVectorStore):
+            vector_db.save()
+
+    def _local_path(self, collection_name: str) -> Path:
+        return self.persist_dir / f"{collection_name}.local"
+
+    def _lexical_path(self, collection_name: str) -> Path:
+        return self.persist_dir / f"{collection_name}.bm25"
 
 def main():
     corpus_dir = Path("papers_text")
     corpus_loader = CorpusLoader(corpus_dir=corpus_dir)
-    documents = corpus_loader.load_documents()
 
+    # Papers are streamed from the corpus shards, a few at a time
     vectorstore_builder = VectorStoreBuilder(persist_dir=Path("noidea"))
-    vector_db = vectorstore_builder.build_vectorstore(documents=documents, collection_name="corpus_db", overwrite=True)
+    vector_db, manifest, lexical, summary = vectorstore_builder.open_stream("corpus_db", overwrite=True)
+    file_hashes = corpus_loader.file_hashes()
+    papers = corpus_loader.iter_papers()
+    while group := list(islice(papers, 16)):
+        vectorstore_builder.write_files(vector_db, group, file_hashes, manifest, lexical, summary)
+    vectorstore_builder.checkpoint("corpus_db", vector_db, manifest, lexical)
 
-    print(vector_db)
+    print(vector_db, summary)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file